@@ -1,20 +1,96 @@
-from pyorthanc.orthanc import Orthanc
-from pyorthanc.remote import RemoteModality
-from pyorthanc.patient import Patient
-from pyorthanc.study import Study
-from pyorthanc.series import Series
-from pyorthanc.instance import Instance
-from pyorthanc.util import build_patient_forest, trim_patient_forest, \
-    retrieve_and_write_patients_forest_to_given_path
-
-__all__ = [
-    'Orthanc',
-    'RemoteModality',
-    'Patient',
-    'Study',
-    'Series',
-    'Instance',
-    'build_patient_forest',
-    'trim_patient_forest',
-    'retrieve_and_write_patients_forest_to_given_path'
-]
+import importlib
+import sys
+from typing import TYPE_CHECKING, Any, List
+
+# Public name -> module defining it. Modules are imported on first attribute
+# access, so `import pyorthanc` does not pay for `requests` or `orthanc.py`.
+_LAZY_ATTRIBUTES = {
+    'Orthanc': 'pyorthanc.orthanc',
+    'OrthancCluster': 'pyorthanc.cluster',
+    'FederatedOrthanc': 'pyorthanc.federation',
+    'RemoteModality': 'pyorthanc.remote',
+    'query_remote_modalities': 'pyorthanc.remote',
+    'retrieve_answers': 'pyorthanc.retrieve',
+    'QueryCache': 'pyorthanc.query_cache',
+    'Replicator': 'pyorthanc.replication',
+    'diff_orthanc_servers': 'pyorthanc.diff',
+    'diff_orthanc_and_directory': 'pyorthanc.diff',
+    'iterate_archive_files': 'pyorthanc.archive',
+    'extract_archive': 'pyorthanc.archive',
+    'download_cohort_archives': 'pyorthanc.archive',
+    'InstancePrefetcher': 'pyorthanc.prefetch',
+    'decode_instances': 'pyorthanc.decode',
+    'verify_attachments': 'pyorthanc.integrity',
+    'CompressionScheduler': 'pyorthanc.compression',
+    'StorageAnalytics': 'pyorthanc.analytics',
+    'RetentionEngine': 'pyorthanc.retention',
+    'RetentionRule': 'pyorthanc.retention',
+    'get_datetimes': 'pyorthanc.dates',
+    'sort_by_datetime': 'pyorthanc.dates',
+    'Patient': 'pyorthanc.patient',
+    'Study': 'pyorthanc.study',
+    'Series': 'pyorthanc.series',
+    'Instance': 'pyorthanc.instance',
+    'Query': 'pyorthanc.query',
+    'Job': 'pyorthanc.job',
+    'JobWatcher': 'pyorthanc.job',
+    'submit_job': 'pyorthanc.job',
+    'anonymize_resources': 'pyorthanc.bulk',
+    'modify_resources': 'pyorthanc.bulk',
+    'PatientForest': 'pyorthanc.forest',
+    'build_patient_forest': 'pyorthanc.util',
+    'trim_patient_forest': 'pyorthanc.util',
+    'retrieve_and_write_patients_forest_to_given_path': 'pyorthanc.util'
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
+
+
+if sys.version_info < (3, 7):  # Module __getattr__ (PEP 562) needs Python 3.7
+    for _name in __all__:
+        __getattr__(_name)
+
+if TYPE_CHECKING:  # For the type checkers, kept in sync with _LAZY_ATTRIBUTES by tests/test_import_time.py
+    from pyorthanc.orthanc import Orthanc  # noqa: F401
+    from pyorthanc.cluster import OrthancCluster  # noqa: F401
+    from pyorthanc.federation import FederatedOrthanc  # noqa: F401
+    from pyorthanc.remote import RemoteModality, query_remote_modalities  # noqa: F401
+    from pyorthanc.retrieve import retrieve_answers  # noqa: F401
+    from pyorthanc.query_cache import QueryCache  # noqa: F401
+    from pyorthanc.replication import Replicator  # noqa: F401
+    from pyorthanc.diff import diff_orthanc_servers, diff_orthanc_and_directory  # noqa: F401
+    from pyorthanc.archive import iterate_archive_files, extract_archive, download_cohort_archives  # noqa: F401
+    from pyorthanc.prefetch import InstancePrefetcher  # noqa: F401
+    from pyorthanc.decode import decode_instances  # noqa: F401
+    from pyorthanc.integrity import verify_attachments  # noqa: F401
+    from pyorthanc.compression import CompressionScheduler  # noqa: F401
+    from pyorthanc.analytics import StorageAnalytics  # noqa: F401
+    from pyorthanc.retention import RetentionEngine, RetentionRule  # noqa: F401
+    from pyorthanc.dates import get_datetimes, sort_by_datetime  # noqa: F401
+    from pyorthanc.patient import Patient  # noqa: F401
+    from pyorthanc.study import Study  # noqa: F401
+    from pyorthanc.series import Series  # noqa: F401
+    from pyorthanc.instance import Instance  # noqa: F401
+    from pyorthanc.query import Query  # noqa: F401
+    from pyorthanc.job import Job, JobWatcher, submit_job  # noqa: F401
+    from pyorthanc.bulk import anonymize_resources, modify_resources  # noqa: F401
+    from pyorthanc.forest import PatientForest  # noqa: F401
+    from pyorthanc.util import (  # noqa: F401
+        build_patient_forest, trim_patient_forest, retrieve_and_write_patients_forest_to_given_path
+    )
@@ -0,0 +1,107 @@
+# coding: utf-8
+# author: gabriel couture
+import datetime
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Optional, Union
+
+from pyorthanc.dates import parse_dicom_datetime
+from pyorthanc.instance import Instance
+from pyorthanc.patient import Patient
+from pyorthanc.series import Series
+from pyorthanc.study import Study
+
+if TYPE_CHECKING:
+    from pyorthanc.bulk import BulkResult
+    from pyorthanc.orthanc import Orthanc
+
+Resource = Union[Patient, Study, Series, Instance]
+
+LAST_UPDATE_FORMAT = '%Y%m%dT%H%M%S'
+
+
+class RateLimiter:
+    """Space the requests of all the threads by at least cost / rate seconds"""
+
+    def __init__(self, rate: Optional[float]) -> None:
+        self.interval = 1 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def wait(self, cost: float = 1.0) -> None:
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            scheduled_time = max(now, self._next_time)
+            self._next_time = scheduled_time + cost * self.interval
+
+        if scheduled_time > now:
+            time.sleep(scheduled_time - now)
+
+
+def report_progress(progress_callback: Optional[Callable[[int, int], Any]], bulk_result: 'BulkResult', total: int) -> None:
+    """Call the progress callback (if any) with the number of processed items and the total"""
+    if progress_callback is not None:
+        progress_callback(len(bulk_result.results) + len(bulk_result.errors), total)
+
+
+def parse_date(dicom_date: Optional[str], last_update: str) -> datetime.datetime:
+    """Parse a DICOM date (DA), or the Orthanc LastUpdate of the resource if the date is missing or invalid"""
+    date = parse_dicom_datetime(dicom_date)
+
+    return date if date is not None else datetime.datetime.strptime(last_update, LAST_UPDATE_FORMAT)
+
+
+def get_md5(orthanc: 'Orthanc', instance_identifier: str) -> str:
+    """Get the MD5 of the DICOM attachment of an instance"""
+    md5 = orthanc.get_attachment_md5('instances', instance_identifier, 'dicom')
+
+    return md5.decode() if isinstance(md5, bytes) else md5
+
+
+def get_resources_at_level(resources: Iterable[Resource], level: Optional[str]) -> List[Resource]:
+    """Replace the resources by their descendants of a level ('Patient', 'Study', 'Series' or 'Instance', None to keep them)"""
+    resources = list(resources)
+    if level is None:
+        return resources
+
+    levels = [Patient, Study, Series, Instance]
+    wanted_type = {'Patient': Patient, 'Study': Study, 'Series': Series, 'Instance': Instance}[level]
+
+    resources_at_level: List[Resource] = []
+    for resource in resources:
+        if levels.index(type(resource)) > levels.index(wanted_type):
+            raise ValueError(f'Can not get the {level} descendants of a {type(resource).__name__}')
+        resources_at_level += get_descendants(resource, wanted_type)
+
+    return resources_at_level
+
+
+def get_descendants(resource: Resource, wanted_type: type) -> List[Resource]:
+    """Get the descendants of a type of a resource, building the children that are not built yet"""
+    if isinstance(resource, wanted_type):
+        return [resource]
+
+    children: List[Resource]
+    if isinstance(resource, Patient):
+        if resource.get_studies() == []:
+            resource.build_studies()
+        children = list(resource.get_studies())
+    elif isinstance(resource, Study):
+        if resource.get_series() == []:
+            resource.build_series()
+        children = list(resource.get_series())
+    elif isinstance(resource, Series):
+        if resource.get_instances() == []:
+            resource.build_instances()
+        children = list(resource.get_instances())
+    else:
+        children = []
+
+    descendants: List[Resource] = []
+    for child in children:
+        descendants += get_descendants(child, wanted_type)
+
+    return descendants
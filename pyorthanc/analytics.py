@@ -0,0 +1,197 @@
+# coding: utf-8
+# author: gabriel couture
+import json
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+SIZE_KEYS = ('DiskSize', 'UncompressedSize', 'CountInstances')
+GroupKey = Union[str, Callable[[Dict], Any]]
+
+
+class StorageAnalytics:
+    """Disk usage of an Orthanc server, grouped by any DICOM tag
+
+    The analytics keep a local mirror of the statistics of each series,
+    with the main DICOM tags of the series, of its study and of its patient.
+    `update` lists the series and the studies page by page, and only gets
+    the statistics of the series that are new or changed since the previous
+    update (concurrently), so a capacity report on a large archive only
+    costs a few requests once the mirror is built. With `cache_path`, the
+    mirror is saved to a JSON file and reused by the next sessions.
+
+    Examples
+    --------
+    >>> analytics = StorageAnalytics(Orthanc('http://localhost:8042'), cache_path='./storage.json')
+    >>> analytics.update()
+    >>> analytics.group_by('Modality')
+    {'CT': {'DiskSize': 5368709120, 'UncompressedSize': 10737418240, 'CountInstances': 204800, 'CountSeries': 800}, ...}
+    >>> analytics.group_by('StudyYear', 'ReferringPhysicianName')
+    {('2019', 'Dr House'): {...}, ...}
+    """
+
+    def __init__(self, orthanc: 'Orthanc', max_nbr_workers: int = 10, cache_path: Optional[str] = None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        orthanc
+            Orthanc object.
+        max_nbr_workers
+            Maximum number of concurrent statistics requests.
+        cache_path
+            Path of the JSON file where the mirror is saved. Not saved if None.
+        """
+        self.orthanc = orthanc
+        self.max_nbr_workers = max_nbr_workers
+        self.cache_path = cache_path
+
+        self._lock = threading.Lock()
+        self._series: Dict[str, Dict] = {}
+        self._studies: Dict[str, Dict] = {}
+
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, 'r') as file_handler:
+                cache = json.load(file_handler)
+            self._series, self._studies = cache['Series'], cache['Studies']
+
+    def update(self, force: bool = False) -> int:
+        """Update the mirror with the current content of the server
+
+        Parameters
+        ----------
+        force
+            If True, get the statistics of all the series again (e.g. after a
+            compression, which changes the disk size but not the series).
+
+        Returns
+        -------
+        int
+            Number of series whose statistics were fetched.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        expanded_series: Iterable[Dict] = self.orthanc.iterate_series(expand=True)  # type: ignore
+        expanded_studies: Iterable[Dict] = self.orthanc.iterate_studies(expand=True)  # type: ignore
+
+        series = {s['ID']: s for s in expanded_series}
+        studies = {s['ID']: {**s.get('PatientMainDicomTags', {}), **s['MainDicomTags']} for s in expanded_studies}
+
+        changed_series = [
+            s for identifier, s in series.items()
+            if force or _get_fingerprint(s) != self._series.get(identifier, {}).get('Fingerprint')
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_nbr_workers) as executor:
+            statistics = list(executor.map(lambda s: self.orthanc.get_series_statistics(s['ID']), changed_series))
+
+        with self._lock:
+            self._series = {identifier: s for identifier, s in self._series.items() if identifier in series}
+            for s, series_statistics in zip(changed_series, statistics):
+                self._series[s['ID']] = {
+                    'StudyID': s['ParentStudy'],
+                    'Fingerprint': _get_fingerprint(s),
+                    'MainDicomTags': s['MainDicomTags'],
+                    **{key: int(series_statistics[key]) for key in SIZE_KEYS}
+                }
+            self._studies = studies
+
+        if self.cache_path is not None:
+            self._save()
+
+        return len(changed_series)
+
+    def iterate_records(self) -> Iterator[Dict]:
+        """Iterate over the series of the mirror
+
+        Each record has the series identifier ('ID'), the series statistics
+        ('DiskSize', 'UncompressedSize', 'CountInstances'), the main DICOM tags
+        of the series, of its study and of its patient, and the study year
+        ('StudyYear', from the StudyDate).
+
+        Returns
+        -------
+        Iterator[Dict]
+            Series records.
+        """
+        with self._lock:
+            series, studies = dict(self._series), self._studies
+
+        for identifier, s in series.items():
+            study_tags = studies.get(s['StudyID'], {})
+            yield {
+                **study_tags,
+                **s['MainDicomTags'],
+                'ID': identifier,
+                'StudyID': s['StudyID'],
+                'StudyYear': study_tags.get('StudyDate', '')[:4],
+                **{key: s[key] for key in SIZE_KEYS}
+            }
+
+    def group_by(self, *keys: GroupKey, record_filter: Optional[Callable[[Dict], bool]] = None) -> Dict[Any, Dict[str, int]]:
+        """Sum the statistics of the series by group
+
+        Parameters
+        ----------
+        keys
+            Record fields (e.g. 'Modality', 'StudyYear', 'ReferringPhysicianName'),
+            or functions of a record, giving the groups. Missing fields are ''.
+        record_filter
+            Only the records for which this function is True are summed (e.g. lambda r: r['Modality'] == 'CT').
+
+        Returns
+        -------
+        Dict[Any, Dict[str, int]]
+            Group (a value, or a tuple of values for several keys) -> 'DiskSize',
+            'UncompressedSize', 'CountInstances' and 'CountSeries', by decreasing disk size.
+        """
+        groups: Dict[Any, Dict[str, int]] = {}
+        for record in self.iterate_records():
+            if record_filter is not None and not record_filter(record):
+                continue
+
+            group = _make_group(record, keys)
+            if group not in groups:
+                groups[group] = dict.fromkeys((*SIZE_KEYS, 'CountSeries'), 0)
+            totals = groups[group]
+
+            for key in SIZE_KEYS:
+                totals[key] += record[key]
+            totals['CountSeries'] += 1
+
+        return dict(sorted(groups.items(), key=lambda item: item[1]['DiskSize'], reverse=True))
+
+    def get_total(self) -> Dict[str, int]:
+        """Sum the statistics of all the series
+
+        Returns
+        -------
+        Dict[str, int]
+            'DiskSize', 'UncompressedSize', 'CountInstances' and 'CountSeries'.
+        """
+        return self.group_by().get((), dict.fromkeys((*SIZE_KEYS, 'CountSeries'), 0))
+
+    def _save(self) -> None:
+        with self._lock:
+            cache = {'Series': self._series, 'Studies': self._studies}
+
+        temporary_path = f'{self.cache_path}.part'
+        with open(temporary_path, 'w') as file_handler:
+            json.dump(cache, file_handler)
+        os.replace(temporary_path, self.cache_path)  # type: ignore
+
+    def __str__(self):
+        return f'StorageAnalytics (nbr_series={len(self._series)})'
+
+
+def _get_fingerprint(series: Dict) -> List:
+    # LastUpdate only has a one second resolution, so the number of instances is also compared
+    return [series.get('LastUpdate'), len(series.get('Instances', []))]
+
+
+def _make_group(record: Dict, keys: Tuple[GroupKey, ...]) -> Any:
+    group = tuple(key(record) if callable(key) else record.get(key, '') for key in keys)
+
+    return group[0] if len(keys) == 1 else group
@@ -0,0 +1,468 @@
+# coding: utf-8
+# author: gabriel couture
+import hashlib
+import heapq
+import os
+import struct
+import threading
+import zipfile
+import zlib
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pyorthanc._util import Resource, report_progress
+from pyorthanc.bulk import BulkResult
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+LOCAL_FILE_HEADER_SIGNATURE = b'PK\x03\x04'
+DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+LOCAL_FILE_HEADER_SIZE = 30
+ZIP64_EXTRA_FIELD_ID = 0x0001
+DATA_DESCRIPTOR_FLAG = 0x08
+READING_SIZE = 64 * 1024
+ARCHIVE_LEVELS = ('Patient', 'Study', 'Series')
+PARTIAL_FILE_SUFFIX = '.part'
+
+
+def iterate_archive_files(orthanc: 'Orthanc', level: str, identifier: str,
+                          chunk_size: int = 1024 * 1024) -> Iterator[Tuple[str, bytes]]:
+    """Download the ZIP archive of a resource and yield its files as they arrive
+
+    Only one file of the archive is in memory at a time.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    level
+        Resource level ('Patient', 'Study' or 'Series').
+    identifier
+        Resource identifier.
+    chunk_size
+        Size (in bytes) of the chunks read from the network.
+
+    Returns
+    -------
+    Iterator[Tuple[str, bytes]]
+        (path in the archive, DICOM file content) pairs.
+
+    Examples
+    --------
+    >>> import io, pydicom
+    >>> for path, content in iterate_archive_files(orthanc, 'Study', 'a_study_identifier'):
+    ...     dataset = pydicom.dcmread(io.BytesIO(content))
+    """
+    return iterate_zip_stream(_get_archive_stream(orthanc, level, identifier, chunk_size))
+
+
+def extract_archive(orthanc: 'Orthanc', level: str, identifier: str, path: str,
+                    chunk_size: int = 1024 * 1024) -> List[str]:
+    """Download the ZIP archive of a resource and extract it while it is downloaded
+
+    Each file is written to its final location chunk by chunk, so the
+    archive is never stored (neither in memory nor on disk).
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    level
+        Resource level ('Patient', 'Study' or 'Series').
+    identifier
+        Resource identifier.
+    path
+        Directory where the files are extracted.
+    chunk_size
+        Size (in bytes) of the chunks read from the network.
+
+    Returns
+    -------
+    List[str]
+        Paths of the extracted files.
+    """
+    return extract_zip_stream(_get_archive_stream(orthanc, level, identifier, chunk_size), path)
+
+
+def download_cohort_archives(
+        orthanc: 'Orthanc',
+        resources: Iterable[Resource],
+        path: str,
+        max_archive_size: int = 2 * 1024 ** 3,
+        media: bool = False,
+        max_nbr_workers: int = 4,
+        chunk_size: int = 1024 * 1024,
+        progress_callback: Optional[Callable[[int, int], Any]] = None) -> BulkResult:
+    """Download the archives of a large cohort, split in size-balanced ZIP files
+
+    The resources are split in archives of about the same uncompressed size
+    (read from the statistics routes), with at most `max_archive_size` bytes
+    per archive unless a single resource is bigger. Each archive is created
+    by an asynchronous Orthanc job, so no request lasts longer than a
+    download, and several archives are created and streamed to disk
+    concurrently.
+
+    Each archive is written to a '.part' file that is renamed once complete.
+    Its name depends on the resources it contains, so when the download is
+    restarted with the same resources, the complete archives are skipped.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    resources
+        Patients, studies, series or instances of the cohort.
+    path
+        Directory where the archives are written.
+    max_archive_size
+        Maximum uncompressed size (in bytes) of the resources of an archive.
+    media
+        If True, create archives for media storage (with a DICOMDIR).
+    max_nbr_workers
+        Maximum number of archives created and downloaded at the same time.
+    chunk_size
+        Size (in bytes) of the chunks read from the network.
+    progress_callback
+        Called with (number of processed archives, total number of archives)
+        each time an archive is processed.
+
+    Returns
+    -------
+    BulkResult
+        Archive path -> identifiers of its resources, and errors.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> studies = [Study(i, orthanc) for i in orthanc.get_studies()]
+    >>> result = download_cohort_archives(orthanc, studies, './cohort', max_archive_size=500 * 1024 ** 2)
+    >>> result.errors  # Run again to download the failed archives only
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from pyorthanc.job import JobWatcher, submit_job
+
+    resources = list(resources)
+    sizes = _get_uncompressed_sizes(orthanc, resources, max_nbr_workers)
+    chunks = split_in_balanced_chunks([r.get_identifier() for r in resources], sizes, max_archive_size)
+    archive_paths = [os.path.join(path, _make_archive_file_name(i, c)) for i, c in enumerate(chunks)]
+
+    os.makedirs(path, exist_ok=True)
+    watcher = JobWatcher(orthanc)
+    operation = orthanc.create_media if media else orthanc.create_archive
+    bulk_result = BulkResult()
+    lock = threading.Lock()
+
+    def download(archive_path: str, resource_identifiers: List[str]) -> None:
+        try:
+            if not os.path.exists(archive_path):
+                job = submit_job(operation, data={'Resources': resource_identifiers}, watcher=watcher)
+                job.result()
+                _write_stream(orthanc.get_job_output_stream(job.get_identifier(), 'archive', chunk_size=chunk_size), archive_path)
+        except Exception as error:
+            with lock:
+                bulk_result.errors[archive_path] = error
+                report_progress(progress_callback, bulk_result, len(chunks))
+            return
+
+        with lock:
+            bulk_result.results[archive_path] = resource_identifiers
+            report_progress(progress_callback, bulk_result, len(chunks))
+
+    with ThreadPoolExecutor(max_workers=max_nbr_workers) as executor:
+        list(executor.map(download, archive_paths, chunks))
+
+    return bulk_result
+
+
+def split_in_balanced_chunks(identifiers: List[str], sizes: List[int], max_chunk_size: int) -> List[List[str]]:
+    """Split resources in chunks of about the same total size
+
+    The number of chunks is the smallest one that can keep the chunks
+    under `max_chunk_size`, and the resources are assigned greedily, from
+    the biggest to the smallest, to the currently smallest chunk. The split
+    only depends on the identifiers and sizes, not on their order.
+
+    Parameters
+    ----------
+    identifiers
+        Resource identifiers.
+    sizes
+        Size of each resource.
+    max_chunk_size
+        Maximum total size of a chunk (a resource bigger than this is alone in its chunk).
+
+    Returns
+    -------
+    List[List[str]]
+        Sorted identifiers of each chunk, from the biggest chunk to the smallest.
+    """
+    if not identifiers:
+        return []
+
+    items = sorted(zip(sizes, identifiers), key=lambda item: (-item[0], item[1]))
+    nbr_chunks = min(len(items), max(1, -(-sum(sizes) // max(max_chunk_size, 1))))
+
+    while True:
+        chunks = _assign_to_chunks(items, nbr_chunks)
+        if nbr_chunks == len(items) or all(size <= max_chunk_size or len(c) == 1 for size, _, c in chunks):
+            return [sorted(c) for _, _, c in sorted(chunks, key=lambda chunk: (-chunk[0], chunk[1])) if c]
+        nbr_chunks += 1
+
+
+def iterate_zip_stream(chunks: Iterable[bytes]) -> Iterator[Tuple[str, bytes]]:
+    """Parse a ZIP archive from a stream of chunks and yield its files
+
+    Parameters
+    ----------
+    chunks
+        Chunks of the ZIP archive, in order.
+
+    Returns
+    -------
+    Iterator[Tuple[str, bytes]]
+        (path in the archive, file content) pairs.
+
+    Raises
+    ------
+    zipfile.BadZipFile
+        If the stream is not a valid ZIP archive.
+    """
+    for name, data in _iterate_members(_ChunkReader(chunks)):
+        content = b''.join(data)
+        if not name.endswith('/'):
+            yield name, content
+
+
+def extract_zip_stream(chunks: Iterable[bytes], path: str) -> List[str]:
+    """Parse a ZIP archive from a stream of chunks and write its files to a directory
+
+    Parameters
+    ----------
+    chunks
+        Chunks of the ZIP archive, in order.
+    path
+        Directory where the files are extracted.
+
+    Returns
+    -------
+    List[str]
+        Paths of the extracted files.
+
+    Raises
+    ------
+    zipfile.BadZipFile
+        If the stream is not a valid ZIP archive, or if a file would be
+        written outside of `path`.
+    """
+    root = os.path.abspath(path)
+    file_paths = []
+
+    for name, data in _iterate_members(_ChunkReader(chunks)):
+        file_path = os.path.abspath(os.path.join(root, name))
+        if os.path.commonpath([root, file_path]) != root:
+            raise zipfile.BadZipFile(f'File outside of the extraction directory: {name}')
+
+        if name.endswith('/'):
+            os.makedirs(file_path, exist_ok=True)
+            for _ in data:
+                pass
+            continue
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as file_handler:
+            for piece in data:
+                file_handler.write(piece)
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+class _ChunkReader:
+    """Read bytes from an iterable of chunks, buffering only what is needed
+
+    The read bytes are skipped with an offset instead of slicing the buffer,
+    so parsing an archive stays linear in its size.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self._position = 0  # Offset of the first unread byte of the buffer
+
+    def read(self, size: int) -> bytes:
+        """Read at most `size` bytes (less only at the end of the stream)"""
+        while len(self._buffer) - self._position < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            del self._buffer[:self._position]
+            self._position = 0
+            self._buffer += chunk
+
+        return self._take(size)
+
+    def read_exactly(self, size: int) -> bytes:
+        data = self.read(size)
+        if len(data) != size:
+            raise zipfile.BadZipFile('Truncated ZIP archive')
+
+        return data
+
+    def read_available(self, max_size: int) -> bytes:
+        """Read the buffered bytes (or the next chunk), at most `max_size`"""
+        if self._position == len(self._buffer):
+            self._buffer = bytearray(next(self._chunks, b''))
+            self._position = 0
+
+        return self._take(max_size)
+
+    def unread(self, data: bytes) -> None:
+        """Give back the end of the last read (e.g. the bytes following a deflated member)"""
+        self._position -= len(data)
+
+    def _take(self, size: int) -> bytes:
+        with memoryview(self._buffer) as view:
+            data = bytes(view[self._position:self._position + size])
+        self._position += len(data)
+
+        return data
+
+
+def _iterate_members(reader: _ChunkReader) -> Iterator[Tuple[str, Iterator[bytes]]]:
+    # Yield (name, data) for each member. Like itertools.groupby, the data
+    # iterator of a member is only valid until the next member is requested.
+    while True:
+        signature = reader.read(4)
+        if signature != LOCAL_FILE_HEADER_SIGNATURE:
+            if signature[:2] == b'PK' or signature == b'':
+                return  # Central directory (or end of archive): all the files were read
+            raise zipfile.BadZipFile('Bad local file header signature')
+
+        header = reader.read_exactly(LOCAL_FILE_HEADER_SIZE - 4)
+        (_, flags, method, _, _, crc, compressed_size, uncompressed_size,
+         name_length, extra_length) = struct.unpack('<HHHHHIIIHH', header)
+        name = reader.read_exactly(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = reader.read_exactly(extra_length)
+
+        is_zip64 = _has_zip64_extra_field(extra)
+        if is_zip64 and compressed_size == 0xFFFFFFFF:
+            uncompressed_size, compressed_size = _read_zip64_sizes(extra)
+
+        data = _iterate_member_data(reader, name, flags, method, crc, compressed_size, is_zip64)
+        yield name, data
+
+        for _ in data:  # Skip what the caller did not read
+            pass
+
+
+def _iterate_member_data(reader: _ChunkReader, name: str, flags: int, method: int,
+                         crc: int, compressed_size: int, is_zip64: bool) -> Iterator[bytes]:
+    has_data_descriptor = bool(flags & DATA_DESCRIPTOR_FLAG)
+    computed_crc = 0
+
+    if method == zipfile.ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        while not decompressor.eof:
+            compressed = reader.read_available(READING_SIZE)
+            if compressed == b'':
+                raise zipfile.BadZipFile(f'Truncated ZIP archive in {name}')
+            data = decompressor.decompress(compressed)
+            computed_crc = zlib.crc32(data, computed_crc)
+            yield data
+        reader.unread(decompressor.unused_data)
+
+    elif method == zipfile.ZIP_STORED and not has_data_descriptor:
+        remaining_size = compressed_size
+        while remaining_size > 0:
+            data = reader.read_available(min(remaining_size, READING_SIZE))
+            if data == b'':
+                raise zipfile.BadZipFile(f'Truncated ZIP archive in {name}')
+            remaining_size -= len(data)
+            computed_crc = zlib.crc32(data, computed_crc)
+            yield data
+
+    else:
+        raise zipfile.BadZipFile(f'Unsupported compression for streaming ({method}) in {name}')
+
+    if has_data_descriptor:
+        crc = _read_data_descriptor_crc(reader, is_zip64)
+
+    if computed_crc != crc:
+        raise zipfile.BadZipFile(f'Bad CRC-32 for file {name}')
+
+
+def _read_data_descriptor_crc(reader: _ChunkReader, is_zip64: bool) -> int:
+    sizes_length = 16 if is_zip64 else 8
+    data = reader.read_exactly(4)
+    if data == DATA_DESCRIPTOR_SIGNATURE:  # The signature is optional
+        data = reader.read_exactly(4)
+    reader.read_exactly(sizes_length)
+
+    return struct.unpack('<I', data)[0]
+
+
+def _has_zip64_extra_field(extra: bytes) -> bool:
+    return any(field_id == ZIP64_EXTRA_FIELD_ID for field_id, _ in _iterate_extra_fields(extra))
+
+
+def _read_zip64_sizes(extra: bytes) -> Tuple[int, int]:
+    for field_id, data in _iterate_extra_fields(extra):
+        if field_id == ZIP64_EXTRA_FIELD_ID and len(data) >= 16:
+            uncompressed_size, compressed_size = struct.unpack('<QQ', data[:16])
+            return uncompressed_size, compressed_size
+
+    raise zipfile.BadZipFile('Bad ZIP64 extra field')
+
+
+def _iterate_extra_fields(extra: bytes) -> Iterator[Tuple[int, bytes]]:
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, size = struct.unpack('<HH', extra[position:position + 4])
+        yield field_id, extra[position + 4:position + 4 + size]
+        position += 4 + size
+
+
+def _get_archive_stream(orthanc: 'Orthanc', level: str, identifier: str, chunk_size: int) -> Iterator[bytes]:
+    if level not in ARCHIVE_LEVELS:
+        raise ValueError(f'Unknown level {level!r}, expected one of {ARCHIVE_LEVELS}')
+
+    return getattr(orthanc, f'get_{level.lower()}_zip_stream')(identifier, chunk_size=chunk_size)
+
+
+def _get_uncompressed_sizes(orthanc: 'Orthanc', resources: List[Resource], max_nbr_workers: int) -> List[int]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    def get_size(resource: Resource) -> int:
+        statistics: Dict = getattr(orthanc, f'get_{type(resource).__name__.lower()}_statistics')(resource.get_identifier())
+
+        return int(statistics['UncompressedSize'])
+
+    with ThreadPoolExecutor(max_workers=max_nbr_workers) as executor:
+        return list(executor.map(get_size, resources))
+
+
+def _assign_to_chunks(items: List[Tuple[int, str]], nbr_chunks: int) -> List[Tuple[int, int, List[str]]]:
+    # Greedy assignment of (size, identifier) items, sorted by decreasing size, to the smallest chunk
+    chunks: List[Tuple[int, int, List[str]]] = [(0, index, []) for index in range(nbr_chunks)]
+    for size, identifier in items:
+        chunk_size, index, chunk_identifiers = heapq.heappop(chunks)
+        chunk_identifiers.append(identifier)
+        heapq.heappush(chunks, (chunk_size + size, index, chunk_identifiers))
+
+    return chunks
+
+
+def _write_stream(chunks: Iterable[bytes], file_path: str) -> None:
+    # Write to a partial file first, so that an existing file is always complete
+    partial_path = file_path + PARTIAL_FILE_SUFFIX
+    with open(partial_path, 'wb') as file_handler:
+        for chunk in chunks:
+            file_handler.write(chunk)
+
+    os.replace(partial_path, file_path)
+
+
+def _make_archive_file_name(index: int, resource_identifiers: List[str]) -> str:
+    digest = hashlib.sha1('|'.join(resource_identifiers).encode()).hexdigest()
+
+    return f'archive_{index:04d}_{digest[:12]}.zip'
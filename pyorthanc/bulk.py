@@ -0,0 +1,290 @@
+# coding: utf-8
+# author: gabriel couture
+import csv
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+
+from pyorthanc._util import Resource, get_resources_at_level, report_progress
+from pyorthanc.instance import Instance
+from pyorthanc.job import JobWatcher, submit_job
+from pyorthanc.series import Series
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+MAPPING_TABLE_COLUMNS = ['Type', 'OriginalID', 'AnonymizedID']
+
+
+class OriginalNotDeletedError(Exception):
+    """Raised when a resource is anonymized, but its original could not be deleted"""
+
+    def __init__(self, original_identifier: str, anonymized_identifier: str, error: BaseException) -> None:
+        super().__init__(
+            f'{original_identifier} was anonymized to {anonymized_identifier}, but the original was not deleted: {error}'
+        )
+        self.original_identifier = original_identifier
+        self.anonymized_identifier = anonymized_identifier
+        self.error = error
+
+
+class BulkResult:
+    """Outcome of a bulk operation
+
+    `results` maps the Orthanc identifier of each processed resource to the
+    result of its operation, and `errors` maps the identifier of each
+    failed resource to the raised exception.
+    """
+
+    def __init__(self) -> None:
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, BaseException] = {}
+
+    def is_successful(self) -> bool:
+        """Check if no operation failed
+
+        Returns
+        -------
+        bool
+            True if there is no error.
+        """
+        return self.errors == {}
+
+    def __str__(self):
+        return f'BulkResult (succeeded={len(self.results)}, failed={len(self.errors)})'
+
+
+def anonymize_resources(
+        orthanc: 'Orthanc',
+        resources: Iterable[Resource],
+        level: Optional[str] = None,
+        data: Optional[Dict] = None,
+        max_nbr_running_jobs: int = 10,
+        mapping_table_path: Optional[str] = None,
+        delete_originals: bool = False,
+        progress_callback: Optional[Callable[[int, int], Any]] = None) -> BulkResult:
+    """Anonymize many patients, studies, series or instances with concurrent jobs
+
+    Each resource is anonymized by an asynchronous Orthanc job (instances,
+    which Orthanc anonymizes synchronously, are uploaded back once anonymized). At most
+    `max_nbr_running_jobs` jobs run at the same time, and all the running
+    jobs are polled together by a JobWatcher.
+
+    When `mapping_table_path` is given, each original -> anonymized
+    identifier pair is appended to this CSV file as soon as its job
+    succeeds (before the original is deleted). Resources already in the
+    table are skipped, so an interrupted run can simply be restarted.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    resources
+        Patients, studies, series or instances (e.g. a patient forest).
+    level
+        If given ('Patient', 'Study', 'Series' or 'Instance'), anonymize the descendants
+        of the resources at this level instead of the resources themselves.
+    data
+        Anonymization parameters (see the Orthanc book), e.g. {'Keep': ['StudyDescription']}.
+    max_nbr_running_jobs
+        Maximum number of anonymization jobs running at the same time.
+    mapping_table_path
+        Path of the CSV file that stores the original -> anonymized identifiers.
+    delete_originals
+        If True, delete each original resource once it is anonymized. If the deletion
+        fails, the error is an OriginalNotDeletedError, with the anonymized identifier.
+    progress_callback
+        Called with (number of processed resources, total number of resources)
+        each time a resource is processed.
+
+    Returns
+    -------
+    BulkResult
+        Original identifier -> anonymized identifier, and errors.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> forest = build_patient_forest(orthanc)
+    >>> result = anonymize_resources(
+    ...     orthanc, forest, level='Study',
+    ...     mapping_table_path='./anonymization.csv', max_nbr_running_jobs=20
+    ... )
+    >>> result.results  # {'original study identifier': 'anonymized study identifier', ...}
+    """
+    resources = get_resources_at_level(resources, level)
+    data = dict(data or {})  # Orthanc only accepts a JSON object
+    already_anonymized = read_mapping_table(mapping_table_path) if mapping_table_path is not None else {}
+    resources = [r for r in resources if r.get_identifier() not in already_anonymized]
+
+    watcher = JobWatcher(orthanc)
+    mapping_table_lock = threading.Lock()
+
+    def anonymize(resource: Resource) -> str:
+        if isinstance(resource, Instance):
+            anonymized_identifier = orthanc.post_instances(
+                orthanc.anonymize_specified_instance(resource.get_identifier(), data)
+            )['ID']
+        else:
+            job = submit_job(_get_operation(orthanc, 'anonymize', resource), resource.get_identifier(), data=data, watcher=watcher)
+            anonymized_identifier = job.result()['ID']
+
+        if mapping_table_path is not None:
+            with mapping_table_lock:
+                _append_to_mapping_table(mapping_table_path, type(resource).__name__, resource.get_identifier(), anonymized_identifier)
+
+        if delete_originals:
+            try:
+                _get_operation(orthanc, 'delete', resource)(resource.get_identifier())
+            except Exception as error:
+                raise OriginalNotDeletedError(resource.get_identifier(), anonymized_identifier, error) from error
+
+        return anonymized_identifier
+
+    return _run_bulk_operation(resources, anonymize, max_nbr_running_jobs, progress_callback)
+
+
+def modify_resources(
+        orthanc: 'Orthanc',
+        resources: Iterable[Resource],
+        replace: Optional[Dict[str, Any]] = None,
+        remove: Optional[List[str]] = None,
+        level: Optional[str] = None,
+        data: Optional[Dict] = None,
+        asynchronous: bool = True,
+        max_nbr_workers: int = 10,
+        progress_callback: Optional[Callable[[int, int], Any]] = None) -> BulkResult:
+    """Modify the tags of many patients, studies, series or instances concurrently
+
+    With `asynchronous=True`, each patient, study or series is modified by an
+    Orthanc job, and all the running jobs are polled together by a JobWatcher.
+    Otherwise, the modifications are synchronous requests. In both cases, at
+    most `max_nbr_workers` modifications run at the same time. Instances,
+    which Orthanc modifies synchronously, are uploaded back once modified.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    resources
+        Patients, studies, series or instances (e.g. a patient forest).
+    replace
+        Tags to replace, e.g. {'InstitutionName': 'My Hospital'}.
+    remove
+        Tags to remove, e.g. ['OperatorsName'].
+    level
+        If given ('Patient', 'Study', 'Series' or 'Instance'), modify the
+        descendants of the resources at this level instead of the resources themselves.
+    data
+        Other modification parameters (see the Orthanc book), e.g. {'KeepSource': False}.
+    asynchronous
+        If True, run the modifications as Orthanc jobs.
+    max_nbr_workers
+        Maximum number of modifications running at the same time.
+    progress_callback
+        Called with (number of processed resources, total number of resources)
+        each time a resource is processed.
+
+    Returns
+    -------
+    BulkResult
+        Original identifier -> modified identifier, and errors.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> series = [Series(i, orthanc) for i in orthanc.c_find({'Level': 'Series', 'Query': {'StationName': 'CT01'}})]
+    >>> result = modify_resources(
+    ...     orthanc, series, replace={'InstitutionName': 'My Hospital'}, data={'KeepSource': False}
+    ... )
+    >>> result.errors  # {'failed series identifier': exception, ...}
+    """
+    resources = get_resources_at_level(resources, level)
+    data = dict(data or {})  # Orthanc only accepts a JSON object
+    if replace is not None:
+        data['Replace'] = {**data.get('Replace', {}), **replace}
+    if remove is not None:
+        data['Remove'] = [*data.get('Remove', []), *remove]
+
+    watcher = JobWatcher(orthanc)
+
+    def modify(resource: Resource) -> str:
+        operation = _get_operation(orthanc, 'modify', resource)
+
+        if isinstance(resource, Instance):
+            return orthanc.post_instances(operation(resource.get_identifier(), data))['ID']
+
+        if asynchronous:
+            return submit_job(operation, resource.get_identifier(), data=data, watcher=watcher).result()['ID']
+
+        return operation(resource.get_identifier(), data)['ID']
+
+    return _run_bulk_operation(resources, modify, max_nbr_workers, progress_callback)
+
+
+def read_mapping_table(mapping_table_path: str) -> Dict[str, str]:
+    """Read an anonymization mapping table
+
+    Parameters
+    ----------
+    mapping_table_path
+        Path of the CSV file written by `anonymize_resources`.
+
+    Returns
+    -------
+    Dict[str, str]
+        Original identifier -> anonymized identifier (empty if the file does not exist).
+    """
+    if not os.path.exists(mapping_table_path):
+        return {}
+
+    with open(mapping_table_path, 'r', newline='') as file_handler:
+        return {row['OriginalID']: row['AnonymizedID'] for row in csv.DictReader(file_handler)}
+
+
+def _append_to_mapping_table(mapping_table_path: str, resource_type: str, original: str, anonymized: str) -> None:
+    is_new_file = not os.path.exists(mapping_table_path) or os.path.getsize(mapping_table_path) == 0
+
+    with open(mapping_table_path, 'a', newline='') as file_handler:
+        writer = csv.writer(file_handler)
+        if is_new_file:
+            writer.writerow(MAPPING_TABLE_COLUMNS)
+        writer.writerow([resource_type, original, anonymized])
+
+
+def _run_bulk_operation(
+        resources: List[Resource],
+        operation: Callable[[Resource], Any],
+        max_nbr_workers: int,
+        progress_callback: Optional[Callable[[int, int], Any]] = None) -> BulkResult:
+    from concurrent.futures import ThreadPoolExecutor
+
+    bulk_result = BulkResult()
+    lock = threading.Lock()
+
+    def run(resource: Resource) -> None:
+        try:
+            result = operation(resource)
+        except Exception as error:
+            with lock:
+                bulk_result.errors[resource.get_identifier()] = error
+                report_progress(progress_callback, bulk_result, len(resources))
+            return
+
+        with lock:
+            bulk_result.results[resource.get_identifier()] = result
+            report_progress(progress_callback, bulk_result, len(resources))
+
+    with ThreadPoolExecutor(max_workers=max_nbr_workers) as executor:
+        list(executor.map(run, resources))
+
+    return bulk_result
+
+
+def _get_operation(orthanc: 'Orthanc', operation_name: str, resource: Resource) -> Callable:
+    if operation_name == 'modify' and isinstance(resource, Series):
+        return orthanc.post_series_modify
+    if operation_name == 'anonymize' and isinstance(resource, Instance):
+        return orthanc.anonymize_specified_instance
+
+    return getattr(orthanc, f'{operation_name}_{type(resource).__name__.lower()}')
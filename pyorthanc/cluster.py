@@ -0,0 +1,277 @@
+# coding: utf-8
+# author: gabriel couture
+import json
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from pyorthanc.orthanc import Orthanc
+
+if TYPE_CHECKING:
+    from requests import Response, Session
+
+BALANCING_STRATEGIES = ('least_outstanding', 'latency')
+# POST routes that only read the (shared) index, so they are balanced like GET requests
+READ_ONLY_POST_ROUTES = ('/tools/find', '/tools/lookup')
+# Jobs and queries only live in the memory of the node that created them
+NODE_LOCAL_ROUTE_PREFIXES = ('/jobs', '/queries')
+# POST routes that create a query or a job (asynchronous requests also create a job)
+NODE_LOCAL_POST_ROUTE = re.compile(r'/modalities/[^/]+/(query|move)$')
+UNAVAILABLE_STATUS_CODES = (502, 503, 504)
+LATENCY_SMOOTHING_FACTOR = 0.2
+
+
+class OrthancNode:
+    """State of an Orthanc node of an OrthancCluster"""
+
+    def __init__(self, url: str, session: 'Session') -> None:
+        self.url = url
+        self.session = session
+
+        self.nbr_outstanding_requests = 0
+        self.nbr_requests = 0
+        self.nbr_failures = 0
+        self.latency: Optional[float] = None  # Smoothed response time, in seconds
+        self.failed_at: Optional[float] = None
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get the node statistics
+
+        Returns
+        -------
+        Dict[str, Any]
+            'Url', 'Healthy', 'OutstandingRequests', 'Requests', 'Failures' and 'Latency' (in seconds).
+        """
+        return {
+            'Url': self.url,
+            'Healthy': self.failed_at is None,
+            'OutstandingRequests': self.nbr_outstanding_requests,
+            'Requests': self.nbr_requests,
+            'Failures': self.nbr_failures,
+            'Latency': self.latency
+        }
+
+    def __str__(self):
+        return f'OrthancNode (url={self.url}, healthy={self.failed_at is None})'
+
+
+class OrthancCluster(Orthanc):
+    """Orthanc client that spreads its requests over several Orthanc nodes
+
+    The nodes must share the same index (e.g. the same PostgreSQL database),
+    so that any node can answer any read. An OrthancCluster has the methods
+    of Orthanc and can be used wherever an Orthanc object is expected.
+
+    - Reads (GET, and the POST of /tools/find and /tools/lookup) go to the
+      node with the fewest outstanding requests (or the lowest expected
+      latency), and fail over to another node on connection errors,
+      timeouts and HTTP 502, 503 and 504 errors.
+    - Writes go to a pinned node (the first healthy node) if `pin_writes`.
+      The node-local jobs and queries routes, and the requests that create
+      a job or a query (asynchronous requests, /modalities/{id}/query and
+      /modalities/{id}/move) always go to the pinned node. Writes only
+      fail over on connection errors (when the request was not received).
+      If the pinned node fails, the next healthy node is pinned.
+    - A failed node is not used during `retry_interval` seconds, then is
+      tried again. `check_health` checks all the nodes with `get_system`.
+
+    Each node has its own connection pool, shared by all the threads.
+
+    Examples
+    --------
+    >>> cluster = OrthancCluster(['http://orthanc-1:8042', 'http://orthanc-2:8042', 'http://orthanc-3:8042'])
+    >>> forest = build_patient_forest(cluster)  # Reads are spread over the 3 nodes
+    >>> cluster.get_nodes_statistics()
+    """
+
+    def __init__(
+            self,
+            orthanc_urls: List[str],
+            balancing: str = 'least_outstanding',
+            pin_writes: bool = True,
+            retry_interval: float = 30.0,
+            max_nbr_connections_per_node: int = 10,
+            timeout: Optional[float] = None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        orthanc_urls
+            Orthanc nodes addresses.
+        balancing
+            'least_outstanding' to send the reads to the node with the fewest requests
+            in progress, or 'latency' to weight them with the node response times.
+        pin_writes
+            If True, all the writes go to the same node.
+        retry_interval
+            Time (in seconds) during which a failed node is not used.
+        max_nbr_connections_per_node
+            Size of the connection pool of each node.
+        timeout
+            Timeout (in seconds) of the requests. No timeout if None.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if not orthanc_urls:
+            raise ValueError('An OrthancCluster needs at least one Orthanc URL')
+        if balancing not in BALANCING_STRATEGIES:
+            raise ValueError(f'Unknown balancing strategy {balancing!r}, expected one of {BALANCING_STRATEGIES}')
+
+        super().__init__(orthanc_urls[0].rstrip('/'))
+        self.balancing = balancing
+        self.pin_writes = pin_writes
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+
+        self.nodes: List[OrthancNode] = []
+        for url in orthanc_urls:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_nbr_connections_per_node)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.nodes.append(OrthancNode(url.rstrip('/'), session))
+
+        self._lock = threading.Lock()
+        self._pinned_node: Optional[OrthancNode] = None
+
+    def get_nodes_statistics(self) -> List[Dict[str, Any]]:
+        """Get the statistics of each node
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            Statistics of the nodes (see `OrthancNode.get_statistics`).
+        """
+        with self._lock:
+            return [node.get_statistics() for node in self.nodes]
+
+    def check_health(self) -> Dict[str, bool]:
+        """Check the nodes with `get_system`, and mark them as healthy or failed
+
+        Returns
+        -------
+        Dict[str, bool]
+            Node URL -> True if the node answered.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        def check(node: OrthancNode) -> bool:
+            try:
+                is_healthy = node.session.get(f'{node.url}/system', auth=self._credentials, timeout=self.timeout).status_code == 200
+            except Exception:
+                is_healthy = False
+
+            with self._lock:
+                if is_healthy:
+                    node.failed_at = None
+                else:
+                    self._mark_as_failed(node)
+
+            return is_healthy
+
+        with ThreadPoolExecutor(max_workers=len(self.nodes)) as executor:
+            return dict(zip([n.url for n in self.nodes], executor.map(check, self.nodes)))
+
+    def _send(self, method: str, route: str, **kwargs: Any) -> 'Response':
+        import requests
+
+        if not route.startswith(self._orthanc_url):
+            return super()._send(method, route, **kwargs)
+
+        path = route[len(self._orthanc_url):]
+        is_read = method == 'GET' or (method == 'POST' and path.split('?')[0] in READ_ONLY_POST_ROUTES)
+        is_pinned = path.startswith(NODE_LOCAL_ROUTE_PREFIXES) or (self.pin_writes and not is_read)
+        if method == 'POST' and not is_pinned:
+            is_pinned = _creates_node_local_object(path, kwargs.get('data'))
+
+        tried_nodes: Set[int] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            node = self._select_node(is_pinned, tried_nodes)
+            if node is None:
+                raise last_error or requests.ConnectionError('No Orthanc node is available')
+            tried_nodes.add(id(node))
+
+            start = time.monotonic()
+            try:
+                response = node.session.request(
+                    method, node.url + path, auth=self._credentials, timeout=self.timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self._end_request(node, None)
+                if not is_read and not isinstance(error, requests.ConnectionError):
+                    raise  # The write may have been done, it must not be sent again
+                last_error = error
+                continue
+
+            if is_read and response.status_code in UNAVAILABLE_STATUS_CODES:
+                self._end_request(node, None)
+                response.close()
+                last_error = requests.HTTPError(f'HTTP code: {response.status_code}, from {node.url}')
+                continue
+
+            self._end_request(node, time.monotonic() - start)
+            return response
+
+    def _select_node(self, is_pinned: bool, excluded_nodes: Set[int]) -> Optional[OrthancNode]:
+        with self._lock:
+            now = time.monotonic()
+            available_nodes = [
+                n for n in self.nodes
+                if id(n) not in excluded_nodes and (n.failed_at is None or now - n.failed_at >= self.retry_interval)
+            ]
+            if not available_nodes:
+                return None
+
+            if is_pinned:
+                if self._pinned_node not in available_nodes:
+                    self._pinned_node = available_nodes[0]
+                node = self._pinned_node
+            else:
+                node = min(available_nodes, key=self._get_load)
+
+            node.nbr_outstanding_requests += 1
+            node.nbr_requests += 1
+
+            return node
+
+    def _get_load(self, node: OrthancNode) -> float:
+        if self.balancing == 'latency' and node.latency is not None:
+            return node.latency * (node.nbr_outstanding_requests + 1)
+
+        return node.nbr_outstanding_requests
+
+    def _end_request(self, node: OrthancNode, duration: Optional[float]) -> None:
+        with self._lock:
+            node.nbr_outstanding_requests -= 1
+            if duration is None:
+                self._mark_as_failed(node)
+                return
+
+            node.failed_at = None
+            if node.latency is None:
+                node.latency = duration
+            else:
+                node.latency += LATENCY_SMOOTHING_FACTOR * (duration - node.latency)
+
+    def _mark_as_failed(self, node: OrthancNode) -> None:
+        node.failed_at = time.monotonic()
+        node.nbr_failures += 1
+        if node is self._pinned_node:
+            self._pinned_node = None
+
+
+def _creates_node_local_object(path: str, data: Any) -> bool:
+    if NODE_LOCAL_POST_ROUTE.match(path.split('?')[0]):
+        return True
+    if not isinstance(data, str) or '"Asynchronous"' not in data:
+        return False
+
+    try:
+        body = json.loads(data)
+    except ValueError:
+        return False
+
+    return isinstance(body, dict) and bool(body.get('Asynchronous'))
@@ -0,0 +1,355 @@
+# coding: utf-8
+# author: gabriel couture
+import collections
+import csv
+import datetime
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pyorthanc._util import parse_date
+from pyorthanc.bulk import BulkResult
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from pyorthanc.orthanc import Orthanc
+
+Window = Tuple[datetime.time, datetime.time]
+
+CHECKPOINT_COLUMNS = ['StudyID', 'SavedSize']
+SUBMITTED_INSTANCES_PER_WORKER = 2  # Instances submitted ahead of the workers, across the next studies
+
+
+class CompressionReport(BulkResult):
+    """Outcome of a compression run
+
+    `results` maps the identifier of each processed study to the number of
+    bytes saved on the disk (negative when uncompressing), and `errors` maps
+    the identifier of each failed study to the raised exception.
+    """
+
+    def get_saved_size(self) -> int:
+        """Get the total number of bytes saved on the disk
+
+        Returns
+        -------
+        int
+            Sum of the bytes saved by each processed study.
+        """
+        return sum(self.results.values())
+
+    def __str__(self):
+        return f'CompressionReport (succeeded={len(self.results)}, failed={len(self.errors)}, saved_size={self.get_saved_size()})'
+
+
+class CompressionScheduler:
+    """Compress (or uncompress) the attachments of old studies in bulk
+
+    Candidate studies are selected by age (their StudyDate, or their last
+    update if they have no StudyDate) and size (their statistics, read
+    concurrently). Their
+    attachments are then compressed one by one with Orthanc
+    `post_compress_attachment` calls, with bounded concurrency:
+
+    - New compressions only start during the configured time windows, and
+      the run waits (or stops, with `stop_event`) outside of them.
+    - When `max_latency` is given, the number of concurrent compressions is
+      halved each time a cheap request (the `is_attachment_compressed` check
+      done before each compression) takes longer than `max_latency`, and grows
+      back by one after each faster request, so the scheduler gives way to
+      the clinical traffic of the server. The compressions themselves are not
+      timed, since their duration grows with the size of the attachments.
+    - Attachments that are already compressed are skipped, and completed
+      studies are appended to the CSV `checkpoint_path` (and skipped by the
+      next runs), so an interrupted run can simply be restarted.
+
+    Examples
+    --------
+    >>> scheduler = CompressionScheduler(
+    ...     orthanc, min_age_in_days=3 * 365, min_size=100 * 1024 ** 2,
+    ...     windows=[(datetime.time(22), datetime.time(6))], max_latency=0.5,
+    ...     checkpoint_path='./compression.csv'
+    ... )
+    >>> report = scheduler.run()
+    >>> report.get_saved_size()
+    """
+
+    def __init__(
+            self,
+            orthanc: 'Orthanc',
+            min_age_in_days: float = 365,
+            min_size: int = 0,
+            windows: Optional[List[Window]] = None,
+            max_nbr_workers: int = 4,
+            max_latency: Optional[float] = None,
+            checkpoint_path: Optional[str] = None,
+            attachments: Sequence[str] = ('dicom',),
+            uncompress: bool = False) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        orthanc
+            Orthanc object.
+        min_age_in_days
+            Minimum age of the candidate studies.
+        min_size
+            Minimum (uncompressed) size of the candidate studies, in bytes.
+        windows
+            (start, end) local times between which compressions may run. A window
+            can span midnight (e.g. 22:00 to 06:00). Compressions run at any time if None.
+        max_nbr_workers
+            Maximum number of concurrent compressions.
+        max_latency
+            Duration (in seconds) of the `is_attachment_compressed` requests above which the
+            concurrency is reduced. No throttling if None.
+        checkpoint_path
+            Path of the CSV file that stores the completed studies.
+        attachments
+            Names of the attachments to compress.
+        uncompress
+            If True, uncompress the attachments instead.
+        """
+        self.orthanc = orthanc
+        self.min_age_in_days = min_age_in_days
+        self.min_size = min_size
+        self.windows = windows
+        self.max_nbr_workers = max_nbr_workers
+        self.max_latency = max_latency
+        self.checkpoint_path = checkpoint_path
+        self.attachments = attachments
+        self.uncompress = uncompress
+
+        self.concurrency = max_nbr_workers  # Current maximum number of concurrent compressions
+        self._condition = threading.Condition()
+        self._nbr_running = 0
+
+    def select_candidates(self, study_identifiers: Optional[Iterable[str]] = None) -> List[str]:
+        """Select the studies that are old and large enough
+
+        Parameters
+        ----------
+        study_identifiers
+            Studies to select from. All the studies of the server if None.
+
+        Returns
+        -------
+        List[str]
+            Identifiers of the candidate studies that are not in the checkpoint yet.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        completed_studies = read_checkpoint(self.checkpoint_path) if self.checkpoint_path is not None else {}
+        oldest_date = datetime.datetime.now() - datetime.timedelta(days=self.min_age_in_days)
+
+        if study_identifiers is None:
+            studies: Iterable[Dict] = self.orthanc.iterate_studies(expand=True)  # type: ignore
+        else:
+            studies = (self.orthanc.get_study_information(i) for i in study_identifiers)
+
+        old_studies = [
+            s['ID'] for s in studies if s['ID'] not in completed_studies and parse_date(s.get('MainDicomTags', {}).get('StudyDate'), s['LastUpdate']) <= oldest_date
+        ]
+        if self.min_size <= 0:
+            return old_studies
+
+        with ThreadPoolExecutor(max_workers=self.max_nbr_workers) as executor:
+            statistics = list(executor.map(self.orthanc.get_study_statistics, old_studies))
+
+        return [i for i, s in zip(old_studies, statistics) if int(s['UncompressedSize']) >= self.min_size]
+
+    def is_in_window(self, moment: Optional[datetime.datetime] = None) -> bool:
+        """Check if compressions may run at a given moment
+
+        Parameters
+        ----------
+        moment
+            Local date and time (now if None).
+
+        Returns
+        -------
+        bool
+            True if the moment is in one of the windows (or if there is no window).
+        """
+        if self.windows is None:
+            return True
+
+        moment_time = (moment or datetime.datetime.now()).time()
+        for start, end in self.windows:
+            if start <= end and start <= moment_time < end:
+                return True
+            if start > end and (moment_time >= start or moment_time < end):
+                return True
+
+        return False
+
+    def run(self, study_identifiers: Optional[Iterable[str]] = None,
+            progress_callback: Optional[Callable[[int, int], Any]] = None,
+            stop_event: Optional[threading.Event] = None) -> CompressionReport:
+        """Compress the attachments of studies
+
+        The instances of the next studies are submitted while the previous
+        studies complete, so the concurrency spans studies. The studies are
+        still reported (and checkpointed) in order.
+
+        Parameters
+        ----------
+        study_identifiers
+            Studies to compress. The candidates of `select_candidates` if None.
+        progress_callback
+            Called with (number of processed studies, total number of studies)
+            each time a study is processed.
+        stop_event
+            Stop starting new compressions when this event is set. The studies
+            that are not completed are left out of the report.
+
+        Returns
+        -------
+        CompressionReport
+            Study identifier -> saved bytes, and errors.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        study_identifiers = self.select_candidates() if study_identifiers is None else list(study_identifiers)
+        report = CompressionReport()
+        remaining_studies = iter(study_identifiers)
+        submitted_studies: Deque[Tuple[str, List['Future'], Optional[Exception]]] = collections.deque()
+        nbr_submitted_instances = 0
+        is_stopped = False
+
+        with ThreadPoolExecutor(max_workers=self.max_nbr_workers) as executor:
+            while True:
+                # Submit the instances of the next studies while the oldest study completes, so
+                # that the workers do not idle on the last instances of each study
+                while not is_stopped and nbr_submitted_instances < SUBMITTED_INSTANCES_PER_WORKER * self.max_nbr_workers:
+                    study_identifier = next(remaining_studies, None)
+                    if study_identifier is None:
+                        break
+                    if not self._wait_for_window(stop_event):
+                        is_stopped = True
+                        break
+
+                    try:
+                        instances = [i['ID'] for i in self.orthanc.get_study_instances(study_identifier)]
+                    except Exception as error:
+                        submitted_studies.append((study_identifier, [], error))
+                        continue
+
+                    futures = [executor.submit(self._process_instance, i, stop_event) for i in instances]
+                    submitted_studies.append((study_identifier, futures, None))
+                    nbr_submitted_instances += len(futures)
+
+                if not submitted_studies:
+                    break
+
+                study_identifier, futures, study_error = submitted_studies.popleft()
+                nbr_submitted_instances -= len(futures)
+                try:
+                    if study_error is not None:
+                        raise study_error
+                    saved_sizes = [f.result() for f in futures]
+                except Exception as error:
+                    report.errors[study_identifier] = error
+                else:
+                    if None in saved_sizes:
+                        break  # Stopped in the middle of the study
+
+                    report.results[study_identifier] = sum(saved_sizes)
+                    if self.checkpoint_path is not None:
+                        _append_to_checkpoint(self.checkpoint_path, study_identifier, report.results[study_identifier])
+
+                if progress_callback is not None:
+                    progress_callback(len(report.results) + len(report.errors), len(study_identifiers))
+
+        return report
+
+    def _process_instance(self, instance_identifier: str, stop_event: Optional[threading.Event]) -> Optional[int]:
+        saved_size = 0
+        for name in self.attachments:
+            if not self._wait_for_window(stop_event):
+                return None
+
+            self._acquire()
+            latency = None
+            try:
+                start = time.monotonic()
+                is_compressed = bool(int(self.orthanc.is_attachment_compressed('instances', instance_identifier, name)))
+                latency = time.monotonic() - start
+
+                if is_compressed == self.uncompress:
+                    saved_size += self._process_attachment(instance_identifier, name)
+            finally:
+                self._release(latency)
+
+        return saved_size
+
+    def _process_attachment(self, instance_identifier: str, name: str) -> int:
+        size = int(self.orthanc.get_attachment_size('instances', instance_identifier, name))
+        if self.uncompress:
+            compressed_size = int(self.orthanc.get_attachment_compressed_size('instances', instance_identifier, name))
+            self.orthanc.post_attachment_uncompress('instances', instance_identifier, name)
+
+            return compressed_size - size
+
+        self.orthanc.post_compress_attachment('instances', instance_identifier, name)
+
+        return size - int(self.orthanc.get_attachment_compressed_size('instances', instance_identifier, name))
+
+    def _wait_for_window(self, stop_event: Optional[threading.Event]) -> bool:
+        while not self.is_in_window():
+            if stop_event is None:
+                time.sleep(60)
+            elif stop_event.wait(60):
+                return False
+
+        return stop_event is None or not stop_event.is_set()
+
+    def _acquire(self) -> None:
+        with self._condition:
+            while self._nbr_running >= self.concurrency:
+                self._condition.wait()
+            self._nbr_running += 1
+
+    def _release(self, latency: Optional[float]) -> None:
+        with self._condition:
+            self._nbr_running -= 1
+            if latency is not None:  # Unknown if the request failed
+                if self.max_latency is not None and latency > self.max_latency:
+                    self.concurrency = max(1, self.concurrency // 2)
+                elif self.concurrency < self.max_nbr_workers:
+                    self.concurrency += 1
+            self._condition.notify_all()
+
+    def __str__(self):
+        return f'CompressionScheduler (min_age_in_days={self.min_age_in_days}, uncompress={self.uncompress})'
+
+
+def read_checkpoint(checkpoint_path: str) -> Dict[str, int]:
+    """Read the checkpoint of a compression run
+
+    Parameters
+    ----------
+    checkpoint_path
+        Path of the CSV file written by `CompressionScheduler.run`.
+
+    Returns
+    -------
+    Dict[str, int]
+        Study identifier -> saved bytes (empty if the file does not exist).
+    """
+    if not os.path.exists(checkpoint_path):
+        return {}
+
+    with open(checkpoint_path, 'r', newline='') as file_handler:
+        return {row['StudyID']: int(row['SavedSize']) for row in csv.DictReader(file_handler)}
+
+
+def _append_to_checkpoint(checkpoint_path: str, study_identifier: str, saved_size: int) -> None:
+    is_new_file = not os.path.exists(checkpoint_path) or os.path.getsize(checkpoint_path) == 0
+
+    with open(checkpoint_path, 'a', newline='') as file_handler:
+        writer = csv.writer(file_handler)
+        if is_new_file:
+            writer.writerow(CHECKPOINT_COLUMNS)
+        writer.writerow([study_identifier, saved_size])
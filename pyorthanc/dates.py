@@ -0,0 +1,229 @@
+# coding: utf-8
+# author: gabriel couture
+import importlib.util
+import re
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+# DA (YYYYMMDD, or the YYYY.MM.DD of old files) and TM (HH[MM[SS[.F{1,6}]]], or HH:MM:SS of old files) values
+DATE_FORMAT = re.compile(r'(\d{4})\.?(\d{2})\.?(\d{2})$')
+TIME_FORMAT = re.compile(r'(\d{2})(?::?(\d{2})(?::?(\d{2})(?:\.(\d{1,6}))?)?)?$')
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def to_iso_datetime(date_string: Optional[str], time_string: Optional[str] = None) -> Optional[str]:
+    """Convert a DICOM date (DA) and time (TM) to an ISO 8601 string
+
+    Missing or invalid times count as midnight, and fractional seconds are
+    kept to the microsecond.
+
+    Parameters
+    ----------
+    date_string
+        DICOM date, e.g. '20200131'.
+    time_string
+        DICOM time, e.g. '134501.25'.
+
+    Returns
+    -------
+    Optional[str]
+        'YYYY-MM-DDTHH:MM:SS.ffffff', or None if the date is missing or invalid.
+
+    Examples
+    --------
+    >>> to_iso_datetime('20200131', '1345')
+    '2020-01-31T13:45:00.000000'
+    """
+    date_match = DATE_FORMAT.match((date_string or '').strip())
+    if date_match is None:
+        return None
+
+    year, month, day = date_match.groups()
+    if not (1 <= int(month) <= 12 and 1 <= int(day) <= 31):
+        return None
+
+    time_match = TIME_FORMAT.match((time_string or '').strip())
+    hours, minutes, seconds, fraction = time_match.groups() if time_match is not None else ('00', None, None, None)
+    if not (int(hours) < 24 and int(minutes or 0) < 60 and int(seconds or 0) < 61):
+        hours, minutes, seconds, fraction = '00', None, None, None
+
+    seconds = min(seconds or '00', '59')  # DICOM allows leap seconds, not datetime
+
+    return f'{year}-{month}-{day}T{hours}:{minutes or "00"}:{seconds}.{(fraction or "").ljust(6, "0")}'
+
+
+def parse_dicom_datetime(date_string: Optional[str], time_string: Optional[str] = None) -> Optional[datetime]:
+    """Parse a DICOM date (DA) and time (TM)
+
+    Parameters
+    ----------
+    date_string
+        DICOM date, e.g. '20200131'.
+    time_string
+        DICOM time, e.g. '134501.25'.
+
+    Returns
+    -------
+    Optional[datetime]
+        Date and time, or None if the date is missing or invalid.
+    """
+    return _from_iso(to_iso_datetime(date_string, time_string))
+
+
+def get_iso_datetime(resource: Any, date_tag: str, time_tag: Optional[str] = None) -> Optional[str]:
+    """Get the ISO 8601 date and time of a Patient, Study, Series or Instance, cached on the resource
+
+    Parameters
+    ----------
+    resource
+        Patient, Study, Series or Instance.
+    date_tag
+        Main DICOM tag of the date, e.g. 'StudyDate'.
+    time_tag
+        Main DICOM tag of the time, e.g. 'StudyTime'.
+
+    Returns
+    -------
+    Optional[str]
+        'YYYY-MM-DDTHH:MM:SS.ffffff', or None if the resource has no valid date.
+    """
+    key = (date_tag, time_tag)
+    if key not in resource._parsed_datetimes:
+        main_dicom_tags = resource.get_main_information()['MainDicomTags']
+        resource._parsed_datetimes[key] = to_iso_datetime(
+            main_dicom_tags.get(date_tag), main_dicom_tags.get(time_tag) if time_tag is not None else None
+        )
+
+    return resource._parsed_datetimes[key]
+
+
+def get_datetime(resource: Any, date_tag: str, time_tag: Optional[str] = None) -> Optional[datetime]:
+    """Get the date and time of a Patient, Study, Series or Instance
+
+    Parameters
+    ----------
+    resource
+        Patient, Study, Series or Instance.
+    date_tag
+        Main DICOM tag of the date, e.g. 'StudyDate'.
+    time_tag
+        Main DICOM tag of the time, e.g. 'StudyTime'.
+
+    Returns
+    -------
+    Optional[datetime]
+        Date and time, or None if the resource has no valid date.
+    """
+    return _from_iso(get_iso_datetime(resource, date_tag, time_tag))
+
+
+def get_datetimes(
+        resources: Iterable[Any],
+        date_tag: str,
+        time_tag: Optional[str] = None,
+        level: Optional[str] = None,
+        use_numpy: Optional[bool] = None) -> Tuple[List[Any], Any]:
+    """Get the dates and times of many resources (e.g. a forest) in one pass
+
+    The DICOM values are normalized to ISO 8601 strings (cached on each
+    resource), then converted all at once to a NumPy datetime64[us] array,
+    without building a datetime object per resource. Resources without a
+    valid date are NaT (None without NumPy).
+
+    Parameters
+    ----------
+    resources
+        Patients, studies, series or instances.
+    date_tag
+        Main DICOM tag of the date, e.g. 'StudyDate', 'SeriesDate' or 'InstanceCreationDate'.
+    time_tag
+        Main DICOM tag of the time, e.g. 'StudyTime'. Midnight if None.
+    level
+        If given ('Patient', 'Study', 'Series' or 'Instance'), get the dates of
+        the descendants of the resources at this level instead.
+    use_numpy
+        If True, return a NumPy array, if False a list of datetimes. NumPy is used if it is installed when None.
+
+    Returns
+    -------
+    Tuple[List[Any], Any]
+        The resources (at `level`) and their dates and times, in the same order.
+
+    Examples
+    --------
+    >>> forest = build_patient_forest(orthanc)
+    >>> studies, dates = get_datetimes(forest, 'StudyDate', 'StudyTime', level='Study')
+    >>> recent_studies = [s for s, d in zip(studies, dates >= numpy.datetime64('2020-01-01')) if d]
+    """
+    from pyorthanc._util import get_resources_at_level
+
+    resources = get_resources_at_level(resources, level)
+    iso_datetimes = [get_iso_datetime(r, date_tag, time_tag) for r in resources]
+
+    if use_numpy is None:
+        use_numpy = importlib.util.find_spec('numpy') is not None
+
+    if not use_numpy:
+        return resources, [_from_iso(d) for d in iso_datetimes]
+
+    import numpy
+
+    try:
+        return resources, numpy.array([d or 'NaT' for d in iso_datetimes], dtype='datetime64[us]')
+    except ValueError:  # An impossible date, like February 30
+        return resources, numpy.array([_to_datetime64(d) for d in iso_datetimes], dtype='datetime64[us]')
+
+
+def sort_by_datetime(
+        resources: Iterable[Any],
+        date_tag: str,
+        time_tag: Optional[str] = None,
+        level: Optional[str] = None,
+        reverse: bool = False) -> List[Any]:
+    """Sort resources by date and time
+
+    ISO 8601 strings sort in chronological order, so no date is parsed.
+    Resources without a valid date come last.
+
+    Parameters
+    ----------
+    resources
+        Patients, studies, series or instances.
+    date_tag
+        Main DICOM tag of the date, e.g. 'StudyDate'.
+    time_tag
+        Main DICOM tag of the time, e.g. 'StudyTime'.
+    level
+        If given ('Patient', 'Study', 'Series' or 'Instance'), sort the descendants
+        of the resources at this level instead.
+    reverse
+        If True, from the most recent to the oldest.
+
+    Returns
+    -------
+    List[Any]
+        Sorted resources (at `level`).
+    """
+    from pyorthanc._util import get_resources_at_level
+
+    resources = get_resources_at_level(resources, level)
+    dated = [r for r in resources if get_iso_datetime(r, date_tag, time_tag) is not None]
+    undated = [r for r in resources if get_iso_datetime(r, date_tag, time_tag) is None]
+
+    return sorted(dated, key=lambda r: get_iso_datetime(r, date_tag, time_tag) or '', reverse=reverse) + undated
+
+
+def _from_iso(iso_datetime: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.strptime(iso_datetime, ISO_FORMAT) if iso_datetime is not None else None
+    except ValueError:
+        return None
+
+
+def _to_datetime64(iso_datetime: Optional[str]) -> Any:
+    import numpy
+
+    try:
+        return numpy.datetime64(iso_datetime or 'NaT', 'us')
+    except ValueError:
+        return numpy.datetime64('NaT', 'us')
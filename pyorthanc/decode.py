@@ -0,0 +1,213 @@
+# coding: utf-8
+# author: gabriel couture
+import collections
+import functools
+import io
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Deque, Iterable, Iterator, Optional, Tuple
+
+from pyorthanc.prefetch import InstanceOrIdentifier, InstancePrefetcher
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+    from pyorthanc.orthanc import Orthanc
+
+HAS_SHARED_MEMORY = sys.version_info >= (3, 8)  # multiprocessing.shared_memory is new in Python 3.8
+
+
+def decode_instances(
+        orthanc: 'Orthanc',
+        instances: Iterable[InstanceOrIdentifier],
+        decoder: Optional[Callable[[memoryview], Any]] = None,
+        max_nbr_processes: Optional[int] = None,
+        max_nbr_downloads: int = 8,
+        max_buffered_size: int = 256 * 1024 ** 2,
+        ordered: bool = True,
+        use_shared_memory: bool = HAS_SHARED_MEMORY) -> Iterator[Tuple[InstanceOrIdentifier, Any]]:
+    """Download DICOM files with threads and decode them with a process pool
+
+    Files are downloaded by an InstancePrefetcher, and each downloaded file
+    is decoded by `decoder` in a worker process, so decoding uses all the
+    cores while the downloads go on. At most twice `max_nbr_processes`
+    files wait for (or are in) decoding at the same time.
+
+    With shared memory (Python >= 3.8), file contents are handed to the
+    workers through shared memory blocks instead of being pickled, and so
+    are decoded numpy arrays, bytes and bytearrays.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    instances
+        Instances or instance identifiers (can be a lazy iterable).
+    decoder
+        Picklable function (e.g. defined at module level) called with a
+        memoryview on the file content. It must not keep references to the
+        memoryview. Pixel data is decoded with pydicom if None.
+    max_nbr_processes
+        Number of worker processes (the number of CPUs if None).
+    max_nbr_downloads
+        Maximum number of downloads in flight.
+    max_buffered_size
+        Size (in bytes) of the downloaded files above which no new download starts.
+    ordered
+        If True, results are yielded in the order of `instances`, else as soon as they are decoded.
+    use_shared_memory
+        If False, file contents and results are pickled.
+
+    Returns
+    -------
+    Iterator[Tuple[InstanceOrIdentifier, Any]]
+        (instance, decoded content) pairs.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> instance_identifiers = orthanc.get_series_information('a_series_identifier')['Instances']
+    >>> for identifier, pixel_array in decode_instances(orthanc, instance_identifiers, max_nbr_processes=32):
+    ...     print(identifier, pixel_array.shape)
+    """
+    import os
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    if use_shared_memory and not HAS_SHARED_MEMORY:
+        raise ValueError('Shared memory needs Python 3.8 or later')
+
+    decoder = decode_pixel_array if decoder is None else decoder
+    max_nbr_processes = max_nbr_processes or os.cpu_count() or 1
+    prefetcher = InstancePrefetcher(orthanc, instances, max_nbr_downloads, max_buffered_size, ordered)
+    pending: Deque[Tuple[InstanceOrIdentifier, 'Future']] = collections.deque()
+
+    def get_next_result() -> Tuple[InstanceOrIdentifier, Any]:
+        if ordered:
+            instance, future = pending.popleft()
+        else:
+            done, _ = wait([f for _, f in pending], return_when=FIRST_COMPLETED)
+            instance, future = next((i, f) for i, f in pending if f in done)
+            pending.remove((instance, future))
+
+        return instance, _read_result(future.result())
+
+    with ProcessPoolExecutor(max_workers=max_nbr_processes) as executor:
+        try:
+            for instance, content in prefetcher:
+                pending.append((instance, _submit_decoding(executor, decoder, content, use_shared_memory)))
+                if len(pending) >= 2 * max_nbr_processes:
+                    yield get_next_result()
+
+            while pending:
+                yield get_next_result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            for _, future in pending:
+                if not future.cancelled():
+                    _discard_result(future)
+
+
+def decode_pixel_array(content: memoryview) -> Any:
+    """Decode the pixel data of a DICOM file with pydicom
+
+    Parameters
+    ----------
+    content
+        DICOM file content.
+
+    Returns
+    -------
+    numpy.ndarray
+        Pixel array.
+    """
+    import pydicom
+
+    return pydicom.dcmread(io.BytesIO(content)).pixel_array
+
+
+def _submit_decoding(executor: 'Executor', decoder: Callable, content: bytes, use_shared_memory: bool) -> 'Future':
+    if not use_shared_memory:
+        return executor.submit(_decode, decoder, content)
+
+    from multiprocessing.shared_memory import SharedMemory
+
+    shared_memory: Any = SharedMemory(create=True, size=max(len(content), 1))
+    shared_memory.buf[:len(content)] = content
+    future = executor.submit(_decode_from_shared_memory, decoder, shared_memory.name, len(content))
+    future.add_done_callback(functools.partial(_release_shared_memory_of_future, shared_memory))
+
+    return future
+
+
+def _decode(decoder: Callable, content: bytes) -> Tuple[str, Any]:
+    return 'Value', decoder(memoryview(content))
+
+
+def _decode_from_shared_memory(decoder: Callable, name: str, size: int) -> Tuple[str, Any]:
+    # Runs in a worker process
+    from multiprocessing.shared_memory import SharedMemory
+
+    shared_memory: Any = SharedMemory(name=name)
+    try:
+        content = shared_memory.buf[:size]
+        try:
+            return _write_to_shared_memory(decoder(content))
+        finally:
+            content.release()
+    finally:
+        shared_memory.close()
+
+
+def _write_to_shared_memory(result: Any) -> Tuple[str, Any]:
+    numpy = sys.modules.get('numpy')  # numpy is only used if the decoder already imported it
+    if numpy is not None and isinstance(result, numpy.ndarray) and result.dtype != object:
+        data = memoryview(numpy.ascontiguousarray(result)).cast('B')
+        description: Tuple = ('Array', result.shape, result.dtype.str)
+    elif isinstance(result, (bytes, bytearray)):
+        data = memoryview(result)
+        description = ('Bytes', type(result).__name__)
+    else:
+        return 'Value', result
+
+    from multiprocessing.shared_memory import SharedMemory
+
+    shared_memory: Any = SharedMemory(create=True, size=max(data.nbytes, 1))
+    shared_memory.buf[:data.nbytes] = data
+    shared_memory.close()  # Unlinked by the parent process, once read
+
+    return 'SharedMemory', (shared_memory.name, data.nbytes, description)
+
+
+def _read_result(result: Tuple[str, Any]) -> Any:
+    kind, value = result
+    if kind != 'SharedMemory':
+        return value
+
+    from multiprocessing.shared_memory import SharedMemory
+
+    name, size, description = value
+    shared_memory: Any = SharedMemory(name=name)
+    try:
+        if description[0] == 'Array':
+            import numpy
+            _, shape, dtype = description
+            return numpy.frombuffer(shared_memory.buf, dtype=dtype, count=size // numpy.dtype(dtype).itemsize).reshape(shape).copy()
+
+        return bytes(shared_memory.buf[:size]) if description[1] == 'bytes' else bytearray(shared_memory.buf[:size])
+    finally:
+        _release_shared_memory(shared_memory)
+
+
+def _discard_result(future: 'Future') -> None:
+    try:
+        _read_result(future.result())
+    except Exception:
+        pass
+
+
+def _release_shared_memory_of_future(shared_memory: Any, future: 'Future') -> None:
+    _release_shared_memory(shared_memory)
+
+
+def _release_shared_memory(shared_memory: Any) -> None:
+    shared_memory.close()
+    shared_memory.unlink()
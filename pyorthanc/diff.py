@@ -0,0 +1,223 @@
+# coding: utf-8
+# author: gabriel couture
+import hashlib
+import os
+from typing import TYPE_CHECKING, Callable, Iterable, List, Optional, Set, Tuple
+
+from pyorthanc._util import get_md5
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from pyorthanc.orthanc import Orthanc
+
+LEVELS = ['Patient', 'Study', 'Series', 'Instance']
+CHILDREN_KEYS = {'Patient': 'Studies', 'Study': 'Series', 'Series': 'Instances'}
+FINGERPRINT_KEYS = ('CountStudies', 'CountSeries', 'CountInstances', 'UncompressedSize')
+FILE_READING_SIZE = 1024 * 1024
+
+
+class DiffReport:
+    """Differences between a reference archive and another one
+
+    Attributes
+    ----------
+    missing
+        (level, identifier) of the resources of the reference that are not
+        in the other archive. Only the top-most missing resource of a subtree is listed.
+    extra
+        (level, identifier) of the resources of the other archive that are
+        not in the reference (for a directory, ('File', path) of the files
+        that are not in the reference).
+    changed
+        (level, identifier) of the resources that are in both archives,
+        but with different content.
+    """
+
+    def __init__(self) -> None:
+        self.missing: List[Tuple[str, str]] = []
+        self.extra: List[Tuple[str, str]] = []
+        self.changed: List[Tuple[str, str]] = []
+
+    def is_identical(self) -> bool:
+        """Check if the archives have the same content
+
+        Returns
+        -------
+        bool
+            True if nothing is missing, extra or changed.
+        """
+        return self.missing == [] and self.extra == [] and self.changed == []
+
+    def __str__(self):
+        return f'DiffReport (missing={len(self.missing)}, extra={len(self.extra)}, changed={len(self.changed)})'
+
+
+def diff_orthanc_servers(
+        reference: 'Orthanc',
+        other: 'Orthanc',
+        compare_md5: bool = False,
+        max_nbr_workers: int = 10) -> DiffReport:
+    """Compare the content of two Orthanc servers, level by level
+
+    Orthanc identifiers only depend on the DICOM UIDs, so the resources of
+    both servers are matched by identifier. The resources found on both
+    servers are compared with a fingerprint (their instances count and
+    uncompressed size, from the statistics routes), and only the children
+    of the resources with different fingerprints are compared, so identical
+    subtrees are skipped early.
+
+    The fingerprints do not depend on the instance content, so with
+    `compare_md5`, all the common resources are descended into and the
+    MD5 of every instance found on both servers is compared (two requests
+    per instance).
+
+    Parameters
+    ----------
+    reference
+        Reference Orthanc server (e.g. the primary).
+    other
+        Compared Orthanc server (e.g. the backup).
+    compare_md5
+        If True, compare the attachment MD5 of all the instances found on both
+        servers, to detect instances with the same UIDs but a different content.
+    max_nbr_workers
+        Maximum number of concurrent requests.
+
+    Returns
+    -------
+    DiffReport
+        Missing, extra and changed resources.
+
+    Examples
+    --------
+    >>> report = diff_orthanc_servers(Orthanc('http://primary:8042'), Orthanc('http://backup:8042'))
+    >>> report.missing  # [('Study', 'identifier of a study missing from the backup'), ...]
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    report = DiffReport()
+
+    with ThreadPoolExecutor(max_workers=max_nbr_workers) as executor:
+        reference_patients, other_patients = executor.map(lambda o: o.get_patients(), [reference, other])
+        common_identifiers = _compare_identifiers('Patient', reference_patients, other_patients, report)
+
+        for level in LEVELS[:-1]:
+            changed_identifiers = _get_changed_resources(executor, reference, other, level, common_identifiers)
+            report.changed += [(level, i) for i in changed_identifiers]
+
+            # Resources with the same fingerprint can still hold instances with a different content
+            compared_identifiers = common_identifiers if compare_md5 else changed_identifiers
+            child_level = LEVELS[LEVELS.index(level) + 1]
+            common_identifiers = []
+            for reference_children, other_children in _map_on_both(executor, reference, other, _get_children_getter(level), compared_identifiers):
+                common_identifiers += _compare_identifiers(child_level, reference_children, other_children, report)
+
+        if compare_md5:
+            report.changed += [
+                ('Instance', i)
+                for i in _get_changed_resources(executor, reference, other, 'Instance', common_identifiers, get_md5)
+            ]
+
+    return report
+
+
+def diff_orthanc_and_directory(
+        orthanc: 'Orthanc',
+        path: str,
+        max_nbr_workers: int = 10) -> DiffReport:
+    """Compare the instances of an Orthanc server with the files of a directory
+
+    Files are matched with the instances by MD5, so the directory layout
+    and the file names do not matter. The instance MD5s are read from the
+    Orthanc attachments, and the files are hashed concurrently.
+
+    Orthanc has no route returning the MD5s in bulk, so one request is sent
+    per instance of the server: expect this to take a while on large servers
+    (increase `max_nbr_workers` if the server can take the load).
+
+    Parameters
+    ----------
+    orthanc
+        Reference Orthanc server.
+    path
+        Directory with the DICOM files (searched recursively).
+    max_nbr_workers
+        Maximum number of concurrent requests and hashed files.
+
+    Returns
+    -------
+    DiffReport
+        Instances without a file ('Instance', identifier) in `missing`, and
+        files without an instance ('File', path) in `extra`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    report = DiffReport()
+    file_paths = [os.path.join(d, f) for d, _, file_names in os.walk(path) for f in sorted(file_names)]
+
+    with ThreadPoolExecutor(max_workers=max_nbr_workers) as executor:
+        instance_identifiers = orthanc.get_instances()
+        instance_md5s = list(executor.map(lambda i: get_md5(orthanc, i), instance_identifiers))
+        file_md5s = list(executor.map(_compute_file_md5, file_paths))
+
+    file_md5_set = set(file_md5s)
+    instance_md5_set = set(instance_md5s)
+    report.missing = [('Instance', i) for i, md5 in zip(instance_identifiers, instance_md5s) if md5 not in file_md5_set]
+    report.extra = [('File', p) for p, md5 in zip(file_paths, file_md5s) if md5 not in instance_md5_set]
+
+    return report
+
+
+def _compare_identifiers(level: str, reference_identifiers: Iterable[str],
+                         other_identifiers: Iterable[str], report: DiffReport) -> List[str]:
+    reference_set: Set[str] = set(reference_identifiers)
+    other_set: Set[str] = set(other_identifiers)
+
+    report.missing += [(level, i) for i in sorted(reference_set - other_set)]
+    report.extra += [(level, i) for i in sorted(other_set - reference_set)]
+
+    return sorted(reference_set & other_set)
+
+
+def _get_changed_resources(executor: 'Executor', reference: 'Orthanc', other: 'Orthanc', level: str,
+                           identifiers: List[str], get_fingerprint: Optional[Callable] = None) -> List[str]:
+    if get_fingerprint is None:
+        get_fingerprint = _get_fingerprint_getter(level)
+
+    fingerprints = _map_on_both(executor, reference, other, get_fingerprint, identifiers)
+
+    return [i for i, (reference_fingerprint, other_fingerprint) in zip(identifiers, fingerprints)
+            if reference_fingerprint != other_fingerprint]
+
+
+def _map_on_both(executor: 'Executor', reference: 'Orthanc', other: 'Orthanc',
+                 function: Callable, identifiers: List[str]) -> List[Tuple]:
+    reference_results = executor.map(lambda i: function(reference, i), identifiers)
+    other_results = executor.map(lambda i: function(other, i), identifiers)
+
+    return list(zip(reference_results, other_results))
+
+
+def _get_fingerprint_getter(level: str) -> Callable[['Orthanc', str], Tuple]:
+    def get_fingerprint(orthanc: 'Orthanc', identifier: str) -> Tuple:
+        statistics = getattr(orthanc, f'get_{level.lower()}_statistics')(identifier)
+
+        return tuple(str(statistics.get(key)) for key in FINGERPRINT_KEYS)
+
+    return get_fingerprint
+
+
+def _get_children_getter(level: str) -> Callable[['Orthanc', str], List[str]]:
+    def get_children(orthanc: 'Orthanc', identifier: str) -> List[str]:
+        return getattr(orthanc, f'get_{level.lower()}_information')(identifier)[CHILDREN_KEYS[level]]
+
+    return get_children
+
+
+def _compute_file_md5(file_path: str) -> str:
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as file_handler:
+        for chunk in iter(lambda: file_handler.read(FILE_READING_SIZE), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
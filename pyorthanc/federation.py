@@ -0,0 +1,295 @@
+# coding: utf-8
+# author: gabriel couture
+import inspect
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+
+from pyorthanc.forest import PatientForest
+from pyorthanc.orthanc import Orthanc
+from pyorthanc.patient import Patient
+from pyorthanc.series import Series
+from pyorthanc.study import Study
+from pyorthanc.util import build_patient_forest
+
+if TYPE_CHECKING:
+    from pyorthanc.forest import Resource
+
+LEVEL_OF_IDENTIFIER_PARAMETER = {
+    'patient_identifier': 'Patient',
+    'study_identifier': 'Study',
+    'series_identifier': 'Series',
+    'instance_identifier': 'Instance'
+}
+CHILDREN_ATTRIBUTES = {Patient: 'studies', Study: 'series', Series: 'instances'}
+
+
+class FederatedOrthanc:
+    """Facade over independent Orthanc servers (e.g. one per site)
+
+    Searches (`c_find`, `lookup`) and forest building run on all the
+    servers concurrently, and their results are merged. Orthanc identifiers
+    only depend on the DICOM UIDs, so the same resource has the same
+    identifier on all the servers, and the merged results are keyed by
+    identifier, with the names of the servers that have the resource.
+
+    The servers of the resources found by a search are remembered, so
+    the per-resource methods of Orthanc (the ones with a patient, study,
+    series or instance identifier as first argument) can be called on the
+    facade, and are sent to a server that has the resource. Unknown
+    resources are looked for on all the servers.
+
+    Examples
+    --------
+    >>> federation = FederatedOrthanc({'site-a': Orthanc('http://site-a:8042'), 'site-b': Orthanc('http://site-b:8042')})
+    >>> studies = federation.c_find({'Level': 'Study', 'Query': {'PatientID': 'P1'}, 'Expand': True})
+    >>> studies[0]['Servers']  # ['site-b']
+    >>> federation.get_study_zip_file(studies[0]['ID'])  # Downloaded from site-b
+    """
+
+    def __init__(self, servers: Dict[str, Orthanc], max_nbr_workers: Optional[int] = None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        servers
+            Server name -> Orthanc object.
+        max_nbr_workers
+            Maximum number of concurrent requests (the number of servers if None).
+        """
+        if not servers:
+            raise ValueError('A FederatedOrthanc needs at least one server')
+
+        self.servers = dict(servers)
+        self.max_nbr_workers = max_nbr_workers or len(self.servers)
+
+        self._lock = threading.Lock()
+        self._locations: Dict[str, List[str]] = {}
+
+    def c_find(self, data: Dict) -> List[Any]:
+        """Run a /tools/find on all the servers
+
+        Parameters
+        ----------
+        data
+            Dictionary to send in the body of the requests.
+
+        Returns
+        -------
+        List[Any]
+            Resource identifiers, or with 'Expand', resource information
+            with the names of the servers that have the resource ('Servers').
+        """
+        return self._merge(self._map_on_servers(lambda orthanc: orthanc.c_find(data)))
+
+    def lookup(self, dicom_uid: str) -> List[Dict]:
+        """Map a DICOM UID to the Orthanc resources of all the servers
+
+        Parameters
+        ----------
+        dicom_uid
+            DICOM UID (e.g. a StudyInstanceUID) or PatientID.
+
+        Returns
+        -------
+        List[Dict]
+            'ID', 'Path' and 'Type' of the resources, with the names of the
+            servers that have them ('Servers').
+        """
+        return self._merge(self._map_on_servers(lambda orthanc: orthanc.lookup(dicom_uid)))
+
+    def build_patient_forest(self, **kwargs: Any) -> PatientForest:
+        """Build the patient forests of all the servers concurrently, and merge them
+
+        The trees of the same patient (same Orthanc identifier) on several
+        servers are merged into one tree, and so are their studies and
+        series. Each node of the merged tree keeps the Orthanc object of
+        the server it comes from (the first server, in the federation order,
+        for the resources that are on several servers), so its requests go
+        to a server that has it. Use `get_server_name` to know it.
+
+        The servers of all the patients, studies, series and instances of
+        the trees are remembered, so the per-resource methods called on the
+        facade are sent to the right server without looking for them.
+
+        Parameters
+        ----------
+        kwargs
+            Arguments of `build_patient_forest` (e.g. filters).
+
+        Returns
+        -------
+        PatientForest
+            Merged patient trees of all the servers.
+        """
+        forests = self._map_on_servers(lambda orthanc: build_patient_forest(orthanc, **kwargs))
+
+        patients: Dict[str, Patient] = {}
+        for server_name, forest in forests.items():
+            self._remember([r.identifier for r in _iterate_tree_resources(forest)], server_name)
+            for patient in forest:
+                if patient.identifier in patients:
+                    _merge_tree(patients[patient.identifier], patient)
+                else:
+                    patients[patient.identifier] = patient
+
+        return PatientForest(patients.values())
+
+    def get_server_name(self, resource: Any) -> str:
+        """Get the name of the server of a resource object (Patient, Study, Series or Instance)
+
+        Parameters
+        ----------
+        resource
+            Resource object built from one of the servers.
+
+        Returns
+        -------
+        str
+            Server name.
+        """
+        for server_name, orthanc in self.servers.items():
+            if orthanc is resource.orthanc:
+                return server_name
+
+        raise ValueError(f'{resource} does not come from a server of the federation')
+
+    def locate(self, identifier: str, level: str = 'Instance') -> List[str]:
+        """Get the names of the servers that have a resource
+
+        Parameters
+        ----------
+        identifier
+            Orthanc identifier of the resource.
+        level
+            Resource level, used when the resource was not found by a previous search.
+
+        Returns
+        -------
+        List[str]
+            Server names (empty if no server has the resource).
+        """
+        with self._lock:
+            if identifier in self._locations:
+                return list(self._locations[identifier])
+
+        get_information = _get_information_getter(level)
+        server_names = [name for name, found in self._map_on_servers(lambda o: _exists(get_information, o, identifier)).items() if found]
+        self._remember([identifier], *server_names)
+
+        return server_names
+
+    def get_server(self, identifier: str, level: str = 'Instance') -> Orthanc:
+        """Get a server that has a resource
+
+        Parameters
+        ----------
+        identifier
+            Orthanc identifier of the resource.
+        level
+            Resource level, used when the resource was not found by a previous search.
+
+        Returns
+        -------
+        Orthanc
+            Orthanc object of the first server (in the federation order) that has the resource.
+
+        Raises
+        ------
+        KeyError
+            If no server has the resource.
+        """
+        server_names = self.locate(identifier, level)
+        if not server_names:
+            raise KeyError(f'No server has the {level} {identifier}')
+
+        return self.servers[server_names[0]]
+
+    def __getattr__(self, name: str) -> Callable:
+        level = _get_level_of_method(name)
+        if level is None:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+        def call_on_server(identifier: str, *args: Any, **kwargs: Any) -> Any:
+            return getattr(self.get_server(identifier, level), name)(identifier, *args, **kwargs)  # type: ignore
+
+        call_on_server.__name__ = name
+        call_on_server.__doc__ = getattr(Orthanc, name).__doc__
+
+        return call_on_server
+
+    def __str__(self):
+        return f'FederatedOrthanc (servers={list(self.servers)})'
+
+    def _map_on_servers(self, function: Callable[[Orthanc], Any]) -> Dict[str, Any]:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.max_nbr_workers) as executor:
+            return dict(zip(self.servers, executor.map(function, self.servers.values())))
+
+    def _merge(self, results_of_servers: Dict[str, List]) -> List[Any]:
+        merged: Dict[str, Any] = {}
+        for server_name, results in results_of_servers.items():
+            for result in results:
+                identifier = result['ID'] if isinstance(result, dict) else result
+                if identifier not in merged:
+                    merged[identifier] = {**result, 'Servers': []} if isinstance(result, dict) else result
+                if isinstance(result, dict):
+                    merged[identifier]['Servers'].append(server_name)
+                self._remember([identifier], server_name)
+
+        return list(merged.values())
+
+    def _remember(self, identifiers: List[str], *server_names: str) -> None:
+        with self._lock:
+            for identifier in identifiers:
+                locations = self._locations.setdefault(identifier, [])
+                locations += [n for n in server_names if n not in locations]
+                locations.sort(key=list(self.servers).index)
+
+
+def _iterate_tree_resources(resources: List[Any]) -> Iterator['Resource']:
+    for resource in resources:
+        yield resource
+        attribute = CHILDREN_ATTRIBUTES.get(type(resource))
+        if attribute is not None:
+            yield from _iterate_tree_resources(getattr(resource, attribute))
+
+
+def _merge_tree(resource: 'Resource', other: 'Resource') -> None:
+    attribute = CHILDREN_ATTRIBUTES.get(type(resource))
+    if attribute is None:
+        return
+
+    children = {c.identifier: c for c in getattr(resource, attribute)}
+    for child in getattr(other, attribute):
+        if child.identifier in children:
+            _merge_tree(children[child.identifier], child)
+        else:
+            getattr(resource, attribute).append(child)
+
+
+def _get_level_of_method(name: str) -> Optional[str]:
+    method = getattr(Orthanc, name, None)
+    if name.startswith('_') or not callable(method):
+        return None
+
+    parameters = list(inspect.signature(method).parameters)
+
+    return LEVEL_OF_IDENTIFIER_PARAMETER.get(parameters[1]) if len(parameters) > 1 else None
+
+
+def _get_information_getter(level: str) -> Callable[[Orthanc, str], Any]:
+    return lambda orthanc, identifier: getattr(orthanc, f'get_{level.lower()}_information')(identifier)
+
+
+def _exists(get_information: Callable[[Orthanc, str], Any], orthanc: Orthanc, identifier: str) -> bool:
+    import requests
+
+    try:
+        get_information(orthanc, identifier)
+    except requests.HTTPError as error:
+        if 'HTTP code: 404' not in str(error):
+            raise
+        return False
+
+    return True
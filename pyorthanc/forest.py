@@ -0,0 +1,260 @@
+# coding: utf-8
+# author: gabriel couture
+import bisect
+import datetime
+from typing import Dict, Iterable, List, Optional, Union
+
+from pyorthanc.dates import get_iso_datetime, to_iso_datetime
+from pyorthanc.instance import Instance
+from pyorthanc.patient import Patient
+from pyorthanc.series import Series
+from pyorthanc.study import Study
+
+Resource = Union[Patient, Study, Series, Instance]
+
+UID_TAGS = {
+    'Patient': 'PatientID',
+    'Study': 'StudyInstanceUID',
+    'Series': 'SeriesInstanceUID',
+    'Instance': 'SOPInstanceUID'
+}
+
+
+class PatientForest(List[Patient]):
+    """Patient forest (list of patients) with hash indexes on its resources
+
+    The indexes (Orthanc identifier, DICOM UID at each level, modality
+    and study date) are built once from the information already in the
+    trees, so lookups do not scan the forest nor send requests. Resources
+    without information (e.g. a patient without studies, or children built
+    with `build_*`) are only indexed by their Orthanc identifier. The
+    parent of each study, series and instance is set, so that the
+    `get_parent_*_identifier` methods do not send requests either.
+
+    The indexes are rebuilt by `trim` and `refresh`. Call `reindex`
+    after modifying the trees in another way.
+
+    Examples
+    --------
+    >>> forest = build_patient_forest(orthanc)
+    >>> study = forest.find('Study', '1.2.840.113619.2.55.3')[0]
+    >>> study.parent.get_id()
+    >>> ct_instances = forest.get_instances_by_modality('CT')
+    >>> studies_of_2020 = forest.get_studies_between('20200101', '20201231')
+    """
+
+    def __init__(self, patients: Iterable[Patient] = ()) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        patients
+            Patient trees.
+        """
+        super().__init__(patients)
+        self.reindex()
+
+    def reindex(self) -> None:
+        """Rebuild the indexes from the trees
+        """
+        self._resources: Dict[str, Resource] = {}
+        self._resources_by_uid: Dict[str, Dict[str, List[Resource]]] = {level: {} for level in UID_TAGS}
+        self._series_by_modality: Dict[str, List[Series]] = {}
+        self._studies_by_date: Dict[str, List[Study]] = {}
+        self._sorted_dates: Optional[List[str]] = None
+
+        for patient in self:
+            self._index(patient, None)
+
+    def get(self, identifier: str) -> Optional[Resource]:
+        """Get a patient, study, series or instance by its Orthanc identifier
+
+        Parameters
+        ----------
+        identifier
+            Orthanc identifier.
+
+        Returns
+        -------
+        Optional[Resource]
+            Resource, or None if it is not in the forest.
+        """
+        return self._resources.get(identifier)
+
+    def find(self, level: str, uid: str) -> List[Resource]:
+        """Find the resources with a given DICOM UID
+
+        Parameters
+        ----------
+        level
+            'Patient' (PatientID), 'Study' (StudyInstanceUID), 'Series' (SeriesInstanceUID)
+            or 'Instance' (SOPInstanceUID).
+        uid
+            DICOM UID.
+
+        Returns
+        -------
+        List[Resource]
+            Resources with this UID (many patients can share a PatientID).
+        """
+        if level not in UID_TAGS:
+            raise ValueError(f'Unknown level {level!r}, expected one of {tuple(UID_TAGS)}')
+
+        return list(self._resources_by_uid[level].get(uid, []))
+
+    def get_series_by_modality(self, modality: str) -> List[Series]:
+        """Get the series of a modality
+
+        Parameters
+        ----------
+        modality
+            Modality, e.g. 'CT'.
+
+        Returns
+        -------
+        List[Series]
+            Series with this modality.
+        """
+        return list(self._series_by_modality.get(modality, []))
+
+    def get_instances_by_modality(self, modality: str) -> List[Instance]:
+        """Get the instances of a modality
+
+        Parameters
+        ----------
+        modality
+            Modality, e.g. 'CT'.
+
+        Returns
+        -------
+        List[Instance]
+            Instances of the series with this modality.
+        """
+        return [i for s in self._series_by_modality.get(modality, []) for i in s.get_instances()]
+
+    def get_studies_by_date(self, date: Union[str, datetime.date]) -> List[Study]:
+        """Get the studies of a day
+
+        Parameters
+        ----------
+        date
+            DICOM date (e.g. '20200131') or date.
+
+        Returns
+        -------
+        List[Study]
+            Studies with this StudyDate.
+        """
+        return list(self._studies_by_date.get(_to_day(date), []))
+
+    def get_studies_between(self, start: Union[str, datetime.date], end: Union[str, datetime.date]) -> List[Study]:
+        """Get the studies between two days (inclusive)
+
+        Parameters
+        ----------
+        start
+            First day, as a DICOM date (e.g. '20200101') or date.
+        end
+            Last day, as a DICOM date (e.g. '20201231') or date.
+
+        Returns
+        -------
+        List[Study]
+            Studies with a StudyDate in the range, in chronological order.
+        """
+        if self._sorted_dates is None:
+            self._sorted_dates = sorted(self._studies_by_date)
+
+        first = bisect.bisect_left(self._sorted_dates, _to_day(start))
+        last = bisect.bisect_right(self._sorted_dates, _to_day(end))
+
+        return [s for day in self._sorted_dates[first:last] for s in self._studies_by_date[day]]
+
+    def trim(self) -> None:
+        """Delete the empty studies, series and patients, then rebuild the indexes
+        """
+        for patient in self:
+            patient.trim()
+
+        self[:] = [p for p in self if not p.is_empty()]
+        self.reindex()
+
+    def refresh(self, resource: Resource) -> None:
+        """Rebuild the descendants of a resource of the forest from Orthanc, then rebuild the indexes
+
+        Parameters
+        ----------
+        resource
+            Patient, study or series of the forest.
+        """
+        from pyorthanc.util import _build_series, _build_study
+
+        if isinstance(resource, Patient):
+            information = resource.orthanc.get_patient_studies_information(resource.identifier)
+            resource.studies = [_build_study(i, resource.orthanc, None, None) for i in information]
+        elif isinstance(resource, Study):
+            information = resource.orthanc.get_study_series_information(resource.identifier)
+            resource.series = [_build_series(i, resource.orthanc, None) for i in information]
+        elif isinstance(resource, Series):
+            information = resource.orthanc.get_series_instance_information(resource.identifier)
+            resource.instances = [Instance(i['ID'], resource.orthanc, i) for i in information]
+        else:
+            raise ValueError(f'Can not refresh the descendants of a {type(resource).__name__}')
+
+        self.reindex()
+
+    def _index(self, resource: Resource, parent: Optional[Resource]) -> None:
+        if parent is not None:
+            resource.parent = parent  # type: ignore
+
+        self._resources[resource.identifier] = resource
+        uid = _get_uid(resource)
+        if uid is not None:
+            self._resources_by_uid[type(resource).__name__].setdefault(uid, []).append(resource)
+
+        if isinstance(resource, Study) and resource.information is not None:
+            iso_datetime = get_iso_datetime(resource, 'StudyDate')
+            if iso_datetime is not None:
+                self._studies_by_date.setdefault(iso_datetime[:10], []).append(resource)
+
+        if isinstance(resource, Series) and resource.information is not None:
+            modality = resource.information['MainDicomTags'].get('Modality')
+            if modality:
+                self._series_by_modality.setdefault(modality, []).append(resource)
+
+        for child in _get_children(resource):
+            self._index(child, resource)
+
+
+def _get_children(resource: Resource) -> List[Resource]:
+    if isinstance(resource, Patient):
+        return list(resource.get_studies())
+    if isinstance(resource, Study):
+        return list(resource.get_series())
+    if isinstance(resource, Series):
+        return list(resource.get_instances())
+
+    return []
+
+
+def _get_uid(resource: Resource) -> Optional[str]:
+    if isinstance(resource, Patient) and resource.information is None:
+        # The patients of a forest have no information, but their studies have the patient tags
+        studies = [s for s in resource.get_studies() if s.information is not None]
+        return studies[0].information['PatientMainDicomTags'].get('PatientID') if studies else None  # type: ignore
+
+    if resource.information is None:
+        return None  # Not fetched, to not send a request
+
+    return resource.information['MainDicomTags'].get(UID_TAGS[type(resource).__name__])
+
+
+def _to_day(date: Union[str, datetime.date]) -> str:
+    if isinstance(date, datetime.date):
+        return date.strftime('%Y-%m-%d')
+
+    iso_datetime = to_iso_datetime(date)
+    if iso_datetime is None:
+        raise ValueError(f'Invalid DICOM date {date!r}')
+
+    return iso_datetime[:10]
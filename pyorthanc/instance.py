@@ -1,9 +1,13 @@
 # coding: utf-8
 # author: gabriel couture
 from datetime import datetime
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Dict, Any, Optional, Tuple
 
-from pyorthanc.orthanc import Orthanc
+from pyorthanc.dates import get_datetime
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+    from pyorthanc.series import Series
 
 
 class Instance:
@@ -15,7 +19,7 @@ class Instance:
 
     def __init__(
             self, instance_identifier: str,
-            orthanc: Orthanc,
+            orthanc: 'Orthanc',
             instance_information: Dict = None) -> None:
         """Constructor
 
@@ -32,6 +36,8 @@ class Instance:
 
         self.identifier = instance_identifier
         self.information = instance_information
+        self._parsed_datetimes: Dict[Tuple[str, Optional[str]], Optional[str]] = {}  # See pyorthanc.dates
+        self.parent: Optional['Series'] = None
 
     def get_dicom_file_content(self) -> bytes:
         """Retrieves DICOM file
@@ -92,27 +98,17 @@ class Instance:
         """
         return self.get_main_information()['FileSize']
 
-    def get_creation_date(self) -> datetime:
+    def get_creation_date(self) -> Optional[datetime]:
         """Get creation date
 
-        The date have precision to the second.
+        The date have precision to the microsecond (if available).
 
         Returns
         -------
-        datetime
-            Creation Date
+        Optional[datetime]
+            Creation Date, or None if the instance has no valid InstanceCreationDate.
         """
-        date_string = self.get_main_information()['MainDicomTags']['InstanceCreationDate']
-        time_string = self.get_main_information()['MainDicomTags']['InstanceCreationTime']
-
-        return datetime(
-            year=int(date_string[:4]),
-            month=int(date_string[4:6]),
-            day=int(date_string[6:8]),
-            hour=int(time_string[:2]),
-            minute=int(time_string[2:4]),
-            second=int(time_string[4:6])
-        )
+        return get_datetime(self, 'InstanceCreationDate', 'InstanceCreationTime')
 
     def get_parent_series_identifier(self) -> str:
         """Get the parent series identifier
@@ -122,6 +118,9 @@ class Instance:
         str
             The parent series identifier.
         """
+        if self.parent is not None:
+            return self.parent.identifier
+
         return self.get_main_information()['ParentSeries']
 
     def get_first_level_tags(self) -> Any:
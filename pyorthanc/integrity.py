@@ -0,0 +1,240 @@
+# coding: utf-8
+# author: gabriel couture
+import csv
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from pyorthanc._util import RateLimiter, Resource, get_descendants, report_progress
+from pyorthanc.bulk import BulkResult
+from pyorthanc.instance import Instance
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+INTACT = 'Intact'
+CORRUPTED = 'Corrupted'
+MISSING = 'Missing'
+
+CHECKPOINT_COLUMNS = ['InstanceID', 'Attachment', 'Status']
+
+
+class IntegrityReport(BulkResult):
+    """Outcome of an attachment verification
+
+    `results` maps the identifier of each verified instance to the status
+    ('Intact', 'Corrupted' or 'Missing') of each of its attachments, and
+    `errors` maps the identifier of each instance that could not be verified
+    (e.g. a network error) to the raised exception.
+    """
+
+    def get_corrupted(self) -> Dict[str, List[str]]:
+        """Get the attachments whose content does not match their MD5
+
+        Returns
+        -------
+        Dict[str, List[str]]
+            Instance identifier -> names of the corrupted attachments.
+        """
+        return self._get_attachments_with_status(CORRUPTED)
+
+    def get_missing(self) -> Dict[str, List[str]]:
+        """Get the attachments whose file is missing from the storage
+
+        Returns
+        -------
+        Dict[str, List[str]]
+            Instance identifier -> names of the missing attachments.
+        """
+        return self._get_attachments_with_status(MISSING)
+
+    def is_intact(self) -> bool:
+        """Check if all the attachments were verified and are intact
+
+        Returns
+        -------
+        bool
+            True if there is no error, no corrupted and no missing attachment.
+        """
+        return self.is_successful() and not self.get_corrupted() and not self.get_missing()
+
+    def _get_attachments_with_status(self, status: str) -> Dict[str, List[str]]:
+        attachments_with_status = {}
+        for identifier, statuses in self.results.items():
+            names = [name for name, s in statuses.items() if s == status]
+            if names:
+                attachments_with_status[identifier] = names
+
+        return attachments_with_status
+
+    def __str__(self):
+        return (
+            f'IntegrityReport (verified={len(self.results)}, corrupted={len(self.get_corrupted())}, '
+            f'missing={len(self.get_missing())}, failed={len(self.errors)})'
+        )
+
+
+def verify_attachments(
+        orthanc: 'Orthanc',
+        resources: Optional[Iterable[Union[Resource, str]]] = None,
+        attachments: Optional[Sequence[str]] = ('dicom',),
+        max_nbr_workers: int = 4,
+        max_nbr_requests_per_second: Optional[float] = None,
+        checkpoint_path: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, int], Any]] = None) -> IntegrityReport:
+    """Verify the MD5 of the stored attachments of many instances concurrently
+
+    Each attachment is checked by Orthanc (`post_attachment_verify_md5`),
+    which reads the file from its storage and compares it with the MD5
+    recorded when it was stored, so no file goes through the network.
+    At most `max_nbr_workers` verifications run at the same time, and
+    `max_nbr_requests_per_second` bounds the load put on the server (and
+    its storage) while it serves its usual traffic.
+
+    When `checkpoint_path` is given, the statuses of each verified instance
+    are appended to this CSV file. Instances already in the file are not
+    verified again, so an interrupted scan can simply be restarted, and
+    their statuses are part of the returned report.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    resources
+        Patients, studies, series or instances (objects or instance identifiers)
+        whose instances are verified. All the instances of the server if None.
+    attachments
+        Names of the attachments to verify. All the attachments of each instance if None.
+    max_nbr_workers
+        Maximum number of verifications running at the same time.
+    max_nbr_requests_per_second
+        Maximum number of requests sent per second. Unlimited if None.
+    checkpoint_path
+        Path of the CSV file that stores the verified instances.
+    progress_callback
+        Called with (number of processed instances, total number of instances)
+        each time an instance is processed.
+
+    Returns
+    -------
+    IntegrityReport
+        Instance identifier -> attachment name -> status, and errors.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> report = verify_attachments(
+    ...     orthanc, max_nbr_workers=8, max_nbr_requests_per_second=200, checkpoint_path='./audit.csv'
+    ... )
+    >>> report.get_corrupted()  # {'instance identifier': ['dicom'], ...}
+    >>> report.get_missing()
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    report = IntegrityReport()
+    if checkpoint_path is not None:
+        report.results.update(read_checkpoint(checkpoint_path))
+
+    if resources is None:
+        instance_identifiers: Iterable[str] = (str(i) for i in orthanc.iterate_instances())
+        total = orthanc.get_statistics()['CountInstances']
+    else:
+        instance_identifiers = list(dict.fromkeys(_iterate_instance_identifiers(resources)))
+        total = len(set(instance_identifiers) | set(report.results))
+
+    rate_limiter = RateLimiter(max_nbr_requests_per_second)
+    lock = threading.Lock()
+    # Bounds the number of submitted verifications, so a whole archive is never listed in memory
+    slots = threading.BoundedSemaphore(2 * max_nbr_workers)
+
+    def verify(instance_identifier: str) -> None:
+        try:
+            names = attachments
+            if names is None:
+                rate_limiter.wait()
+                names = orthanc.get_attachments('instances', instance_identifier)
+
+            statuses = {}
+            for name in names:
+                rate_limiter.wait()
+                statuses[name] = _verify_attachment(orthanc, instance_identifier, name)
+        except Exception as error:
+            with lock:
+                report.errors[instance_identifier] = error
+                report_progress(progress_callback, report, total)
+            return
+        finally:
+            slots.release()
+
+        with lock:
+            report.results[instance_identifier] = statuses
+            if checkpoint_path is not None:
+                _append_to_checkpoint(checkpoint_path, instance_identifier, statuses)
+            report_progress(progress_callback, report, total)
+
+    with ThreadPoolExecutor(max_workers=max_nbr_workers) as executor:
+        for instance_identifier in instance_identifiers:
+            if instance_identifier in report.results:
+                continue
+            slots.acquire()
+            executor.submit(verify, instance_identifier)
+
+    return report
+
+
+def read_checkpoint(checkpoint_path: str) -> Dict[str, Dict[str, str]]:
+    """Read the checkpoint of an attachment verification
+
+    Parameters
+    ----------
+    checkpoint_path
+        Path of the CSV file written by `verify_attachments`.
+
+    Returns
+    -------
+    Dict[str, Dict[str, str]]
+        Instance identifier -> attachment name -> status (empty if the file does not exist).
+    """
+    if not os.path.exists(checkpoint_path):
+        return {}
+
+    statuses: Dict[str, Dict[str, str]] = {}
+    with open(checkpoint_path, 'r', newline='') as file_handler:
+        for row in csv.DictReader(file_handler):
+            statuses.setdefault(row['InstanceID'], {})[row['Attachment']] = row['Status']
+
+    return statuses
+
+
+def _verify_attachment(orthanc: 'Orthanc', instance_identifier: str, name: str) -> str:
+    import requests
+
+    try:
+        orthanc.post_attachment_verify_md5('instances', instance_identifier, name)
+    except requests.HTTPError as error:
+        message = str(error)
+        if 'Corrupted file' in message:
+            return CORRUPTED
+        if message.startswith('HTTP code: 404') and 'Unknown resource' not in message:
+            return MISSING  # The attachment is recorded, but its file is not in the storage
+        raise
+
+    return INTACT
+
+
+def _append_to_checkpoint(checkpoint_path: str, instance_identifier: str, statuses: Dict[str, str]) -> None:
+    is_new_file = not os.path.exists(checkpoint_path) or os.path.getsize(checkpoint_path) == 0
+
+    with open(checkpoint_path, 'a', newline='') as file_handler:
+        writer = csv.writer(file_handler)
+        if is_new_file:
+            writer.writerow(CHECKPOINT_COLUMNS)
+        writer.writerows([instance_identifier, name, status] for name, status in statuses.items())
+
+
+def _iterate_instance_identifiers(resources: Iterable[Union[Resource, str]]) -> Iterator[str]:
+    for resource in resources:
+        if isinstance(resource, str):
+            yield resource
+        else:
+            yield from (i.get_identifier() for i in get_descendants(resource, Instance))
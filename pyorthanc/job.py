@@ -0,0 +1,528 @@
+# coding: utf-8
+# author: gabriel couture
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+FINAL_STATES = ('Success', 'Failure')
+CANCELED_JOB_ERROR_CODE = 37  # Orthanc's ErrorCode_CanceledJob
+EVICTED_JOB_ERROR_CODE = 17  # Orthanc's ErrorCode_UnknownResource
+
+
+class JobFailedError(Exception):
+    """Raised when an Orthanc job ends in the 'Failure' state"""
+
+    def __init__(self, job_identifier: str, information: Dict) -> None:
+        super().__init__(
+            f"Job {job_identifier} failed with error code {information.get('ErrorCode')}: "
+            f"{information.get('ErrorDescription')}"
+        )
+        self.job_identifier = job_identifier
+        self.information = information
+
+
+class Job:
+    """Future-like handle on an asynchronous Orthanc job
+
+    The job state is polled with an adaptive backoff: the first poll happens
+    after `initial_poll_interval` seconds, and the interval is multiplied by
+    `backoff_factor` at each poll, up to `max_poll_interval`. When the job is
+    watched by a `JobWatcher`, its state is updated by the watcher (a single
+    `/jobs?expand` request for all the watched jobs) and the job never polls
+    by itself.
+    """
+
+    def __init__(
+            self, job_identifier: str,
+            orthanc: 'Orthanc',
+            watcher: Optional['JobWatcher'] = None,
+            initial_poll_interval: float = 0.05,
+            max_poll_interval: float = 2.0,
+            backoff_factor: float = 1.5) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        job_identifier
+            Orthanc job identifier.
+        orthanc
+            Orthanc object.
+        watcher
+            JobWatcher that polls the state of this job. If None, the job polls by itself.
+        initial_poll_interval
+            Delay (in seconds) before the first poll.
+        max_poll_interval
+            Maximum delay (in seconds) between two polls.
+        backoff_factor
+            Factor applied to the delay after each poll.
+        """
+        self.orthanc = orthanc
+        self.identifier = job_identifier
+        self.watcher = watcher
+
+        self.initial_poll_interval = initial_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff_factor = backoff_factor
+
+        self._information: Dict = {}
+        self._callbacks: List[Callable[['Job'], Any]] = []
+        self._condition = threading.Condition()
+
+        if watcher is not None:
+            watcher.watch(self)
+
+    def get_identifier(self) -> str:
+        """Get job identifier
+
+        Returns
+        -------
+        str
+            Job identifier.
+        """
+        return self.identifier
+
+    def get_information(self, refresh: bool = False) -> Dict:
+        """Get the last known job information
+
+        Parameters
+        ----------
+        refresh
+            If True, poll Orthanc before returning (ignored if the job is
+            watched by a JobWatcher or is already done).
+
+        Returns
+        -------
+        Dict
+            Job information (State, Progress, Content, ErrorCode, ...).
+        """
+        if (refresh or not self._information) and self.watcher is None and not self._is_final():
+            self.update(_get_job_information(self.orthanc, self.identifier, self._information))
+
+        with self._condition:
+            return dict(self._information)
+
+    def get_state(self) -> str:
+        """Get job state
+
+        Returns
+        -------
+        str
+            'Pending', 'Running', 'Success', 'Failure', 'Paused' or 'Retry'.
+        """
+        return self.get_information(refresh=True).get('State', 'Pending')
+
+    def get_progress(self) -> int:
+        """Get job progress
+
+        Returns
+        -------
+        int
+            Progress in percent.
+        """
+        return self.get_information(refresh=True).get('Progress', 0)
+
+    def done(self) -> bool:
+        """Return True if the job succeeded, failed or was canceled"""
+        return self.get_state() in FINAL_STATES
+
+    def running(self) -> bool:
+        """Return True if the job is pending, running, paused or waiting for a retry"""
+        return not self.done()
+
+    def cancelled(self) -> bool:
+        """Return True if the job was canceled"""
+        information = self.get_information(refresh=True)
+
+        return information.get('State') == 'Failure' and information.get('ErrorCode') == CANCELED_JOB_ERROR_CODE
+
+    def result(self, timeout: Optional[float] = None) -> Dict:
+        """Wait for the job and return its content
+
+        Parameters
+        ----------
+        timeout
+            Maximum time to wait (in seconds). Wait forever if None.
+
+        Returns
+        -------
+        Dict
+            Job content (e.g. for an anonymization, the 'ID' and 'Path' of the new resource).
+
+        Raises
+        ------
+        concurrent.futures.TimeoutError
+            If the job is not done before the timeout.
+        concurrent.futures.CancelledError
+            If the job was canceled.
+        JobFailedError
+            If the job failed.
+        """
+        information = self._wait(timeout)
+
+        if information['State'] == 'Success':
+            return information.get('Content', {})
+
+        if information.get('ErrorCode') == CANCELED_JOB_ERROR_CODE:
+            raise CancelledError(f'Job {self.identifier} was canceled')
+
+        raise JobFailedError(self.identifier, information)
+
+    def exception(self, timeout: Optional[float] = None) -> Optional[BaseException]:
+        """Wait for the job and return the exception that `result` would raise (None if it succeeded)"""
+        try:
+            self.result(timeout)
+        except (CancelledError, JobFailedError) as error:
+            return error
+
+        return None
+
+    def cancel(self) -> bool:
+        """Cancel the job
+
+        Returns
+        -------
+        bool
+            True if the cancellation was requested or the job was already
+            canceled, False if the job was already done.
+        """
+        if self.done():
+            return self.cancelled()
+
+        self.orthanc.cancel_job(self.identifier)
+
+        return True
+
+    def pause(self) -> None:
+        """Pause the job"""
+        self.orthanc.pause_job(self.identifier)
+
+    def resume(self) -> None:
+        """Resume a paused job"""
+        self.orthanc.resume_job(self.identifier)
+
+    def resubmit(self) -> None:
+        """Resubmit a failed job"""
+        self.orthanc.resubmit_job(self.identifier)
+
+        with self._condition:
+            self._information = {}
+        if self.watcher is not None:
+            self.watcher.watch(self)
+
+    def get_output(self, key: str) -> Any:
+        """Get an output of a successful job
+
+        Parameters
+        ----------
+        key
+            Output name (e.g. 'archive' for archive and media jobs).
+
+        Returns
+        -------
+        Any
+            Output content.
+        """
+        self.result()
+
+        return self.orthanc.get_job_output(self.identifier, key)
+
+    def add_done_callback(self, callback: Callable[['Job'], Any]) -> None:
+        """Call `callback(job)` when the job is done
+
+        The callback is called by the thread that observes the end of the job
+        (the watcher thread or the thread waiting on `result`). It is called
+        immediately if the job is already known to be done.
+        """
+        with self._condition:
+            if not self._is_final():
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def update(self, information: Dict) -> None:
+        """Update the job with information retrieved from Orthanc
+
+        This is called by polls; there is no need to call it directly.
+        """
+        with self._condition:
+            was_final = self._is_final()
+            self._information = information
+
+            if was_final or not self._is_final():
+                return
+
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notify_all()
+
+        for callback in callbacks:
+            callback(self)
+
+    def _is_final(self) -> bool:
+        return self._information.get('State') in FINAL_STATES
+
+    def _wait(self, timeout: Optional[float]) -> Dict:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        poll_interval = self.initial_poll_interval
+
+        with self._condition:
+            if self.watcher is not None:
+                if not self._condition.wait_for(self._is_final, timeout):
+                    raise TimeoutError(f'Job {self.identifier} is not done after {timeout} seconds')
+                return dict(self._information)
+
+        while True:
+            information = self.get_information(refresh=True)
+            if information.get('State') in FINAL_STATES:
+                return information
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f'Job {self.identifier} is not done after {timeout} seconds')
+
+            time.sleep(poll_interval if remaining is None else min(poll_interval, remaining))
+            poll_interval = min(poll_interval * self.backoff_factor, self.max_poll_interval)
+
+    def __str__(self):
+        return f'Job (identifier={self.identifier}, state={self._information.get("State", "Unknown")})'
+
+
+class JobWatcher:
+    """Poll the state of many jobs with a single `/jobs?expand` request
+
+    A daemon thread is started when a job is watched, and stops by itself
+    when all the watched jobs are done. The polling interval follows the same
+    adaptive backoff as `Job`, and is reset each time a job completes.
+
+    Orthanc only keeps the last finished jobs in its history
+    (`JobsHistorySize`), so a watched job that is missing from the listing
+    is polled individually. If it was evicted from the history before
+    being seen done, it is settled as a 'Failure', since its result is lost.
+
+    Examples
+    --------
+    >>> watcher = JobWatcher(orthanc)
+    >>> jobs = [submit_job(orthanc.anonymize_study, i, watcher=watcher) for i in orthanc.get_studies()]
+    >>> for job in as_completed(jobs):
+    ...     print(job.result()['ID'])
+    """
+
+    def __init__(
+            self, orthanc: 'Orthanc',
+            initial_poll_interval: float = 0.05,
+            max_poll_interval: float = 2.0,
+            backoff_factor: float = 1.5) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        orthanc
+            Orthanc object.
+        initial_poll_interval
+            Delay (in seconds) between the first polls.
+        max_poll_interval
+            Maximum delay (in seconds) between two polls.
+        backoff_factor
+            Factor applied to the delay after each poll where no job completed.
+        """
+        self.orthanc = orthanc
+        self.initial_poll_interval = initial_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff_factor = backoff_factor
+
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, job: Job) -> None:
+        """Add a job to the watched jobs"""
+        with self._lock:
+            self._jobs[job.get_identifier()] = job
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def get_number_of_watched_jobs(self) -> int:
+        """Get the number of jobs that are not done yet"""
+        with self._lock:
+            return len(self._jobs)
+
+    def poll(self) -> int:
+        """Update all the watched jobs with a single request
+
+        Returns
+        -------
+        int
+            Number of jobs that completed during this poll.
+        """
+        with self._lock:
+            jobs = dict(self._jobs)
+        if not jobs:
+            return 0
+
+        listed_information = {i['ID']: i for i in self.orthanc.get_jobs({'expand': ''})}
+
+        nbr_of_completed_jobs = 0
+        for identifier, job in jobs.items():
+            information = listed_information.get(identifier)
+            if information is None:
+                try:
+                    information = _get_job_information(self.orthanc, identifier, job.get_information())
+                except Exception:  # Transient HTTP error, the job is polled again at the next poll
+                    continue
+
+            job.update(information)
+            if information.get('State') in FINAL_STATES:
+                nbr_of_completed_jobs += 1
+                with self._lock:
+                    self._jobs.pop(identifier, None)
+
+        return nbr_of_completed_jobs
+
+    def _run(self) -> None:
+        poll_interval = self.initial_poll_interval
+
+        while True:
+            time.sleep(poll_interval)
+
+            try:
+                nbr_of_completed_jobs = self.poll()
+            except Exception:  # Keep watching through transient HTTP errors
+                nbr_of_completed_jobs = 0
+
+            if nbr_of_completed_jobs > 0:
+                poll_interval = self.initial_poll_interval
+            else:
+                poll_interval = min(poll_interval * self.backoff_factor, self.max_poll_interval)
+
+            with self._lock:
+                if not self._jobs:
+                    self._thread = None
+                    return
+
+
+def submit_job(
+        operation: Callable[..., Dict],
+        *args: Any,
+        data: Optional[Dict] = None,
+        watcher: Optional[JobWatcher] = None,
+        **job_parameters: Any) -> Job:
+    """Start an Orthanc operation as an asynchronous job
+
+    The request body is sent with `'Asynchronous': True`.
+
+    Parameters
+    ----------
+    operation
+        Bound method of an Orthanc object that accepts a request body as
+        last argument (e.g. `orthanc.anonymize_study`, `orthanc.modify_series`,
+        `orthanc.create_archive`, `orthanc.move_query_results_to_given_modality`).
+    args
+        Positional arguments of the operation, before the request body.
+    data
+        Request body.
+    watcher
+        JobWatcher that will poll the job.
+    job_parameters
+        Polling parameters of the Job.
+
+    Returns
+    -------
+    Job
+        Handle on the started job.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> job = submit_job(orthanc.anonymize_study, 'A_STUDY_IDENTIFIER', data={'Keep': ['StudyDescription']})
+    >>> job.result(timeout=60)['ID']
+    """
+    response = operation(*args, {**(data or {}), 'Asynchronous': True})
+
+    return Job(response['ID'], operation.__self__, watcher, **job_parameters)  # type: ignore
+
+
+def as_completed(jobs: Iterable[Job], timeout: Optional[float] = None) -> Iterator[Job]:
+    """Yield jobs as they complete
+
+    Jobs that are not watched by a JobWatcher are polled individually.
+
+    Parameters
+    ----------
+    jobs
+        Jobs to wait for.
+    timeout
+        Maximum time to wait (in seconds) for all the jobs. Wait forever if None.
+
+    Returns
+    -------
+    Iterator[Job]
+        Jobs, in completion order.
+
+    Raises
+    ------
+    concurrent.futures.TimeoutError
+        If some jobs are not done before the timeout.
+    """
+    import queue
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    done_jobs: 'queue.Queue[Job]' = queue.Queue()
+
+    pending = list(jobs)
+    unwatched = [job for job in pending if job.watcher is None]
+    for job in pending:
+        if job.watcher is not None:
+            job.add_done_callback(done_jobs.put)
+
+    nbr_of_remaining_jobs = len(pending)
+    poll_interval = min([job.initial_poll_interval for job in unwatched], default=0.05)
+    max_poll_interval = max([job.max_poll_interval for job in unwatched], default=2.0)
+
+    while nbr_of_remaining_jobs > 0:
+        for job in list(unwatched):
+            if job.done():
+                unwatched.remove(job)
+                done_jobs.put(job)
+
+        wait = poll_interval if unwatched else None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and done_jobs.empty():
+                raise TimeoutError(f'{nbr_of_remaining_jobs} jobs are not done after {timeout} seconds')
+            remaining = max(remaining, 0)
+            wait = remaining if wait is None else min(wait, remaining)
+
+        try:
+            job = done_jobs.get(timeout=wait)
+        except queue.Empty:
+            poll_interval = min(poll_interval * 1.5, max_poll_interval)
+            continue
+
+        nbr_of_remaining_jobs -= 1
+        yield job
+        while not done_jobs.empty():
+            nbr_of_remaining_jobs -= 1
+            yield done_jobs.get()
+
+
+def _get_job_information(orthanc: 'Orthanc', job_identifier: str, last_information: Dict) -> Dict:
+    try:
+        return orthanc.get_job_information(job_identifier)
+    except Exception as error:
+        if 'HTTP code: 404' not in str(error):
+            raise
+
+    # Orthanc dropped the finished job from its history (JobsHistorySize) before it was seen done
+    return {
+        **last_information,
+        'ID': job_identifier,
+        'State': 'Failure',
+        'ErrorCode': EVICTED_JOB_ERROR_CODE,
+        'ErrorDescription': 'Job evicted from the Orthanc jobs history (JobsHistorySize) before its result was read'
+    }
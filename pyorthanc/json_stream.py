@@ -0,0 +1,129 @@
+# coding: utf-8
+# author: gabriel couture
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator
+
+WHITESPACES = re.compile(r'[ \t\n\r]*')
+END_OF_NUMBER = re.compile(r'[^0-9eE.+\-]')
+
+
+def iterate_json_items(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Parse a JSON array or object from a stream of chunks, item by item
+
+    Each item is decoded (with the standard json decoder) as soon as its
+    last byte is received, so only one item is held in memory at a time.
+
+    Parameters
+    ----------
+    chunks
+        Chunks of a UTF-8 JSON document whose top-level value is an array or an object.
+
+    Returns
+    -------
+    Iterator[Any]
+        The values of an array, or the (key, value) pairs of an object.
+
+    Raises
+    ------
+    ValueError
+        If the document is not valid JSON, or is not an array or an object.
+
+    Examples
+    --------
+    >>> list(iterate_json_items([b'{"a": [1, 2', b'], "b": null}']))
+    [('a', [1, 2]), ('b', None)]
+    """
+    reader = _JsonStreamReader(chunks)
+
+    opening = reader.read_char()
+    if opening not in ('[', '{'):
+        raise ValueError(f'Expected a JSON array or object, got {opening!r}')
+    closing = ']' if opening == '[' else '}'
+
+    if reader.peek_char() == closing:
+        reader.read_char()
+    else:
+        while True:
+            if opening == '[':
+                yield reader.read_value()
+            else:
+                key = reader.read_value()
+                if not isinstance(key, str):
+                    raise ValueError(f'Expected a JSON object key, got {key!r}')
+                reader.expect_char(':')
+                yield key, reader.read_value()
+
+            separator = reader.read_char()
+            if separator == closing:
+                break
+            if separator != ',':
+                raise ValueError(f'Expected "," or "{closing}", got {separator!r}')
+
+    if reader.peek_char() != '':
+        raise ValueError('Extra data after the JSON document')
+
+
+class _JsonStreamReader:
+    """Text buffer over a stream of chunks, with the unread text only"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._position = 0
+        self._is_exhausted = False
+
+    def read_value(self) -> Any:
+        char = self.peek_char()
+        if char != '' and char in '-0123456789':
+            # A number is only complete once the character that follows it is read
+            while not self._is_exhausted and END_OF_NUMBER.search(self._buffer, self._position) is None:
+                self._read_more(len(self._buffer) - self._position)
+
+        while True:
+            try:
+                value, self._position = self._decoder.raw_decode(self._buffer, self._position)
+                return value
+            except json.JSONDecodeError:
+                if self._is_exhausted:
+                    raise
+                self._read_more(len(self._buffer) - self._position)
+
+    def read_char(self) -> str:
+        char = self.peek_char()
+        self._position += len(char)
+
+        return char
+
+    def peek_char(self) -> str:
+        """Skip the whitespaces and return the next character ('' at the end of the stream)"""
+        while True:
+            self._position = WHITESPACES.match(self._buffer, self._position).end()  # type: ignore
+            if self._position < len(self._buffer) or self._is_exhausted:
+                return self._buffer[self._position:self._position + 1]
+            self._read_more(1)
+
+    def expect_char(self, expected: str) -> None:
+        char = self.read_char()
+        if char != expected:
+            raise ValueError(f'Expected {expected!r}, got {char!r}')
+
+    def _read_more(self, min_size: int) -> None:
+        # Reading at least as much as what is already buffered keeps the
+        # total parsing time linear when a value spans many chunks
+        text = [self._buffer[self._position:]]
+        size = 0
+        while size < max(min_size, 1) and not self._is_exhausted:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._is_exhausted = True
+                text.append(self._text_decoder.decode(b'', final=True))
+            else:
+                text.append(self._text_decoder.decode(chunk))
+            size += len(text[-1])
+
+        self._buffer = ''.join(text)
+        self._position = 0
@@ -1,9 +1,10 @@
 # coding: utf-8
 import json
-from typing import List, Dict, Union, Any, Optional
+from typing import TYPE_CHECKING, Iterator, List, Dict, Tuple, Union, Any, Optional
 
-import requests
-from requests.auth import HTTPBasicAuth
+if TYPE_CHECKING:
+    from requests import Response
+    from requests.auth import HTTPBasicAuth
 
 
 class Orthanc:
@@ -25,7 +26,7 @@ class Orthanc:
         self._orthanc_url = orthanc_url
 
         self._credentials_are_set = False
-        self._credentials: Optional[HTTPBasicAuth] = None
+        self._credentials: Optional['HTTPBasicAuth'] = None
 
     def setup_credentials(self, username: str, password: str) -> None:
         """Set credentials needed for HTTP requests
@@ -37,9 +38,17 @@ class Orthanc:
         password
             Password.
         """
+        from requests.auth import HTTPBasicAuth
+
         self._credentials = HTTPBasicAuth(username, password)
         self._credentials_are_set = True
 
+    def _send(self, method: str, route: str, **kwargs: Any) -> 'Response':
+        # Single entry point of the HTTP requests, overridden to send them elsewhere (e.g. OrthancCluster)
+        import requests
+
+        return requests.request(method, route, auth=self._credentials, **kwargs)
+
     def get_request(self, route: str, params: Optional[Dict] = None) -> Any:
         """GET request with specified route
 
@@ -55,7 +64,9 @@ class Orthanc:
         Union[List, Dict, str, bytes, int]
             Response of the HTTP GET request converted to json format.
         """
-        response = requests.get(route, params=params, auth=self._credentials)
+        import requests
+
+        response = self._send('GET', route, params=params)
 
         if response.status_code == 200:
             try:
@@ -68,6 +79,77 @@ class Orthanc:
             f'HTTP code: {response.status_code}, with content: {response.text}'
         )
 
+    def get_request_stream(self, route: str, params: Optional[Dict] = None, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """GET request with specified route, with the response streamed by chunks
+
+        The response is not loaded in memory, which is useful for large
+        downloads such as archives.
+
+        Parameters
+        ----------
+        route
+            HTTP route.
+        params
+            Params with the HTTP GET request.
+        chunk_size
+            Maximum size (in bytes) of the yielded chunks.
+
+        Returns
+        -------
+        Iterator[bytes]
+            Chunks of the response content.
+        """
+        import requests
+
+        with self._send('GET', route, params=params, stream=True) as response:
+            if response.status_code != 200:
+                raise requests.HTTPError(
+                    f'HTTP code: {response.status_code}, with content: {response.text}'
+                )
+
+            for chunk in response.iter_content(chunk_size):
+                yield chunk
+
+    def get_request_items(self, route: str, params: Optional[Dict] = None, chunk_size: int = 1024 * 1024) -> Iterator[Any]:
+        """GET request with specified route, with the JSON response parsed item by item
+
+        The response is parsed while it is downloaded, so the items of a
+        huge JSON array or object can be processed with constant memory.
+
+        Parameters
+        ----------
+        route
+            HTTP route.
+        params
+            Params with the HTTP GET request.
+        chunk_size
+            Maximum size (in bytes) of the chunks read from the network.
+
+        Returns
+        -------
+        Iterator[Any]
+            The values of a JSON array, or the (key, value) pairs of a JSON object.
+        """
+        from pyorthanc.json_stream import iterate_json_items
+
+        return iterate_json_items(self.get_request_stream(route, params, chunk_size))
+
+    def _iterate_resources(self, route: str, page_size: int, expand: bool) -> Iterator[Union[str, Dict]]:
+        # "since" is an offset in the list of resources, so resources added or
+        # deleted during the iteration may shift the following pages
+        since = 0
+        while True:
+            params: Dict[str, Any] = {'since': since, 'limit': page_size}
+            if expand:
+                params['expand'] = ''
+
+            page = self.get_request(f'{self._orthanc_url}/{route}', params)
+            yield from page
+
+            if len(page) < page_size:
+                return
+            since += len(page)
+
     def delete_request(self, route: str) -> bool:
         """DELETE to specified route
 
@@ -81,7 +163,9 @@ class Orthanc:
         bool
             True if the HTTP DELETE request succeeded (HTTP code 200).
         """
-        response = requests.delete(route, auth=self._credentials)
+        import requests
+
+        response = self._send('DELETE', route)
 
         if response.status_code == 200:
             return True
@@ -108,10 +192,12 @@ class Orthanc:
         Union[Dict, str, bytes, int]
             Response of the HTTP POST request converted to json format.
         """
+        import requests
+
         if type(data) != bytes:
             data = json.dumps(data)
 
-        response = requests.post(route, data=data, auth=self._credentials)  # type: ignore
+        response = self._send('POST', route, data=data)
 
         if response.status_code == 200:
             try:
@@ -139,7 +225,9 @@ class Orthanc:
         None
             Nothing, raise if a problem occurs.
         """
-        response = requests.put(route, data=json.dumps(data), auth=self._credentials)
+        import requests
+
+        response = self._send('PUT', route, data=json.dumps(data))
 
         if response.status_code == 200:
             return
@@ -724,6 +812,32 @@ class Orthanc:
         """
         return self.get_request(f'{self._orthanc_url}/instances')
 
+    def iterate_instances(self, page_size: int = 1000, expand: bool = False) -> Iterator[Union[str, Dict]]:
+        """Iterate over instances, one page at a time
+
+        The instances are read with "since" and "limit", so the whole list
+        is never loaded at once and the first instance is available after the first page.
+
+        Parameters
+        ----------
+        page_size
+            Number of instances read by each request.
+        expand
+            If True, yield the instance information instead of the identifiers.
+
+        Returns
+        -------
+        Iterator[Union[str, Dict]]
+            Instance identifiers (or information, if `expand`).
+
+        Examples
+        --------
+        >>> orthanc = Orthanc('http://localhost:8042')
+        >>> for instance_identifier in orthanc.iterate_instances(page_size=500):
+        ...     print(instance_identifier)
+        """
+        return self._iterate_resources('instances', page_size, expand)
+
     def post_instances(self, data: Optional[Union[Dict, str, int, bytes]] = None) -> Any:
         """Post instances
 
@@ -1735,6 +1849,31 @@ class Orthanc:
             params
         )
 
+    def get_job_output_stream(self, job_identifier: str, key: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Get an output generated by the job, streamed by chunks
+
+        Same as `get_job_output`, without loading the output in memory
+        (e.g. the 'archive' output of an asynchronous archive job).
+
+        Parameters
+        ----------
+        job_identifier
+            Job identifier.
+        key
+            Key to get output
+        chunk_size
+            Maximum size (in bytes) of the yielded chunks.
+
+        Returns
+        -------
+        Iterator[bytes]
+            Chunks of the output generated by the job.
+        """
+        return self.get_request_stream(
+            f'{self._orthanc_url}/jobs/{job_identifier}/{key}',
+            chunk_size=chunk_size
+        )
+
     def get_modalities(self, params: Dict = None) -> Any:
         """Get modalities
 
@@ -1923,6 +2062,32 @@ class Orthanc:
         """
         return self.get_request(f'{self._orthanc_url}/patients')
 
+    def iterate_patients(self, page_size: int = 1000, expand: bool = False) -> Iterator[Union[str, Dict]]:
+        """Iterate over patients, one page at a time
+
+        The patients are read with "since" and "limit", so the whole list
+        is never loaded at once and the first patient is available after the first page.
+
+        Parameters
+        ----------
+        page_size
+            Number of patients read by each request.
+        expand
+            If True, yield the patient information instead of the identifiers.
+
+        Returns
+        -------
+        Iterator[Union[str, Dict]]
+            Patient identifiers (or information, if `expand`).
+
+        Examples
+        --------
+        >>> orthanc = Orthanc('http://localhost:8042')
+        >>> for patient_identifier in orthanc.iterate_patients(page_size=500):
+        ...     print(patient_identifier)
+        """
+        return self._iterate_resources('patients', page_size, expand)
+
     def get_patient_information(self, patient_identifier: str) -> Dict:
         """Get patient main information
 
@@ -2024,6 +2189,36 @@ class Orthanc:
             f'{self._orthanc_url}/patients/{patient_identifier}/archive'
         )
 
+    def get_patient_zip_stream(self, patient_identifier: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Get the zip file of a patient, streamed by chunks
+
+        Same as `get_patient_zip`, without loading the zip file in memory.
+
+        Parameters
+        ----------
+        patient_identifier
+            Patient identifier.
+        chunk_size
+            Maximum size (in bytes) of the yielded chunks.
+
+        Returns
+        -------
+        Iterator[bytes]
+            Chunks of the zip file of the patient.
+
+        Examples
+        --------
+        >>> orthanc = Orthanc('http://localhost:8042')
+        >>> with open('patient_zip_file_path.zip', 'wb') as file_handler:
+        ...     for chunk in orthanc.get_patient_zip_stream(orthanc.get_patients()[0]):
+        ...         file_handler.write(chunk)
+
+        """
+        return self.get_request_stream(
+            f'{self._orthanc_url}/patients/{patient_identifier}/archive',
+            chunk_size=chunk_size
+        )
+
     def archive_patient(self, patient_identifier: str, data: Optional[Union[Dict, str, int, bytes]] = None) -> bytes:
         """Archive patient
 
@@ -2090,6 +2285,29 @@ class Orthanc:
             f'{self._orthanc_url}/patients/{patient_identifier}/instances-tags',
         )
 
+    def iterate_patient_instances_tags(self, patient_identifier: str, simplify: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Iterate over the tags of all patient's instances, while they are downloaded
+
+        Same as `get_patient_instances_tags`, but the response is parsed
+        incrementally, so only the tags of one instance are in memory at a time.
+
+        Parameters
+        ----------
+        patient_identifier
+            Patient identifier.
+        simplify
+            If True, get the simplified tags (readable for humans).
+
+        Returns
+        -------
+        Iterator[Tuple[str, Dict]]
+            (instance identifier, instance tags) pairs.
+        """
+        return self.get_request_items(
+            f'{self._orthanc_url}/patients/{patient_identifier}/instances-tags',
+            {'simplify': ''} if simplify else None
+        )
+
     def get_patient_instances_tags_in_simplified_version(self, patient_identifier: str) -> Dict:
         """Get tags of all patient's instances in a simplified version
 
@@ -2996,6 +3214,32 @@ class Orthanc:
             params
         )
 
+    def iterate_series(self, page_size: int = 1000, expand: bool = False) -> Iterator[Union[str, Dict]]:
+        """Iterate over series, one page at a time
+
+        The series are read with "since" and "limit", so the whole list
+        is never loaded at once and the first series is available after the first page.
+
+        Parameters
+        ----------
+        page_size
+            Number of series read by each request.
+        expand
+            If True, yield the series information instead of the identifiers.
+
+        Returns
+        -------
+        Iterator[Union[str, Dict]]
+            Series identifiers (or information, if `expand`).
+
+        Examples
+        --------
+        >>> orthanc = Orthanc('http://localhost:8042')
+        >>> for series_identifier in orthanc.iterate_series(page_size=500):
+        ...     print(series_identifier)
+        """
+        return self._iterate_resources('series', page_size, expand)
+
     def get_series_information(self, series_identifier: str, params: Dict = None) -> Any:
         """Get series information
 
@@ -3076,6 +3320,36 @@ class Orthanc:
             params
         )
 
+    def get_series_zip_stream(self, series_identifier: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Get the zip file of a series, streamed by chunks
+
+        Same as `get_series_zip_file`, without loading the zip file in memory.
+
+        Parameters
+        ----------
+        series_identifier
+            Series identifier.
+        chunk_size
+            Maximum size (in bytes) of the yielded chunks.
+
+        Returns
+        -------
+        Iterator[bytes]
+            Chunks of the zip file of the series.
+
+        Examples
+        --------
+        >>> orthanc = Orthanc('http://localhost:8042')
+        >>> with open('series_zip_file_path.zip', 'wb') as file_handler:
+        ...     for chunk in orthanc.get_series_zip_stream(orthanc.get_series()[0]):
+        ...         file_handler.write(chunk)
+
+        """
+        return self.get_request_stream(
+            f'{self._orthanc_url}/series/{series_identifier}/archive',
+            chunk_size=chunk_size
+        )
+
     def create_series_zip_file(
             self, series_identifier: str,
             data: Optional[Union[Dict, str, int, bytes]] = None) -> Any:
@@ -3141,6 +3415,29 @@ class Orthanc:
             params
         )
 
+    def iterate_series_instances_tags(self, series_identifier: str, simplify: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Iterate over the tags of all series' instances, while they are downloaded
+
+        Same as `get_series_instances_tags`, but the response is parsed
+        incrementally, so only the tags of one instance are in memory at a time.
+
+        Parameters
+        ----------
+        series_identifier
+            Series identifier.
+        simplify
+            If True, get the simplified tags (readable for humans).
+
+        Returns
+        -------
+        Iterator[Tuple[str, Dict]]
+            (instance identifier, instance tags) pairs.
+        """
+        return self.get_request_items(
+            f'{self._orthanc_url}/series/{series_identifier}/instances-tags',
+            {'simplify': ''} if simplify else None
+        )
+
     def get_series_instances_tags_in_simplified_version(self, series_identifier: str, params: Dict = None) -> Any:
         """Get series instances tags in a simplified version
 
@@ -3507,6 +3804,32 @@ class Orthanc:
             f'{self._orthanc_url}/studies'
         )
 
+    def iterate_studies(self, page_size: int = 1000, expand: bool = False) -> Iterator[Union[str, Dict]]:
+        """Iterate over studies, one page at a time
+
+        The studies are read with "since" and "limit", so the whole list
+        is never loaded at once and the first study is available after the first page.
+
+        Parameters
+        ----------
+        page_size
+            Number of studies read by each request.
+        expand
+            If True, yield the study information instead of the identifiers.
+
+        Returns
+        -------
+        Iterator[Union[str, Dict]]
+            Study identifiers (or information, if `expand`).
+
+        Examples
+        --------
+        >>> orthanc = Orthanc('http://localhost:8042')
+        >>> for study_identifier in orthanc.iterate_studies(page_size=500):
+        ...     print(study_identifier)
+        """
+        return self._iterate_resources('studies', page_size, expand)
+
     def get_study_information(self, study_identifier: str) -> Dict:
         """Get study information
 
@@ -3581,6 +3904,36 @@ class Orthanc:
             f'{self._orthanc_url}/studies/{study_identifier}/archive'
         )
 
+    def get_study_zip_stream(self, study_identifier: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Get the zip file of a study, streamed by chunks
+
+        Same as `get_study_zip_file`, without loading the zip file in memory.
+
+        Parameters
+        ----------
+        study_identifier
+            Study identifier.
+        chunk_size
+            Maximum size (in bytes) of the yielded chunks.
+
+        Returns
+        -------
+        Iterator[bytes]
+            Chunks of the zip file of the study.
+
+        Examples
+        --------
+        >>> orthanc = Orthanc('http://localhost:8042')
+        >>> with open('study_zip_file_path.zip', 'wb') as file_handler:
+        ...     for chunk in orthanc.get_study_zip_stream(orthanc.get_studies()[0]):
+        ...         file_handler.write(chunk)
+
+        """
+        return self.get_request_stream(
+            f'{self._orthanc_url}/studies/{study_identifier}/archive',
+            chunk_size=chunk_size
+        )
+
     def create_study_zip_file(self, study_identifier: str, data: Optional[Union[Dict, str, int, bytes]] = None) -> Any:
         """Create study zip file
 
@@ -3641,6 +3994,29 @@ class Orthanc:
             f'{self._orthanc_url}/studies/{study_identifier}/instances-tags'
         )
 
+    def iterate_study_instances_tags(self, study_identifier: str, simplify: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Iterate over the tags of all study's instances, while they are downloaded
+
+        Same as `get_study_instances_tags`, but the response is parsed
+        incrementally, so only the tags of one instance are in memory at a time.
+
+        Parameters
+        ----------
+        study_identifier
+            Study identifier.
+        simplify
+            If True, get the simplified tags (readable for humans).
+
+        Returns
+        -------
+        Iterator[Tuple[str, Dict]]
+            (instance identifier, instance tags) pairs.
+        """
+        return self.get_request_items(
+            f'{self._orthanc_url}/studies/{study_identifier}/instances-tags',
+            {'simplify': ''} if simplify else None
+        )
+
     def get_study_instances_tags_in_simplified_version(self, study_identifier: str) -> Dict:
         """Get study instances tags in a simplified version
 
@@ -1,9 +1,11 @@
 # coding: utf-8
 # author: gabriel couture
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 
 from pyorthanc.study import Study
-from pyorthanc.orthanc import Orthanc
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
 
 
 class Patient:
@@ -15,7 +17,7 @@ class Patient:
 
     def __init__(
             self, patient_identifier: str,
-            orthanc: Orthanc,
+            orthanc: 'Orthanc',
             patient_information: Dict = None) -> None:
         """Constructor
 
@@ -32,6 +34,7 @@ class Patient:
 
         self.identifier = patient_identifier
         self.information = patient_information
+        self._parsed_datetimes: Dict[Tuple[str, Optional[str]], Optional[str]] = {}  # See pyorthanc.dates
 
         self.studies: List[Study] = []
 
@@ -184,6 +187,8 @@ class Patient:
             lambda i: Study(i['ID'], self.orthanc),
             studies_information
         ))
+        for study in self.studies:
+            study.parent = self
 
     def anonymize(self) -> 'Patient':
         """Anonymize patient
@@ -0,0 +1,176 @@
+# coding: utf-8
+# author: gabriel couture
+import collections
+import queue
+import threading
+from typing import TYPE_CHECKING, Any, AsyncIterator, Deque, Iterable, Iterator, Optional, Tuple, Union
+
+from pyorthanc.instance import Instance
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from pyorthanc.orthanc import Orthanc
+
+InstanceOrIdentifier = Union[Instance, str]
+
+
+class InstancePrefetcher:
+    """Iterate over DICOM files while the next ones are downloaded
+
+    Up to `max_nbr_downloads` files are downloaded concurrently ahead of
+    the consumer. No new download starts while the downloaded but not yet
+    consumed files take more than `max_buffered_size` bytes, so memory
+    stays bounded when the consumer is slower than the network.
+
+    The prefetcher is an iterator for thread based pipelines, and an
+    asynchronous iterator for asyncio pipelines (the downloads run in
+    threads, so the event loop is never blocked).
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> for instance, content in InstancePrefetcher(orthanc, orthanc.get_series_information('a_series_identifier')['Instances']):
+    ...     dataset = pydicom.dcmread(io.BytesIO(content))
+
+    >>> async for instance, content in InstancePrefetcher(orthanc, instance_identifiers, ordered=False):
+    ...     await process(content)
+    """
+
+    def __init__(
+            self,
+            orthanc: 'Orthanc',
+            instances: Iterable[InstanceOrIdentifier],
+            max_nbr_downloads: int = 8,
+            max_buffered_size: int = 256 * 1024 ** 2,
+            ordered: bool = True) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        orthanc
+            Orthanc object.
+        instances
+            Instances or instance identifiers (can be a lazy iterable).
+        max_nbr_downloads
+            Maximum number of downloads in flight.
+        max_buffered_size
+            Size (in bytes) of the downloaded files above which no new download starts.
+        ordered
+            If True, files are yielded in the order of `instances`, else as soon as they are downloaded.
+        """
+        self.orthanc = orthanc
+        self.instances = instances
+        self.max_nbr_downloads = max_nbr_downloads
+        self.max_buffered_size = max_buffered_size
+        self.ordered = ordered
+
+    def __iter__(self) -> Iterator[Tuple[InstanceOrIdentifier, bytes]]:
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=self.max_nbr_downloads)
+        state = _PrefetchState(self, executor)
+
+        try:
+            state.submit_more()
+            while True:
+                future = state.get_next_future()
+                if future is None:
+                    return
+
+                instance, content = future.result()
+                state.release(len(content))
+                yield instance, content
+        finally:
+            state.cancel()
+            executor.shutdown(wait=False)
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[InstanceOrIdentifier, bytes]]:
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        iterator = iter(self)
+        end = object()
+
+        try:
+            while True:
+                item = await loop.run_in_executor(None, next, iterator, end)
+                if item is end:
+                    return
+                yield item  # type: ignore
+        finally:
+            await loop.run_in_executor(None, iterator.close)  # type: ignore
+
+    def __str__(self):
+        return f'InstancePrefetcher (max_nbr_downloads={self.max_nbr_downloads}, ordered={self.ordered})'
+
+
+class _PrefetchState:
+    """Downloads of one iteration of an InstancePrefetcher"""
+
+    def __init__(self, prefetcher: InstancePrefetcher, executor: Any) -> None:
+        self.prefetcher = prefetcher
+        self.executor = executor
+        self.instances = iter(prefetcher.instances)
+        self.is_exhausted = False
+
+        # Reentrant: a callback added to a done future runs immediately, in the thread holding the lock
+        self.lock = threading.RLock()
+        self.nbr_running = 0
+        self.buffered_size = 0
+        self.futures: Deque['Future'] = collections.deque()  # In submission order
+        self.completed_futures: 'queue.Queue[Future]' = queue.Queue()  # Only used when not ordered
+
+    def submit_more(self) -> None:
+        with self.lock:
+            while not self.is_exhausted and self._can_submit():
+                instance = next(self.instances, None)
+                if instance is None:
+                    self.is_exhausted = True
+                    return
+
+                self.nbr_running += 1
+                future = self.executor.submit(self._download, instance)
+                self.futures.append(future)
+                future.add_done_callback(self._on_done)
+
+    def get_next_future(self) -> Optional['Future']:
+        with self.lock:
+            if not self.futures:
+                return None
+            if self.prefetcher.ordered:
+                return self.futures.popleft()
+
+        future = self.completed_futures.get()
+        with self.lock:
+            self.futures.remove(future)
+
+        return future
+
+    def release(self, size: int) -> None:
+        with self.lock:
+            self.buffered_size -= size
+        self.submit_more()
+
+    def cancel(self) -> None:
+        with self.lock:
+            self.is_exhausted = True
+            for future in self.futures:
+                future.cancel()
+
+    def _can_submit(self) -> bool:
+        return self.nbr_running < self.prefetcher.max_nbr_downloads and self.buffered_size < self.prefetcher.max_buffered_size
+
+    def _download(self, instance: InstanceOrIdentifier) -> Tuple[InstanceOrIdentifier, bytes]:
+        if isinstance(instance, Instance):
+            return instance, instance.get_dicom_file_content()
+
+        return instance, self.prefetcher.orthanc.get_instance_file(instance)
+
+    def _on_done(self, future: 'Future') -> None:
+        with self.lock:
+            self.nbr_running -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.buffered_size += len(future.result()[1])
+        if not self.prefetcher.ordered:
+            self.completed_futures.put(future)
+        self.submit_more()
@@ -0,0 +1,211 @@
+# coding: utf-8
+# author: gabriel couture
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+
+class Query:
+    """Represent the result of a C-Find on a remote modality (a /queries/{id} object)
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> query = Query(orthanc.query_on_modality('pacs', {'Level': 'Study', 'Query': {'PatientID': 'P1'}})['ID'], orthanc)
+    >>> query.get_answers_table()
+    {'PatientID': ['P1', 'P1'], 'StudyInstanceUID': ['1.2.3', '1.2.4'], ...}
+    >>> series_queries = query.find_child_series()  # One query per answer, sent concurrently
+    """
+
+    def __init__(self, query_identifier: str, orthanc: 'Orthanc', max_nbr_workers: int = 10) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        query_identifier
+            Query identifier.
+        orthanc
+            Orthanc object.
+        max_nbr_workers
+            Maximum number of concurrent requests when a request is needed per answer.
+        """
+        self.identifier = query_identifier
+        self.orthanc = orthanc
+        self.max_nbr_workers = max_nbr_workers
+
+        self._answers: Optional[List[Dict]] = None
+
+    def get_identifier(self) -> str:
+        """Get query identifier
+
+        Returns
+        -------
+        str
+            Query identifier.
+        """
+        return self.identifier
+
+    def get_answers(self, refresh: bool = False) -> List[Dict]:
+        """Get the simplified content of all the answers
+
+        The contents are read with a single answers?expand&simplify request.
+        With Orthanc versions that only list the answer indexes, they are
+        read concurrently, one request per answer.
+
+        Parameters
+        ----------
+        refresh
+            If True, read the answers again instead of using the cached ones.
+
+        Returns
+        -------
+        List[Dict]
+            Simplified answer contents, in the order of the answer indexes.
+        """
+        if self._answers is None or refresh:
+            answers = self.orthanc.get_query_answers(self.identifier, {'expand': '', 'simplify': ''})
+
+            if not all(isinstance(a, dict) for a in answers):
+                answers = self._map_answers(
+                    lambda index: self.orthanc.get_content_of_specified_query_answer_in_simplified_version(self.identifier, index),
+                    answers
+                )
+
+            self._answers = answers
+
+        return self._answers
+
+    def get_answers_table(self, refresh: bool = False) -> Dict[str, List[str]]:
+        """Get the answers as a table (tag name -> column of values)
+
+        Tags are in order of first appearance, and a tag missing from an
+        answer has an empty value.
+
+        Parameters
+        ----------
+        refresh
+            If True, read the answers again instead of using the cached ones.
+
+        Returns
+        -------
+        Dict[str, List[str]]
+            Columns of values, one row per answer.
+        """
+        answers = self.get_answers(refresh)
+
+        tags: Dict[str, None] = {}
+        for answer in answers:
+            tags.update(dict.fromkeys(answer))
+
+        return {tag: [answer.get(tag, '') for answer in answers] for tag in tags}
+
+    def get_level(self) -> str:
+        """Get the query retrieve level
+
+        Returns
+        -------
+        str
+            Query level (e.g. 'Study').
+        """
+        return self.orthanc.get_query_retrieve_level(self.identifier)
+
+    def get_modality(self) -> str:
+        """Get the queried modality
+
+        Returns
+        -------
+        str
+            Modality name.
+        """
+        return self.orthanc.get_query_modality(self.identifier)
+
+    def find_child_studies(self, data: Optional[Dict] = None) -> List['Query']:
+        """C-Find the child studies of all the answers, concurrently
+
+        Parameters
+        ----------
+        data
+            Dictionary to send in the body of the requests, e.g. {'Query': {'StudyDate': ''}}.
+
+        Returns
+        -------
+        List[Query]
+            One query per answer, in the order of the answers.
+        """
+        return self._find_children(self.orthanc.find_child_dicom_studies_of_answer, data)
+
+    def find_child_series(self, data: Optional[Dict] = None) -> List['Query']:
+        """C-Find the child series of all the answers, concurrently
+
+        Parameters
+        ----------
+        data
+            Dictionary to send in the body of the requests, e.g. {'Query': {'Modality': ''}}.
+
+        Returns
+        -------
+        List[Query]
+            One query per answer, in the order of the answers.
+        """
+        return self._find_children(self.orthanc.find_child_dicom_series_of_answer, data)
+
+    def find_child_instances(self, data: Optional[Dict] = None) -> List['Query']:
+        """C-Find the child instances of all the answers, concurrently
+
+        Parameters
+        ----------
+        data
+            Dictionary to send in the body of the requests.
+
+        Returns
+        -------
+        List[Query]
+            One query per answer, in the order of the answers.
+        """
+        return self._find_children(self.orthanc.find_child_dicom_instances_of_answer, data)
+
+    def retrieve(self, data: Dict) -> Dict:
+        """C-Move all the answers to a modality
+
+        Parameters
+        ----------
+        data
+            Dictionary to send in the body of the request, e.g. {'TargetAet': 'TARGET'}.
+
+        Returns
+        -------
+        Dict
+            Orthanc response.
+        """
+        return self.orthanc.move_query_results_to_given_modality(self.identifier, data)
+
+    def delete(self) -> bool:
+        """Delete the query object from Orthanc
+
+        Returns
+        -------
+        bool
+            True if succeeded, else False.
+        """
+        return self.orthanc.delete_query(self.identifier)
+
+    def _find_children(self, operation: Callable, data: Optional[Dict]) -> List['Query']:
+        indexes = [str(i) for i in range(len(self.get_answers()))]
+
+        return [
+            Query(response['ID'], self.orthanc, self.max_nbr_workers)
+            for response in self._map_answers(lambda index: operation(self.identifier, index, data or {}), indexes)
+        ]
+
+    def _map_answers(self, function: Callable, indexes: List[str]) -> List:
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not indexes:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_nbr_workers, len(indexes))) as executor:
+            return list(executor.map(function, indexes))
+
+    def __str__(self):
+        return f'Query (identifier={self.get_identifier()})'
@@ -0,0 +1,155 @@
+# coding: utf-8
+# author: gabriel couture
+import collections
+import copy
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from pyorthanc.query import Query
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+UNIVERSAL_MATCHING_VALUES = ('', '*')
+
+
+class QueryCache:
+    """Client side cache of C-Find results
+
+    Answers are cached by (modality, level, normalized query) for `ttl`
+    seconds. On a cache miss, the query is sent to the modality, the content
+    of all its answers is fetched in one request (answers?expand&simplify)
+    and the query object is deleted from Orthanc.
+
+    Examples
+    --------
+    >>> cache = QueryCache(Orthanc('http://localhost:8042'), ttl=300)
+    >>> cache.query('pacs', {'Level': 'Study', 'Query': {'PatientID': 'P1', 'StudyDate': ''}})
+    [{'PatientID': 'P1', 'StudyDate': '20200101', 'StudyInstanceUID': '1.2.3', ...}, ...]
+    >>> cache.query('pacs', {'Level': 'Study', 'Query': {'StudyDate': '*', 'PatientID': 'P1'}})  # From the cache
+    """
+
+    def __init__(self, orthanc: 'Orthanc', ttl: float = 60.0, max_size: int = 1000) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        orthanc
+            Orthanc object.
+        ttl
+            Time (in seconds) during which the answers of a query are reused.
+        max_size
+            Maximum number of cached queries. The least recently used queries are evicted first.
+        """
+        self.orthanc = orthanc
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._entries: 'collections.OrderedDict[Tuple, Tuple[float, List[Dict]]]' = collections.OrderedDict()
+        self._nbr_hits = 0
+        self._nbr_misses = 0
+
+    def query(self, modality: str, data: Dict) -> List[Dict]:
+        """C-Find on a remote modality, with the answers of the cache if possible
+
+        Parameters
+        ----------
+        modality
+            Remote modality.
+        data
+            Dictionary to send in the body of the query request.
+
+        Returns
+        -------
+        List[Dict]
+            Simplified contents of the answers.
+        """
+        key = make_query_key(modality, data)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._nbr_hits += 1
+                return copy.deepcopy(entry[1])
+            self._nbr_misses += 1
+
+        answers = self._query_on_modality(modality, data)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, answers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return copy.deepcopy(answers)
+
+    def invalidate(self, modality: Optional[str] = None) -> None:
+        """Remove cached answers
+
+        Parameters
+        ----------
+        modality
+            Only remove the answers of this modality. Remove everything if None.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if modality is None or k[0] == modality]:
+                del self._entries[key]
+
+    def get_statistics(self) -> Dict[str, int]:
+        """Get the cache statistics
+
+        Returns
+        -------
+        Dict[str, int]
+            Number of cached queries ('Size'), of cache 'Hits' and of cache 'Misses'.
+        """
+        with self._lock:
+            return {'Size': len(self._entries), 'Hits': self._nbr_hits, 'Misses': self._nbr_misses}
+
+    def _query_on_modality(self, modality: str, data: Dict) -> List[Dict]:
+        query = Query(self.orthanc.query_on_modality(modality, data)['ID'], self.orthanc)
+
+        try:
+            return query.get_answers()
+        finally:
+            query.delete()
+
+
+def make_query_key(modality: str, data: Dict) -> Tuple:
+    """Make the cache key of a C-Find
+
+    The level is capitalized, the query tags are sorted, their values are
+    stripped and the universal matching values ('' and '*') are merged.
+
+    Parameters
+    ----------
+    modality
+        Remote modality.
+    data
+        Dictionary sent in the body of the query request.
+
+    Returns
+    -------
+    Tuple
+        (modality, level, query items, other parameters items)
+    """
+    level = str(data.get('Level', 'Study')).capitalize()
+    query = tuple(sorted(
+        (tag, '' if str(value).strip() in UNIVERSAL_MATCHING_VALUES else str(value).strip())
+        for tag, value in data.get('Query', {}).items()
+    ))
+    other_parameters = tuple(sorted((k, _make_hashable(v)) for k, v in data.items() if k not in ('Level', 'Query')))
+
+    return modality, level, query, other_parameters
+
+
+def _make_hashable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _make_hashable(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_make_hashable(v) for v in value)
+
+    return value
@@ -1,15 +1,26 @@
 # coding: utf-8
 # author: gabriel couture
-from typing import Dict
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 
-from pyorthanc import Orthanc
+from pyorthanc.query import Query
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+IDENTIFYING_TAG_OF_LEVEL = {
+    'Patient': 'PatientID',
+    'Study': 'StudyInstanceUID',
+    'Series': 'SeriesInstanceUID',
+    'Instance': 'SOPInstanceUID'
+}
 
 
 class RemoteModality:
     """Wrapper around Orthanc API when dealing with a (remote) modality.
     """
 
-    def __init__(self, orthanc: Orthanc, modality: str) -> None:
+    def __init__(self, orthanc: 'Orthanc', modality: str) -> None:
         """Constructor
 
         Parameters
@@ -99,3 +110,131 @@ class RemoteModality:
             query_identifier,
             cmove_data
         )
+
+
+class MultipleModalitiesQueryResult:
+    """Merged answers of a C-Find on many modalities
+
+    `answers` maps the identifying tag of each answer (e.g. the
+    StudyInstanceUID for a study level query) to its simplified content,
+    `locations` maps it to the modalities that answered it, and `errors`
+    maps the modalities that failed or timed out to the raised exception.
+    Answers without the identifying tag can not be merged, and are keyed
+    by '{modality}/{answer index}'.
+    """
+
+    def __init__(self) -> None:
+        self.answers: Dict[str, Dict] = {}
+        self.locations: Dict[str, List[str]] = {}
+        self.errors: Dict[str, BaseException] = {}
+
+    def is_complete(self) -> bool:
+        """Check if all the modalities answered
+
+        Returns
+        -------
+        bool
+            True if no modality failed or timed out.
+        """
+        return self.errors == {}
+
+    def __str__(self):
+        return f'MultipleModalitiesQueryResult (answers={len(self.answers)}, failed modalities={list(self.errors)})'
+
+
+def query_remote_modalities(
+        orthanc: 'Orthanc',
+        modalities: List[str],
+        data: Dict,
+        timeout: Optional[Union[float, Dict[str, float]]] = None,
+        max_nbr_workers: Optional[int] = None) -> MultipleModalitiesQueryResult:
+    """C-Find on many remote modalities concurrently
+
+    Answers are de-duplicated on the identifying tag of the query level
+    (PatientID, StudyInstanceUID, SeriesInstanceUID or SOPInstanceUID).
+    When an answer comes from many modalities, empty tags are filled with
+    the values of the other modalities. The query objects are deleted from
+    Orthanc once their answers are read.
+
+    Modalities that do not answer before their timeout are reported in
+    the errors of the result (as a concurrent.futures.TimeoutError),
+    and the answers of the other modalities are still returned.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    modalities
+        Names of the remote modalities.
+    data
+        Dictionary to send in the body of the query requests.
+    timeout
+        Timeout in seconds, for all the modalities or per modality
+        (e.g. {'pacs1': 5, 'pacs2': 30}). No timeout if None.
+    max_nbr_workers
+        Maximum number of modalities queried at the same time. All of them if None.
+
+    Returns
+    -------
+    MultipleModalitiesQueryResult
+        Merged answers, where each answer was found and the modality errors.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> result = query_remote_modalities(
+    ...     orthanc, ['pacs1', 'pacs2', 'pacs3'],
+    ...     data={'Level': 'Study', 'Query': {'PatientID': '03HD*', 'StudyDate': ''}},
+    ...     timeout=10
+    ... )
+    >>> result.answers  # {'StudyInstanceUID': {'PatientID': '03HD1234', 'StudyDate': ...}, ...}
+    >>> result.locations  # {'StudyInstanceUID': ['pacs1', 'pacs3'], ...}
+    """
+    from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+    start = time.monotonic()
+    deadlines = {m: start + _get_timeout(timeout, m) for m in modalities}
+    key = IDENTIFYING_TAG_OF_LEVEL[str(data.get('Level', 'Study')).capitalize()]
+    result = MultipleModalitiesQueryResult()
+
+    executor = ThreadPoolExecutor(max_workers=max_nbr_workers or max(len(modalities), 1))
+    futures = {m: executor.submit(_query_modality, orthanc, m, data) for m in modalities}
+
+    answers_of_modalities = {}
+    for modality in sorted(modalities, key=lambda m: deadlines[m]):
+        try:
+            remaining_time = None if deadlines[modality] == float('inf') else max(deadlines[modality] - time.monotonic(), 0)
+            answers_of_modalities[modality] = futures[modality].result(timeout=remaining_time)
+        except TimeoutError as error:
+            # Only prevents a query that has not started yet: a running one finishes
+            # in the background, and deletes its query object as any other query
+            futures[modality].cancel()
+            result.errors[modality] = error
+        except Exception as error:
+            result.errors[modality] = error
+
+    executor.shutdown(wait=False)
+
+    for modality in modalities:
+        for index, answer in enumerate(answers_of_modalities.get(modality, [])):
+            answer_key = answer.get(key) or f'{modality}/{index}'
+            merged_answer = result.answers.setdefault(answer_key, {})
+            merged_answer.update({k: v for k, v in answer.items() if not merged_answer.get(k)})
+            result.locations.setdefault(answer_key, []).append(modality)
+
+    return result
+
+
+def _query_modality(orthanc: 'Orthanc', modality: str, data: Dict) -> List[Dict]:
+    query_identifier = orthanc.query_on_modality(modality, data)['ID']
+    try:
+        return Query(query_identifier, orthanc).get_answers()
+    finally:
+        orthanc.delete_query(query_identifier)
+
+
+def _get_timeout(timeout: Optional[Union[float, Dict[str, float]]], modality: str) -> float:
+    if isinstance(timeout, dict):
+        timeout = timeout.get(modality)
+
+    return float('inf') if timeout is None else timeout
@@ -0,0 +1,255 @@
+# coding: utf-8
+# author: gabriel couture
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+
+from pyorthanc._util import get_md5, report_progress
+from pyorthanc.bulk import BulkResult
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+
+class Replicator:
+    """Replicate the instances of an Orthanc server to another one
+
+    Orthanc identifiers only depend on the DICOM UIDs, so the instances
+    missing from the target are found by comparing the instance identifiers
+    of both servers, and only these instances are transferred.
+
+    With a `peer` (the target, as declared in the source /peers), the
+    transfer is done server to server with concurrent `store_peer` calls.
+    Otherwise, each instance is downloaded from the source and uploaded
+    to the target.
+
+    Examples
+    --------
+    >>> replicator = Replicator(Orthanc('http://primary:8042'), Orthanc('http://replica:8042'), peer='replica')
+    >>> replicator.replicate()  # Transfer the missing instances
+    >>> for result in replicator.follow_changes():  # Then keep the replica in sync
+    ...     print(replicator.last_change, result)
+    """
+
+    def __init__(
+            self,
+            source: 'Orthanc',
+            target: 'Orthanc',
+            peer: Optional[str] = None,
+            max_nbr_workers: int = 10,
+            nbr_instances_per_request: int = 50,
+            nbr_changes_per_request: int = 100) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        source
+            Orthanc server to replicate.
+        target
+            Orthanc server receiving the instances.
+        peer
+            Name of the target in the peers of the source. Instances go through the client if None.
+        max_nbr_workers
+            Maximum number of concurrent transfers.
+        nbr_instances_per_request
+            Number of instances sent by each `store_peer` call.
+        nbr_changes_per_request
+            Number of changes read by each request when following the source changes.
+        """
+        self.source = source
+        self.target = target
+        self.peer = peer
+        self.max_nbr_workers = max_nbr_workers
+        self.nbr_instances_per_request = nbr_instances_per_request
+        self.nbr_changes_per_request = nbr_changes_per_request
+
+        self.last_change: Optional[int] = None
+        self.failed_instances: Dict[str, int] = {}  # Instance identifier -> number of failed transfers
+        self._retry_times: Dict[str, float] = {}
+
+    def get_missing_instances(self) -> List[str]:
+        """Get the identifiers of the source instances that are not in the target
+
+        Returns
+        -------
+        List[str]
+            Instance identifiers, in the order of the source.
+        """
+        target_instances = set(self.target.get_instances())
+
+        return [i for i in self.source.get_instances() if i not in target_instances]
+
+    def get_instances_with_different_md5(self, instance_identifiers: Optional[List[str]] = None) -> List[str]:
+        """Get the instances whose file MD5 differs between the source and the target
+
+        Parameters
+        ----------
+        instance_identifiers
+            Instances to compare. All the instances present on both servers if None.
+
+        Returns
+        -------
+        List[str]
+            Identifiers of the instances with different files.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if instance_identifiers is None:
+            target_instances = set(self.target.get_instances())
+            instance_identifiers = [i for i in self.source.get_instances() if i in target_instances]
+
+        def is_different(instance_identifier: str) -> bool:
+            return get_md5(self.source, instance_identifier) != get_md5(self.target, instance_identifier)
+
+        with ThreadPoolExecutor(max_workers=self.max_nbr_workers) as executor:
+            are_different = list(executor.map(is_different, instance_identifiers))
+
+        return [i for i, is_diff in zip(instance_identifiers, are_different) if is_diff]
+
+    def replicate(self, instance_identifiers: Optional[List[str]] = None,
+                  progress_callback: Optional[Callable[[int, int], Any]] = None,
+                  compare_md5: bool = False) -> BulkResult:
+        """Transfer instances to the target
+
+        When a `store_peer` call of many instances fails because one of them
+        is not in the source anymore (404), the instances of the call are
+        sent again one by one, so that only the deleted instance fails.
+
+        Parameters
+        ----------
+        instance_identifiers
+            Instances to transfer. The instances missing from the target if None.
+        progress_callback
+            Called with (number of processed instances, total number of instances)
+            each time a transfer is done.
+        compare_md5
+            If True and `instance_identifiers` is None, also transfer the instances
+            whose file differs between the servers (see `get_instances_with_different_md5`).
+            They are deleted from the target first, since Orthanc keeps the stored file
+            of an instance it receives again.
+
+        Returns
+        -------
+        BulkResult
+            Instance identifier -> response of the transfer request, and errors.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if instance_identifiers is None:
+            instance_identifiers = self.get_missing_instances()
+            if compare_md5:
+                different_instances = self.get_instances_with_different_md5()
+                for instance_identifier in different_instances:
+                    self.target.delete_instance(instance_identifier)
+                instance_identifiers += different_instances
+
+        if self.peer is not None:
+            chunks = [
+                instance_identifiers[i:i + self.nbr_instances_per_request]
+                for i in range(0, len(instance_identifiers), self.nbr_instances_per_request)
+            ]
+        else:
+            chunks = [[i] for i in instance_identifiers]
+
+        bulk_result = BulkResult()
+        lock = threading.Lock()
+
+        def transfer(chunk: List[str]) -> None:
+            try:
+                if self.peer is not None:
+                    responses = [self.source.store_peer(self.peer, {'Resources': chunk})] * len(chunk)
+                else:
+                    responses = [self.target.post_instances(self.source.get_instance_file(chunk[0]))]
+            except Exception as error:
+                if len(chunk) > 1 and 'HTTP code: 404' in str(error):
+                    for instance_identifier in chunk:  # Probably one deleted instance, that fails the whole chunk
+                        transfer([instance_identifier])
+                    return
+
+                with lock:
+                    bulk_result.errors.update(dict.fromkeys(chunk, error))
+                    report_progress(progress_callback, bulk_result, len(instance_identifiers))
+                return
+
+            with lock:
+                bulk_result.results.update(zip(chunk, responses))
+                report_progress(progress_callback, bulk_result, len(instance_identifiers))
+
+        with ThreadPoolExecutor(max_workers=self.max_nbr_workers) as executor:
+            list(executor.map(transfer, chunks))
+
+        return bulk_result
+
+    def follow_changes(self, since: Optional[int] = None, poll_interval: float = 1.0,
+                       stop_event: Optional[threading.Event] = None,
+                       max_nbr_retries: int = 5, retry_delay: float = 1.0) -> Iterator[BulkResult]:
+        """Replicate the new instances of the source as they arrive
+
+        The source /changes are read from `since` (or from the current last
+        change), and the instances of each batch of NewInstance changes are
+        transferred. `last_change` is updated once a batch is consumed, and
+        the instances whose transfer failed are kept in `failed_instances`
+        (with their number of failures) and sent again with a later batch,
+        after a delay doubling at each failure. Both can be saved to resume later.
+
+        An instance is given up (and only reported in the errors of its last
+        batch) after `max_nbr_retries` retries, or when it is not in the
+        source anymore (404).
+
+        Parameters
+        ----------
+        since
+            Sequence number of the last already replicated change. If None,
+            `last_change` is used, or the current last change of the source.
+        poll_interval
+            Time (in seconds) to wait when there are no new changes.
+        stop_event
+            Stop following the changes when this event is set.
+        max_nbr_retries
+            Maximum number of times a failed instance is sent again.
+        retry_delay
+            Time (in seconds) before sending a failed instance again, doubled at each failure.
+
+        Returns
+        -------
+        Iterator[BulkResult]
+            Result of each replicated batch (including the retried instances).
+        """
+        if since is not None:
+            self.last_change = since
+        if self.last_change is None:
+            self.last_change = self.source.get_changes({'last': ''})['Last']
+
+        while stop_event is None or not stop_event.is_set():
+            changes = self.source.get_changes({'since': self.last_change, 'limit': self.nbr_changes_per_request})
+            new_instances = [c['ID'] for c in changes['Changes'] if c['ChangeType'] == 'NewInstance']
+            now = time.monotonic()
+            retried_instances = [i for i in self.failed_instances if self._retry_times.get(i, now) <= now]
+            instance_identifiers = list(dict.fromkeys(retried_instances + new_instances))
+
+            if instance_identifiers:
+                result = self.replicate(instance_identifiers)
+                self._update_failed_instances(instance_identifiers, result, max_nbr_retries, retry_delay)
+                self.last_change = changes['Last']
+                yield result
+            else:
+                self.last_change = changes['Last']
+
+            if changes['Done']:
+                if stop_event is not None:
+                    stop_event.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+
+    def _update_failed_instances(self, instance_identifiers: List[str], result: BulkResult,
+                                 max_nbr_retries: int, retry_delay: float) -> None:
+        for instance_identifier in instance_identifiers:
+            error = result.errors.get(instance_identifier)
+            nbr_failures = self.failed_instances.pop(instance_identifier, 0) + 1
+            self._retry_times.pop(instance_identifier, None)
+
+            if error is None or 'HTTP code: 404' in str(error) or nbr_failures > max_nbr_retries:
+                continue  # Replicated, deleted from the source, or given up
+
+            self.failed_instances[instance_identifier] = nbr_failures
+            self._retry_times[instance_identifier] = time.monotonic() + retry_delay * 2 ** (nbr_failures - 1)
@@ -0,0 +1,358 @@
+# coding: utf-8
+# author: gabriel couture
+import datetime
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Set
+
+from pyorthanc._util import RateLimiter, Resource, parse_date, report_progress
+from pyorthanc.bulk import BulkResult
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+RULE_LEVELS = ('Study', 'Series')
+
+
+class RetentionRule:
+    """Condition on the studies (or series) to delete
+
+    A resource matches the rule if it matches all the given conditions.
+    Resources of protected patients never match, unless `include_protected`.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            level: str = 'Study',
+            min_age_in_days: Optional[float] = None,
+            modalities: Optional[Iterable[str]] = None,
+            min_days_since_last_update: Optional[float] = None,
+            include_protected: bool = False,
+            resource_filter: Optional[Callable[[Dict], bool]] = None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        name
+            Rule name, reported in the deletion plan.
+        level
+            'Study' or 'Series'.
+        min_age_in_days
+            Minimum age of the resource (from its StudyDate, or SeriesDate for
+            series, or its last update if it has no date).
+        modalities
+            The resource must have one of these modalities (for a study, one of its series).
+        min_days_since_last_update
+            Minimum time since Orthanc last received an instance of the resource.
+        include_protected
+            If True, the resources of protected patients can match.
+        resource_filter
+            Other condition, a function of the resource record (see `RetentionEngine.get_catalog`).
+        """
+        if level not in RULE_LEVELS:
+            raise ValueError(f'Unknown rule level {level!r}, expected one of {RULE_LEVELS}')
+
+        self.name = name
+        self.level = level
+        self.min_age_in_days = min_age_in_days
+        self.modalities = set(modalities) if modalities is not None else None
+        self.min_days_since_last_update = min_days_since_last_update
+        self.include_protected = include_protected
+        self.resource_filter = resource_filter
+
+    def matches(self, record: Dict, now: Optional[datetime.datetime] = None) -> bool:
+        """Check if a resource record matches the rule, regardless of the patient protection
+
+        Parameters
+        ----------
+        record
+            Resource record (see `RetentionEngine.get_catalog`).
+        now
+            Date used to compute the ages (now if None).
+
+        Returns
+        -------
+        bool
+            True if the resource matches all the conditions.
+        """
+        now = now or datetime.datetime.now()
+
+        if record['Type'] != self.level:
+            return False
+        if self.min_age_in_days is not None and now - record['Date'] < datetime.timedelta(days=self.min_age_in_days):
+            return False
+        if self.modalities is not None and self.modalities.isdisjoint(record['Modalities']):
+            return False
+        if self.min_days_since_last_update is not None and now - record['LastUpdate'] < datetime.timedelta(days=self.min_days_since_last_update):
+            return False
+
+        return self.resource_filter is None or self.resource_filter(record)
+
+    def __str__(self):
+        return f'RetentionRule (name={self.name}, level={self.level})'
+
+
+class RetentionPlan:
+    """Resources to delete, with the rule that selected each of them
+
+    `items` are dictionaries with the 'Type' ('Study' or 'Series'), the 'ID',
+    the 'Rule' name, the Orthanc identifier of the patient ('ParentPatient')
+    and the number of instances ('CountInstances') of each resource to delete.
+    """
+
+    def __init__(self, items: List[Dict]) -> None:
+        self.items = items
+
+    def get_nbr_instances(self) -> int:
+        """Get the number of instances to delete
+
+        Returns
+        -------
+        int
+            Sum of the number of instances of the resources to delete.
+        """
+        return sum(item['CountInstances'] for item in self.items)
+
+    def get_nbr_resources_by_rule(self) -> Dict[str, int]:
+        """Count the resources to delete by rule
+
+        Returns
+        -------
+        Dict[str, int]
+            Rule name -> number of resources.
+        """
+        counts: Dict[str, int] = {}
+        for item in self.items:
+            counts[item['Rule']] = counts.get(item['Rule'], 0) + 1
+
+        return counts
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __str__(self):
+        return f'RetentionPlan (nbr_resources={len(self.items)}, nbr_instances={self.get_nbr_instances()})'
+
+
+class RetentionEngine:
+    """Evaluate retention rules and delete the selected studies and series
+
+    The rules are evaluated on a catalog of all the studies and series,
+    read with paginated listings (two requests per thousand resources),
+    and the protection of the patients of the selected resources is read
+    concurrently, so planning does not cost one request per resource.
+
+    The plan is executed with at most `max_nbr_workers` concurrent deletes,
+    and at most `max_nbr_instances_per_second` deleted instances per second,
+    so that a large purge does not monopolize the Orthanc index.
+
+    Examples
+    --------
+    >>> engine = RetentionEngine(orthanc, [
+    ...     RetentionRule('Old CT', min_age_in_days=10 * 365, modalities=['CT']),
+    ...     RetentionRule('Old SR', level='Series', min_age_in_days=365, modalities=['SR'])
+    ... ], max_nbr_instances_per_second=500)
+    >>> plan = engine.plan()
+    >>> print(plan, plan.get_nbr_resources_by_rule())
+    >>> result = engine.execute(plan, dry_run=False)
+    """
+
+    def __init__(
+            self,
+            orthanc: 'Orthanc',
+            rules: List[RetentionRule],
+            max_nbr_workers: int = 4,
+            max_nbr_instances_per_second: Optional[float] = None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        orthanc
+            Orthanc object.
+        rules
+            Retention rules. A resource is deleted if it matches any rule.
+        max_nbr_workers
+            Maximum number of concurrent requests.
+        max_nbr_instances_per_second
+            Maximum number of instances deleted per second. Unlimited if None.
+        """
+        self.orthanc = orthanc
+        self.rules = rules
+        self.max_nbr_workers = max_nbr_workers
+        self.max_nbr_instances_per_second = max_nbr_instances_per_second
+
+    def get_catalog(self) -> List[Dict]:
+        """Get the records of all the studies and series of the server
+
+        Returns
+        -------
+        List[Dict]
+            Resource information (as returned by get_study_information or get_series_information),
+            with the 'Date' and 'LastUpdate' as datetimes, the 'Modalities' (a set), the
+            'ParentPatient' and the number of instances ('CountInstances') of each resource.
+        """
+        studies: Iterable[Dict] = self.orthanc.iterate_studies(expand=True)  # type: ignore
+        series: Iterable[Dict] = self.orthanc.iterate_series(expand=True)  # type: ignore
+
+        study_records = {s['ID']: {**s, 'Modalities': set(), 'CountInstances': 0} for s in studies}
+        series_records = []
+        for s in series:
+            study = study_records.get(s['ParentStudy'])
+            if study is None:
+                continue  # Study added after the study listing
+
+            modality = s['MainDicomTags'].get('Modality')
+            study['Modalities'] |= {modality} if modality else set()
+            study['CountInstances'] += len(s['Instances'])
+            series_records.append({
+                **s,
+                'ParentPatient': study['ParentPatient'],
+                'Modalities': {modality} if modality else set(),
+                'CountInstances': len(s['Instances']),
+                'Date': parse_date(s['MainDicomTags'].get('SeriesDate') or study['MainDicomTags'].get('StudyDate'), s['LastUpdate'])
+            })
+
+        for study in study_records.values():
+            study['Date'] = parse_date(study['MainDicomTags'].get('StudyDate'), study['LastUpdate'])
+
+        records = [*study_records.values(), *series_records]
+        for record in records:
+            record['LastUpdate'] = parse_date(None, record['LastUpdate'])
+
+        return records
+
+    def plan(self, resources: Optional[Iterable[Resource]] = None, now: Optional[datetime.datetime] = None) -> RetentionPlan:
+        """Select the resources to delete
+
+        Parameters
+        ----------
+        resources
+            Only select the studies and series of these patients, studies or series
+            (e.g. a patient forest). All the resources of the server if None.
+        now
+            Date used to compute the ages (now if None).
+
+        Returns
+        -------
+        RetentionPlan
+            Resources to delete. A series is not listed if its study is.
+        """
+        scope = {r.get_identifier() for r in resources} if resources is not None else None
+
+        candidates = []
+        for record in self.get_catalog():
+            if scope is not None and scope.isdisjoint((record['ID'], record.get('ParentStudy'), record['ParentPatient'])):
+                continue
+
+            rules = [rule for rule in self.rules if rule.matches(record, now)]
+            if rules:
+                candidates.append((record, rules))
+
+        protected_patients = get_protected_patients(
+            self.orthanc, {r['ParentPatient'] for r, rules in candidates if not all(rule.include_protected for rule in rules)}, self.max_nbr_workers
+        )
+
+        items = []
+        for record, rules in candidates:
+            rules = [rule for rule in rules if rule.include_protected or record['ParentPatient'] not in protected_patients]
+            if rules:
+                items.append({
+                    'Type': record['Type'],
+                    'ID': record['ID'],
+                    'Rule': rules[0].name,
+                    'ParentPatient': record['ParentPatient'],
+                    'ParentStudy': record.get('ParentStudy'),
+                    'CountInstances': record['CountInstances']
+                })
+
+        deleted_studies = {item['ID'] for item in items if item['Type'] == 'Study'}
+
+        return RetentionPlan([item for item in items if item['ParentStudy'] not in deleted_studies])
+
+    def execute(self, plan: RetentionPlan, dry_run: bool = True,
+                progress_callback: Optional[Callable[[int, int], Any]] = None) -> BulkResult:
+        """Delete the resources of a plan
+
+        Before deleting, the protection of the patients is read again, and the
+        resources of the patients protected since the plan was made are skipped
+        (unless their rule includes the protected patients).
+
+        Parameters
+        ----------
+        plan
+            Plan made by `plan`.
+        dry_run
+            If True (the default), nothing is deleted.
+        progress_callback
+            Called with (number of processed resources, total number of resources)
+            each time a resource is processed.
+
+        Returns
+        -------
+        BulkResult
+            Resource identifier -> name of the rule that selected it, and errors.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if dry_run:
+            result = BulkResult()
+            result.results = {item['ID']: item['Rule'] for item in plan.items}
+            return result
+
+        rules_including_protected = {rule.name for rule in self.rules if rule.include_protected}
+        protected_patients = get_protected_patients(
+            self.orthanc, {i['ParentPatient'] for i in plan.items if i['Rule'] not in rules_including_protected}, self.max_nbr_workers
+        )
+        items = [i for i in plan.items if i['Rule'] in rules_including_protected or i['ParentPatient'] not in protected_patients]
+
+        bulk_result = BulkResult()
+        lock = threading.Lock()
+        rate_limiter = RateLimiter(self.max_nbr_instances_per_second)
+
+        def delete(item: Dict) -> None:
+            rate_limiter.wait(item['CountInstances'])
+            try:
+                if item['Type'] == 'Study':
+                    self.orthanc.delete_study(item['ID'])
+                else:
+                    self.orthanc.delete_series(item['ID'])
+            except Exception as error:
+                with lock:
+                    bulk_result.errors[item['ID']] = error
+                    report_progress(progress_callback, bulk_result, len(items))
+                return
+
+            with lock:
+                bulk_result.results[item['ID']] = item['Rule']
+                report_progress(progress_callback, bulk_result, len(items))
+
+        with ThreadPoolExecutor(max_workers=self.max_nbr_workers) as executor:
+            list(executor.map(delete, items))
+
+        return bulk_result
+
+
+def get_protected_patients(orthanc: 'Orthanc', patient_identifiers: Iterable[str], max_nbr_workers: int = 10) -> Set[str]:
+    """Get which patients are protected against recycling, with concurrent requests
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    patient_identifiers
+        Patient identifiers.
+    max_nbr_workers
+        Maximum number of concurrent requests.
+
+    Returns
+    -------
+    Set[str]
+        Identifiers of the protected patients.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    patient_identifiers = list(patient_identifiers)
+    with ThreadPoolExecutor(max_workers=max_nbr_workers) as executor:
+        are_protected = list(executor.map(orthanc.get_if_patient_is_protected, patient_identifiers))
+
+    return {i for i, is_protected in zip(patient_identifiers, are_protected) if is_protected}
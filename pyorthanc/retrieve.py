@@ -0,0 +1,179 @@
+# coding: utf-8
+# author: gabriel couture
+import collections
+import functools
+import heapq
+import queue
+import time
+from concurrent.futures import CancelledError
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pyorthanc.job import Job, JobWatcher, submit_job
+from pyorthanc.remote import IDENTIFYING_TAG_OF_LEVEL
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+
+LEVELS = ['Patient', 'Study', 'Series', 'Instance']
+
+
+class RetrieveEvent:
+    """Completion of the retrieval (C-Move) of a query answer
+
+    Attributes
+    ----------
+    modality
+        Modality the answer was retrieved from.
+    answer
+        Simplified content of the query answer.
+    job
+        Job of the last attempt (None if the C-Move could not be started).
+    error
+        Error of the last attempt (None if the retrieval succeeded).
+    nbr_attempts
+        Number of C-Moves that were started for this answer.
+    """
+
+    def __init__(self, modality: str, answer: Dict, job: Optional[Job],
+                 error: Optional[BaseException], nbr_attempts: int) -> None:
+        self.modality = modality
+        self.answer = answer
+        self.job = job
+        self.error = error
+        self.nbr_attempts = nbr_attempts
+
+    def is_successful(self) -> bool:
+        """Check if the answer was retrieved
+
+        Returns
+        -------
+        bool
+            True if the C-Move succeeded.
+        """
+        return self.error is None
+
+    def __str__(self):
+        return f'RetrieveEvent (modality={self.modality}, successful={self.is_successful()}, attempts={self.nbr_attempts})'
+
+
+def retrieve_answers(
+        orthanc: 'Orthanc',
+        answers: Iterable[Tuple[str, Dict]],
+        target_aet: Optional[str] = None,
+        max_nbr_running_moves_per_modality: int = 2,
+        max_nbr_retries: int = 2,
+        retry_delay: float = 1.0,
+        watcher: Optional[JobWatcher] = None) -> Iterator[RetrieveEvent]:
+    """Retrieve (C-Move) many query answers with concurrent asynchronous jobs
+
+    Each answer is retrieved by its own C-Move job, started from the
+    identifying tags of the answer (so the query objects do not need to
+    exist anymore). At most `max_nbr_running_moves_per_modality` C-Moves
+    run at the same time on each modality, and failed C-Moves (but not the
+    canceled ones) are retried `max_nbr_retries` times, `retry_delay`
+    seconds after their failure.
+
+    Parameters
+    ----------
+    orthanc
+        Orthanc object.
+    answers
+        (modality, simplified answer content) pairs. The answer content must
+        contain the QueryRetrieveLevel and the identifying tags of its level.
+    target_aet
+        AET of the modality receiving the instances. Orthanc itself if None.
+    max_nbr_running_moves_per_modality
+        Maximum number of C-Moves running at the same time on a modality.
+    max_nbr_retries
+        Number of times a failed C-Move is retried.
+    retry_delay
+        Delay (in seconds) before retrying a failed C-Move.
+    watcher
+        JobWatcher polling the C-Move jobs. A new one is used if None.
+
+    Returns
+    -------
+    Iterator[RetrieveEvent]
+        One event per answer, in completion order.
+
+    Examples
+    --------
+    >>> orthanc = Orthanc('http://localhost:8042')
+    >>> result = query_remote_modalities(orthanc, ['pacs1', 'pacs2'], {'Level': 'Study', 'Query': {'PatientID': 'P1'}})
+    >>> answers = [(result.locations[k][0], answer) for k, answer in result.answers.items()]
+    >>> for event in retrieve_answers(orthanc, answers, max_nbr_running_moves_per_modality=4):
+    ...     print(event.answer['StudyInstanceUID'], event.is_successful())
+    """
+    watcher = watcher if watcher is not None else JobWatcher(orthanc)
+    pending: Dict[str, Deque[Tuple[Dict, int]]] = collections.defaultdict(collections.deque)
+    for modality, answer in answers:
+        pending[modality].append((answer, 0))
+
+    nbr_running_moves: Dict[str, int] = collections.defaultdict(int)
+    completed_jobs: 'queue.Queue[Tuple[str, Dict, int, Job]]' = queue.Queue()
+    retries: List[Tuple[float, int, str, Dict, int]] = []  # Heap of (retry time, counter, modality, answer, attempts)
+    nbr_remaining_answers = sum(len(p) for p in pending.values())
+    retry_counter = 0
+
+    while nbr_remaining_answers > 0:
+        while retries and retries[0][0] <= time.monotonic():
+            _, _, modality, answer, nbr_attempts = heapq.heappop(retries)
+            pending[modality].appendleft((answer, nbr_attempts))
+
+        events: List[RetrieveEvent] = []
+        for modality, modality_pending in pending.items():
+            while modality_pending and nbr_running_moves[modality] < max_nbr_running_moves_per_modality:
+                answer, nbr_attempts = modality_pending.popleft()
+                try:
+                    job = submit_job(
+                        orthanc.move_from_modality, modality,
+                        data=_make_move_data(answer, target_aet), watcher=watcher
+                    )
+                except Exception as error:
+                    events.append(RetrieveEvent(modality, answer, None, error, nbr_attempts + 1))
+                    continue
+
+                nbr_running_moves[modality] += 1
+                job.add_done_callback(functools.partial(_put_completed_job, completed_jobs, modality, answer, nbr_attempts + 1))
+
+        if not events:
+            try:
+                timeout = max(retries[0][0] - time.monotonic(), 0) if retries else None
+                modality, answer, nbr_attempts, job = completed_jobs.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            nbr_running_moves[modality] -= 1
+            events.append(RetrieveEvent(modality, answer, job, job.exception(), nbr_attempts))
+
+        for event in events:
+            is_retryable = event.error is not None and not isinstance(event.error, CancelledError)
+            if is_retryable and event.nbr_attempts <= max_nbr_retries:
+                retry_counter += 1
+                heapq.heappush(
+                    retries,
+                    (time.monotonic() + retry_delay, retry_counter, event.modality, event.answer, event.nbr_attempts)
+                )
+                continue
+
+            nbr_remaining_answers -= 1
+            yield event
+
+
+def _put_completed_job(completed_jobs: 'queue.Queue[Tuple[str, Dict, int, Job]]',
+                       modality: str, answer: Dict, nbr_attempts: int, job: Job) -> None:
+    completed_jobs.put((modality, answer, nbr_attempts, job))
+
+
+def _make_move_data(answer: Dict, target_aet: Optional[str]) -> Dict:
+    level = answer['QueryRetrieveLevel'].capitalize()
+    resource = {
+        IDENTIFYING_TAG_OF_LEVEL[lv]: answer[IDENTIFYING_TAG_OF_LEVEL[lv]]
+        for lv in LEVELS[:LEVELS.index(level) + 1]
+        if IDENTIFYING_TAG_OF_LEVEL[lv] in answer
+    }
+    data = {'Level': level, 'Resources': [resource]}
+    if target_aet is not None:
+        data['TargetAet'] = target_aet
+
+    return data
@@ -1,9 +1,12 @@
 # coding: utf-8
 # author: gabriel couture
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 
 from pyorthanc.instance import Instance
-from pyorthanc.orthanc import Orthanc
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+    from pyorthanc.study import Study
 
 
 class Series:
@@ -15,7 +18,7 @@ class Series:
 
     def __init__(
             self, series_identifier: str,
-            orthanc: Orthanc,
+            orthanc: 'Orthanc',
             series_information: Dict = None) -> None:
         """Constructor
 
@@ -32,8 +35,10 @@ class Series:
 
         self.identifier = series_identifier
         self.information = series_information
+        self._parsed_datetimes: Dict[Tuple[str, Optional[str]], Optional[str]] = {}  # See pyorthanc.dates
 
         self.instances: List[Instance] = []
+        self.parent: Optional['Study'] = None
 
     def get_instances(self) -> List[Instance]:
         """Get series instance
@@ -87,6 +92,9 @@ class Series:
         str
             The parent study identifier.
         """
+        if self.parent is not None:
+            return self.parent.identifier
+
         return self.get_main_information()['ParentStudy']
 
     def get_modality(self) -> str:
@@ -120,6 +128,8 @@ class Series:
             lambda i: Instance(i['ID'], self.orthanc),
             instance_identifiers
         ))
+        for instance in self.instances:
+            instance.parent = self
 
     def __str__(self):
         return f'Series (identifier={self.get_identifier()})'
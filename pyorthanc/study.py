@@ -1,10 +1,14 @@
 # coding: utf-8
 # author: gabriel couture
 from datetime import datetime
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 
+from pyorthanc.dates import get_datetime
 from pyorthanc.series import Series
-from pyorthanc.orthanc import Orthanc
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
+    from pyorthanc.patient import Patient
 
 
 class Study:
@@ -16,7 +20,7 @@ class Study:
 
     def __init__(
             self, study_identifier: str,
-            orthanc: Orthanc,
+            orthanc: 'Orthanc',
             study_information: Dict = None) -> None:
         """Constructor
 
@@ -33,8 +37,10 @@ class Study:
 
         self.identifier = study_identifier
         self.information = study_information
+        self._parsed_datetimes: Dict[Tuple[str, Optional[str]], Optional[str]] = {}  # See pyorthanc.dates
 
         self.series: List[Series] = []
+        self.parent: Optional['Patient'] = None
 
     def get_identifier(self) -> str:
         """Get Study identifier
@@ -71,34 +77,17 @@ class Study:
         """
         return self.get_main_information()['MainDicomTags']['ReferringPhysicianName']
 
-    def get_date(self) -> datetime:
+    def get_date(self) -> Optional[datetime]:
         """Get study date
 
-        The date have precision to the second (if available).
+        The date have precision to the microsecond (if available).
 
         Returns
         -------
-        datetime
-            Study date
+        Optional[datetime]
+            Study date, or None if the study has no valid StudyDate.
         """
-        date_string = self.get_main_information()['MainDicomTags']['StudyDate']
-        time_string = self.get_main_information()['MainDicomTags']['StudyTime']
-
-        try:
-            return datetime(
-                year=int(date_string[:4]),
-                month=int(date_string[4:6]),
-                day=int(date_string[6:8]),
-                hour=int(time_string[:2]),
-                minute=int(time_string[2:4]),
-                second=int(time_string[4:6])
-            )
-        except ValueError:
-            return datetime(
-                year=int(date_string[:4]),
-                month=int(date_string[4:6]),
-                day=int(date_string[6:8]),
-            )
+        return get_datetime(self, 'StudyDate', 'StudyTime')
 
     def get_id(self) -> str:
         """Get Study ID
@@ -118,6 +107,9 @@ class Study:
         str
             Parent patient's identifier.
         """
+        if self.parent is not None:
+            return self.parent.identifier
+
         return self.get_main_information()['ParentPatient']
 
     def get_patient_information(self) -> Dict:
@@ -151,6 +143,8 @@ class Study:
             lambda i: Series(i['ID'], self.orthanc),
             series_identifiers
         ))
+        for series in self.series:
+            series.parent = self
 
     def __str__(self):
         return f'Study (id={self.get_id()}, identifier={self.get_identifier()})'
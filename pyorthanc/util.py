@@ -1,21 +1,25 @@
 # coding: utf-8
 # author: gabriel couture
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Callable, Optional
+from typing import TYPE_CHECKING, List, Dict, Callable, Optional
 
-from pyorthanc import Study, Series, Instance
+from pyorthanc.forest import PatientForest
+from pyorthanc.instance import Instance
 from pyorthanc.patient import Patient
-from pyorthanc.orthanc import Orthanc
+from pyorthanc.series import Series
+from pyorthanc.study import Study
+
+if TYPE_CHECKING:
+    from pyorthanc.orthanc import Orthanc
 
 
 def build_patient_forest(
-        orthanc: Orthanc,
+        orthanc: 'Orthanc',
         max_nbr_workers: int = 100,
         patient_filter: Optional[Callable] = None,
         study_filter: Optional[Callable] = None,
         series_filter: Optional[Callable] = None,
-        do_trim_forest_after_construction: bool = True) -> List[Patient]:
+        do_trim_forest_after_construction: bool = True) -> PatientForest:
     """Build a patient forest
 
     Each tree in the forest correspond to a patient. The layers in the
@@ -44,9 +48,11 @@ def build_patient_forest(
 
     Returns
     -------
-    List[Patient]
-        List of patient tree representation.
+    PatientForest
+        List of patient tree representation, indexed for lookups (see PatientForest).
     """
+    from concurrent.futures import ThreadPoolExecutor
+
     patient_identifiers = orthanc.get_patients()
 
     with ThreadPoolExecutor(max_workers=max_nbr_workers) as patient_executor:
@@ -63,12 +69,12 @@ def build_patient_forest(
 
     patient_forest = list(future_patients)
 
-    return trim_patient_forest(patient_forest) if do_trim_forest_after_construction else patient_forest
+    return trim_patient_forest(patient_forest) if do_trim_forest_after_construction else PatientForest(patient_forest)
 
 
 def _build_patient(
         patient_identifier: str,
-        orthanc: Orthanc,
+        orthanc: 'Orthanc',
         patient_filter: Optional[Callable],
         study_filter: Optional[Callable],
         series_filter: Optional[Callable]) -> Patient:
@@ -87,7 +93,7 @@ def _build_patient(
 
 def _build_study(
         study_information: Dict,
-        orthanc: Orthanc,
+        orthanc: 'Orthanc',
         study_filter: Optional[Callable],
         series_filter: Optional[Callable]) -> Study:
     series_information = orthanc.get_study_series_information(study_information['ID'])
@@ -105,7 +111,7 @@ def _build_study(
 
 def _build_series(
         series_information: Dict,
-        orthanc: Orthanc,
+        orthanc: 'Orthanc',
         series_filter: Optional[Callable]) -> Series:
     instance_information = orthanc.get_series_instance_information(series_information['ID'])
 
@@ -120,7 +126,7 @@ def _build_series(
     return series
 
 
-def trim_patient_forest(patient_forest: List[Patient]) -> List[Patient]:
+def trim_patient_forest(patient_forest: List[Patient]) -> PatientForest:
     """Trim Patient forest (list of patients)
 
     Parameters
@@ -130,8 +136,8 @@ def trim_patient_forest(patient_forest: List[Patient]) -> List[Patient]:
 
     Returns
     -------
-    List[Patient]
-        Pruned patient forest.
+    PatientForest
+        Pruned patient forest, indexed for lookups.
     """
     for patient in patient_forest:
         patient.trim()
@@ -140,7 +146,7 @@ def trim_patient_forest(patient_forest: List[Patient]) -> List[Patient]:
         lambda p: not p.is_empty(), patient_forest
     )
 
-    return list(patients)
+    return PatientForest(patients)
 
 
 def retrieve_and_write_patients_forest_to_given_path(
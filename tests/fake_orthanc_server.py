@@ -0,0 +1,1789 @@
+# coding: utf-8
+# author: gabriel couture
+"""In-process stand-in for an Orthanc server
+
+The fake server implements the subset of the Orthanc REST API that is
+used by `pyorthanc` (resources, instances upload/download, tools/find,
+tools/lookup, changes, jobs, modalities, queries, peers and attachments). Data is kept in
+memory, so a server starts in milliseconds and does not need the
+`Orthanc` binary. Latency and errors can be injected to exercise the
+concurrent utilities deterministically.
+
+Examples
+--------
+>>> from pyorthanc import Orthanc
+>>> with FakeOrthancServer() as server:
+...     orthanc = Orthanc(server.url)
+...     server.store.add_instance({'PatientID': 'P1', 'StudyInstanceUID': '1.2',
+...                                'SeriesInstanceUID': '1.2.3', 'SOPInstanceUID': '1.2.3.4'})
+...     orthanc.get_patients()
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# (group << 16 | element) -> (name, VR)
+DICOM_TAGS = {
+    0x00080005: ('SpecificCharacterSet', 'CS'),
+    0x00080012: ('InstanceCreationDate', 'DA'),
+    0x00080013: ('InstanceCreationTime', 'TM'),
+    0x00080016: ('SOPClassUID', 'UI'),
+    0x00080018: ('SOPInstanceUID', 'UI'),
+    0x00080020: ('StudyDate', 'DA'),
+    0x00080021: ('SeriesDate', 'DA'),
+    0x00080022: ('AcquisitionDate', 'DA'),
+    0x00080023: ('ContentDate', 'DA'),
+    0x00080030: ('StudyTime', 'TM'),
+    0x00080031: ('SeriesTime', 'TM'),
+    0x00080032: ('AcquisitionTime', 'TM'),
+    0x00080033: ('ContentTime', 'TM'),
+    0x00080050: ('AccessionNumber', 'SH'),
+    0x00080052: ('QueryRetrieveLevel', 'CS'),
+    0x00080060: ('Modality', 'CS'),
+    0x00080061: ('ModalitiesInStudy', 'CS'),
+    0x00080070: ('Manufacturer', 'LO'),
+    0x00080080: ('InstitutionName', 'LO'),
+    0x00080090: ('ReferringPhysicianName', 'PN'),
+    0x00081010: ('StationName', 'SH'),
+    0x00081030: ('StudyDescription', 'LO'),
+    0x0008103E: ('SeriesDescription', 'LO'),
+    0x00081090: ('ManufacturerModelName', 'LO'),
+    0x00100010: ('PatientName', 'PN'),
+    0x00100020: ('PatientID', 'LO'),
+    0x00100030: ('PatientBirthDate', 'DA'),
+    0x00100040: ('PatientSex', 'CS'),
+    0x00180015: ('BodyPartExamined', 'CS'),
+    0x00181020: ('SoftwareVersions', 'LO'),
+    0x00181030: ('ProtocolName', 'LO'),
+    0x0020000D: ('StudyInstanceUID', 'UI'),
+    0x0020000E: ('SeriesInstanceUID', 'UI'),
+    0x00200010: ('StudyID', 'SH'),
+    0x00200011: ('SeriesNumber', 'IS'),
+    0x00200012: ('AcquisitionNumber', 'IS'),
+    0x00200013: ('InstanceNumber', 'IS'),
+    0x00200032: ('ImagePositionPatient', 'DS'),
+    0x00200037: ('ImageOrientationPatient', 'DS'),
+    0x00280008: ('NumberOfFrames', 'IS'),
+    0x00280010: ('Rows', 'US'),
+    0x00280011: ('Columns', 'US'),
+}
+DICOM_TAGS_BY_NAME = {name: (tag, vr) for tag, (name, vr) in DICOM_TAGS.items()}
+
+LEVELS = ('Patient', 'Study', 'Series', 'Instance')
+LEVEL_ROUTES = {'patients': 'Patient', 'studies': 'Study', 'series': 'Series', 'instances': 'Instance'}
+ROUTES_OF_LEVEL = {level: route for route, level in LEVEL_ROUTES.items()}
+CHILDREN_KEYS = {'Patient': 'Studies', 'Study': 'Series', 'Series': 'Instances'}
+PARENT_KEYS = {'Study': 'ParentPatient', 'Series': 'ParentStudy', 'Instance': 'ParentSeries'}
+IDENTIFYING_TAGS = {
+    'Patient': 'PatientID',
+    'Study': 'StudyInstanceUID',
+    'Series': 'SeriesInstanceUID',
+    'Instance': 'SOPInstanceUID'
+}
+MAIN_DICOM_TAGS = {
+    'Patient': ('PatientBirthDate', 'PatientID', 'PatientName', 'PatientSex'),
+    'Study': ('AccessionNumber', 'InstitutionName', 'ReferringPhysicianName', 'StudyDate',
+              'StudyDescription', 'StudyID', 'StudyInstanceUID', 'StudyTime'),
+    'Series': ('BodyPartExamined', 'ImageOrientationPatient', 'Manufacturer', 'Modality', 'ProtocolName',
+               'SeriesDate', 'SeriesDescription', 'SeriesInstanceUID', 'SeriesNumber', 'SeriesTime',
+               'StationName'),
+    'Instance': ('AcquisitionNumber', 'ImagePositionPatient', 'InstanceCreationDate', 'InstanceCreationTime',
+                 'InstanceNumber', 'NumberOfFrames', 'SOPInstanceUID')
+}
+
+IMPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2'
+EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1'
+UNSUPPORTED_TRANSFER_SYNTAXES = ('1.2.840.10008.1.2.2', '1.2.840.10008.1.2.1.99')
+LONG_LENGTH_VRS = {'OB', 'OD', 'OF', 'OL', 'OW', 'SQ', 'UC', 'UN', 'UR', 'UT'}
+UNDEFINED_LENGTH = 0xFFFFFFFF
+ITEM = 0xFFFEE000
+ITEM_DELIMITATION = 0xFFFEE00D
+SEQUENCE_DELIMITATION = 0xFFFEE0DD
+PIXEL_DATA = 0x7FE00010
+
+CANCELED_JOB_ERROR_CODE = 37
+INTERNAL_ERROR_CODE = 1
+
+
+def orthanc_identifier(*uids: str) -> str:
+    """Compute the Orthanc identifier of a resource
+
+    Orthanc identifiers are the SHA-1 of the DICOM identifiers of the
+    resource and its ancestors, joined with '|'.
+
+    Parameters
+    ----------
+    uids
+        PatientID, StudyInstanceUID, SeriesInstanceUID and SOPInstanceUID
+        (only the ones up to the wanted level).
+
+    Returns
+    -------
+    str
+        Orthanc identifier.
+    """
+    digest = hashlib.sha1('|'.join(uids).encode()).hexdigest()
+
+    return '-'.join(digest[i:i + 8] for i in range(0, 40, 8))
+
+
+def generate_uid() -> str:
+    """Generate a random DICOM UID
+
+    Returns
+    -------
+    str
+        UID under the '2.25' root.
+    """
+    return f'2.25.{uuid.uuid4().int}'
+
+
+def parse_dicom_file(content: bytes) -> Dict[str, str]:
+    """Read the top-level tags of a DICOM file that are in `DICOM_TAGS`
+
+    Only little endian transfer syntaxes are supported. Parsing stops at
+    the pixel data.
+
+    Parameters
+    ----------
+    content
+        Bytes of a DICOM part 10 file.
+
+    Returns
+    -------
+    Dict[str, str]
+        Tag name -> value.
+    """
+    if len(content) < 132 or content[128:132] != b'DICM':
+        raise ValueError('Not a DICOM file')
+
+    offset = 132
+    meta = {}
+    while offset < len(content):
+        group = struct.unpack_from('<H', content, offset)[0]
+        if group != 0x0002:
+            break
+        tag, vr, value_offset, length, offset = _read_element(content, offset, explicit=True)
+        meta[tag] = content[value_offset:value_offset + length].decode('latin-1').strip('\x00 ')
+
+    transfer_syntax = meta.get(0x00020010, EXPLICIT_VR_LITTLE_ENDIAN)
+    if transfer_syntax in UNSUPPORTED_TRANSFER_SYNTAXES:
+        raise ValueError(f'Unsupported transfer syntax: {transfer_syntax}')
+    explicit = transfer_syntax != IMPLICIT_VR_LITTLE_ENDIAN
+
+    tags = {}
+    while offset + 8 <= len(content):
+        tag, vr, value_offset, length, offset = _read_element(content, offset, explicit)
+
+        if tag == PIXEL_DATA:
+            break
+        if tag not in DICOM_TAGS or length == UNDEFINED_LENGTH:
+            continue
+
+        name, dictionary_vr = DICOM_TAGS[tag]
+        value = content[value_offset:value_offset + length]
+        if (vr or dictionary_vr) == 'US':
+            tags[name] = str(struct.unpack_from('<H', value)[0]) if length >= 2 else ''
+        else:
+            tags[name] = value.decode('latin-1').strip('\x00 ')
+
+    return tags
+
+
+def _read_element(content: bytes, offset: int, explicit: bool) -> Tuple[int, Optional[str], int, int, int]:
+    group, element = struct.unpack_from('<HH', content, offset)
+    tag = (group << 16) | element
+    vr = None
+
+    if explicit:
+        vr = content[offset + 4:offset + 6].decode('latin-1')
+        if vr in LONG_LENGTH_VRS:
+            length = struct.unpack_from('<I', content, offset + 8)[0]
+            value_offset = offset + 12
+        else:
+            length = struct.unpack_from('<H', content, offset + 6)[0]
+            value_offset = offset + 8
+    else:
+        length = struct.unpack_from('<I', content, offset + 4)[0]
+        value_offset = offset + 8
+
+    if length == UNDEFINED_LENGTH:
+        return tag, vr, value_offset, length, _skip_undefined_length_sequence(content, value_offset, explicit)
+
+    return tag, vr, value_offset, length, value_offset + length
+
+
+def _skip_undefined_length_sequence(content: bytes, offset: int, explicit: bool) -> int:
+    while True:
+        group, element, length = struct.unpack_from('<HHI', content, offset)
+        tag = (group << 16) | element
+        offset += 8
+
+        if tag == SEQUENCE_DELIMITATION:
+            return offset
+        if tag != ITEM:
+            raise ValueError('Malformed sequence')
+
+        if length != UNDEFINED_LENGTH:
+            offset += length
+            continue
+
+        while True:
+            group, element = struct.unpack_from('<HH', content, offset)
+            if (group << 16) | element == ITEM_DELIMITATION:
+                offset += 8
+                break
+            offset = _read_element(content, offset, explicit)[4]
+
+
+def make_dicom_file(tags: Dict[str, str], pixel_data: bytes = b'') -> bytes:
+    """Write a minimal explicit VR little endian DICOM file
+
+    Parameters
+    ----------
+    tags
+        Tag name -> value. Names must be in `DICOM_TAGS`.
+    pixel_data
+        Payload written in the PixelData element (useful to control the file size).
+
+    Returns
+    -------
+    bytes
+        Bytes of the DICOM file.
+    """
+    meta = b''.join([
+        _encode_element(0x00020001, 'OB', b'\x00\x01'),
+        _encode_element(0x00020002, 'UI', tags.get('SOPClassUID', '1.2.840.10008.5.1.4.1.1.7').encode()),
+        _encode_element(0x00020003, 'UI', tags.get('SOPInstanceUID', '').encode()),
+        _encode_element(0x00020010, 'UI', EXPLICIT_VR_LITTLE_ENDIAN.encode())
+    ])
+    header = b'\x00' * 128 + b'DICM' + _encode_element(0x00020000, 'UL', struct.pack('<I', len(meta))) + meta
+
+    elements = []
+    for name, value in sorted(tags.items(), key=lambda item: DICOM_TAGS_BY_NAME[item[0]][0]):
+        tag, vr = DICOM_TAGS_BY_NAME[name]
+        encoded_value = struct.pack('<H', int(value)) if vr == 'US' else str(value).encode('latin-1')
+        elements.append(_encode_element(tag, vr, encoded_value))
+
+    if pixel_data:
+        elements.append(_encode_element(PIXEL_DATA, 'OB', pixel_data))
+
+    return header + b''.join(elements)
+
+
+def _encode_element(tag: int, vr: str, value: bytes) -> bytes:
+    if len(value) % 2 == 1:
+        value += b'\x00' if vr in ('UI', 'OB') else b' '
+
+    if vr in LONG_LENGTH_VRS:
+        return struct.pack('<HH2s2xI', tag >> 16, tag & 0xFFFF, vr.encode(), len(value)) + value
+
+    return struct.pack('<HH2sH', tag >> 16, tag & 0xFFFF, vr.encode(), len(value)) + value
+
+
+def get_disk_size(instance: Dict) -> int:
+    """Size of the file of an instance record in the storage (zlib compressed if 'IsCompressed')"""
+    if instance.get('IsCompressed', False):
+        return len(zlib.compress(instance['Content']))
+
+    return len(instance['Content'])
+
+
+def _now() -> str:
+    return time.strftime('%Y%m%dT%H%M%S')
+
+
+class FakeOrthancError(Exception):
+    """Error that is converted to an HTTP error response by the fake server"""
+
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class FakeOrthancStore:
+    """In-memory content of a fake Orthanc server
+
+    Resources are kept in dictionaries keyed by Orthanc identifiers, in
+    the order in which they were stored (this is the order used by the
+    `since`/`limit` parameters).
+    """
+
+    def __init__(self, aet: str = 'ORTHANC') -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        aet
+            AET of the server (used as default target of C-Move).
+        """
+        self.aet = aet
+        self.lock = threading.RLock()
+
+        self.resources: Dict[str, Dict[str, Dict]] = {level: {} for level in LEVELS}
+        self.changes: List[Dict] = []
+        self.jobs: Dict[str, Dict] = {}
+        self.modalities: Dict[str, Dict] = {}
+        self.remote_stores: Dict[str, 'FakeOrthancStore'] = {}
+        self.peers: Dict[str, Dict] = {}
+        self.peer_stores: Dict[str, 'FakeOrthancStore'] = {}
+        self.queries: Dict[str, Dict] = {}
+        self.anonymized_patient_counter = 0
+
+    def add_instance(self, tags: Dict[str, str], content: Optional[bytes] = None) -> Dict:
+        """Store an instance described by its tags
+
+        Parameters
+        ----------
+        tags
+            Tag name -> value. PatientID, StudyInstanceUID, SeriesInstanceUID
+            and SOPInstanceUID must be given.
+        content
+            File content. If None, a minimal DICOM file is generated from the tags.
+
+        Returns
+        -------
+        Dict
+            Same result as a POST on /instances.
+        """
+        if content is None:
+            content = make_dicom_file(tags)
+
+        return self._store_instance(dict(tags), content)
+
+    def add_dicom_file(self, content: bytes) -> Dict:
+        """Store a DICOM file
+
+        Parameters
+        ----------
+        content
+            Bytes of the DICOM file.
+
+        Returns
+        -------
+        Dict
+            Same result as a POST on /instances.
+        """
+        try:
+            tags = parse_dicom_file(content)
+        except (ValueError, struct.error) as error:
+            raise FakeOrthancError(400, f'Bad file format: {error}')
+
+        return self._store_instance(tags, content)
+
+    def add_modality(self, name: str, aet: Optional[str] = None,
+                     remote_store: Optional['FakeOrthancStore'] = None, latency: float = 0.0) -> None:
+        """Declare a remote modality
+
+        Parameters
+        ----------
+        name
+            Modality name (as in /modalities).
+        aet
+            AET of the modality (default to the upper-cased name).
+        remote_store
+            Content of the modality, used to answer C-Find and C-Move. The
+            store of another fake server can be given to link two servers.
+        latency
+            Delay (in seconds) of each DICOM network operation with this modality.
+        """
+        with self.lock:
+            self.modalities[name] = {
+                'AET': aet or name.upper(),
+                'Host': 'localhost',
+                'Port': 104,
+                'Latency': latency
+            }
+            self.remote_stores[name] = remote_store if remote_store is not None else FakeOrthancStore(aet or name.upper())
+
+    def add_peer(self, name: str, remote_store: Optional['FakeOrthancStore'] = None,
+                 url: str = 'http://localhost:8042/') -> None:
+        """Declare an Orthanc peer
+
+        Parameters
+        ----------
+        name
+            Peer name (as in /peers).
+        remote_store
+            Content of the peer. The store of another fake server can be
+            given to link two servers.
+        url
+            URL of the peer.
+        """
+        with self.lock:
+            self.peers[name] = {'Url': url}
+            self.peer_stores[name] = remote_store if remote_store is not None else FakeOrthancStore()
+
+    def corrupt_instance(self, identifier: str, content: bytes = b'corrupted') -> None:
+        """Replace the file of an instance without updating its MD5 (simulates a storage corruption)"""
+        with self.lock:
+            self.get('Instance', identifier)['Content'] = content
+
+    def lose_instance_file(self, identifier: str) -> None:
+        """Remove the file of an instance from the storage, but not from the index"""
+        with self.lock:
+            self.get('Instance', identifier)['IsFileLost'] = True
+
+    def get(self, level: str, identifier: str) -> Dict:
+        """Get the internal record of a resource
+
+        Raises a 404 FakeOrthancError if the resource does not exist.
+        """
+        try:
+            return self.resources[level][identifier]
+        except KeyError:
+            raise FakeOrthancError(404, 'Unknown resource')
+
+    def get_information(self, level: str, identifier: str) -> Dict:
+        """Get the resource information, as returned by GET /{level}/{identifier}"""
+        resource = self.get(level, identifier)
+        information = {
+            'ID': identifier,
+            'MainDicomTags': dict(resource['MainDicomTags']),
+            'Type': level
+        }
+
+        if level == 'Instance':
+            information.update({
+                'FileSize': len(resource['Content']),
+                'FileUuid': resource['FileUuid'],
+                'IndexInSeries': int(resource['Tags']['InstanceNumber']) if resource['Tags'].get('InstanceNumber', '').isdigit() else None,
+            })
+        else:
+            information.update({
+                'IsStable': False,
+                'LastUpdate': resource['LastUpdate'],
+                CHILDREN_KEYS[level]: list(resource['Children'])
+            })
+
+        if level in PARENT_KEYS:
+            information[PARENT_KEYS[level]] = resource['Parent']
+
+        if level == 'Study':
+            information['PatientMainDicomTags'] = dict(self.resources['Patient'][resource['Parent']]['MainDicomTags'])
+
+        if level == 'Series':
+            information['ExpectedNumberOfInstances'] = None
+            information['Status'] = 'Unknown'
+
+        return information
+
+    def get_instances_of(self, level: str, identifier: str) -> List[str]:
+        """Get the identifiers of all instances under a resource"""
+        resource = self.get(level, identifier)
+        if level == 'Instance':
+            return [identifier]
+
+        child_level = LEVELS[LEVELS.index(level) + 1]
+        instances = []
+        for child in resource['Children']:
+            instances += self.get_instances_of(child_level, child)
+
+        return instances
+
+    def get_descendants(self, level: str, identifier: str, wanted_level: str) -> List[str]:
+        """Get the identifiers of all the descendants of a resource at the given level"""
+        if level == wanted_level:
+            return [identifier]
+
+        child_level = LEVELS[LEVELS.index(level) + 1]
+        descendants = []
+        for child in self.get(level, identifier)['Children']:
+            descendants += self.get_descendants(child_level, child, wanted_level)
+
+        return descendants
+
+    def get_ancestor(self, level: str, identifier: str, wanted_level: str) -> str:
+        """Get the identifier of the ancestor of a resource at the given level"""
+        while level != wanted_level:
+            identifier = self.get(level, identifier)['Parent']
+            level = LEVELS[LEVELS.index(level) - 1]
+
+        return identifier
+
+    def get_statistics(self, level: str, identifier: str) -> Dict:
+        """Get the resource statistics, as returned by GET /{level}/{identifier}/statistics"""
+        instances = self.get_instances_of(level, identifier)
+        disk_size = sum(get_disk_size(self.resources['Instance'][i]) for i in instances)
+        uncompressed_size = sum(len(self.resources['Instance'][i]['Content']) for i in instances)
+
+        statistics = {
+            'DiskSize': str(disk_size),
+            'DiskSizeMB': disk_size // (1024 * 1024),
+            'UncompressedSize': str(uncompressed_size),
+            'UncompressedSizeMB': uncompressed_size // (1024 * 1024)
+        }
+        for counted_level, key in (('Study', 'CountStudies'), ('Series', 'CountSeries'), ('Instance', 'CountInstances')):
+            if LEVELS.index(counted_level) > LEVELS.index(level):
+                statistics[key] = len(self.get_descendants(level, identifier, counted_level))
+
+        return statistics
+
+    def delete(self, level: str, identifier: str) -> Dict:
+        """Delete a resource, its descendants and the ancestors that become empty"""
+        resource = self.get(level, identifier)
+        self._delete_subtree(level, identifier)
+
+        parent_identifier = resource.get('Parent')
+        parent_level = LEVELS[LEVELS.index(level) - 1] if level != 'Patient' else None
+        while parent_level is not None:
+            parent = self.resources[parent_level][parent_identifier]
+            parent['Children'].remove(identifier)
+            if parent['Children']:
+                return {'RemainingAncestor': {
+                    'ID': parent_identifier,
+                    'Path': f'/{ROUTES_OF_LEVEL[parent_level]}/{parent_identifier}',
+                    'Type': parent_level
+                }}
+            self.resources[parent_level].pop(parent_identifier)
+            self._log_change('Deleted', parent_level, parent_identifier)
+            identifier, parent_identifier = parent_identifier, parent.get('Parent')
+            parent_level = LEVELS[LEVELS.index(parent_level) - 1] if parent_level != 'Patient' else None
+
+        return {'RemainingAncestor': None}
+
+    def _delete_subtree(self, level: str, identifier: str) -> None:
+        resource = self.resources[level].pop(identifier)
+        if level != 'Instance':
+            child_level = LEVELS[LEVELS.index(level) + 1]
+            for child in resource['Children']:
+                self._delete_subtree(child_level, child)
+        self._log_change('Deleted', level, identifier)
+
+    def find(self, level: str, query: Dict[str, str], case_sensitive: bool = True) -> List[str]:
+        """Find resources matching a query, as in /tools/find"""
+        matching = []
+        for identifier in self.resources[level]:
+            tags = self._get_tags_with_ancestors(level, identifier)
+            if all(_match(tags.get(name, ''), str(pattern), name, case_sensitive) for name, pattern in query.items()):
+                matching.append(identifier)
+
+        return matching
+
+    def copy_instances_to(self, instance_identifiers: List[str], target: 'FakeOrthancStore') -> int:
+        """Copy instances to another store (simulates C-Store / C-Move / peers)"""
+        with self.lock:
+            instances = [(dict(self.resources['Instance'][i]['Tags']), self.resources['Instance'][i]['Content'])
+                         for i in instance_identifiers]
+        with target.lock:
+            for tags, content in instances:
+                target._store_instance(tags, content)
+
+        return len(instances)
+
+    def _get_tags_with_ancestors(self, level: str, identifier: str) -> Dict[str, str]:
+        tags = {}
+        while True:
+            resource = self.resources[level][identifier]
+            tags.update(resource['MainDicomTags'])
+            if level == 'Instance':
+                tags.update(resource['Tags'])
+            if level == 'Patient':
+                return tags
+            identifier = resource['Parent']
+            level = LEVELS[LEVELS.index(level) - 1]
+
+    def _store_instance(self, tags: Dict[str, str], content: bytes) -> Dict:
+        with self.lock:
+            uids = []
+            for level in LEVELS:
+                if not tags.get(IDENTIFYING_TAGS[level]) and level != 'Patient':
+                    raise FakeOrthancError(400, f'Missing {IDENTIFYING_TAGS[level]}')
+                uids.append(tags.get(IDENTIFYING_TAGS[level], ''))
+
+            identifiers = [orthanc_identifier(*uids[:i + 1]) for i in range(len(LEVELS))]
+            instance_identifier = identifiers[-1]
+
+            result = {
+                'ID': instance_identifier,
+                'ParentPatient': identifiers[0],
+                'ParentStudy': identifiers[1],
+                'ParentSeries': identifiers[2],
+                'Path': f'/instances/{instance_identifier}',
+                'Status': 'Success'
+            }
+            if instance_identifier in self.resources['Instance']:
+                result['Status'] = 'AlreadyStored'
+                return result
+
+            for index, level in enumerate(LEVELS):
+                identifier = identifiers[index]
+                if identifier in self.resources[level]:
+                    self.resources[level][identifier]['LastUpdate'] = _now()
+                    continue
+
+                record = {
+                    'ID': identifier,
+                    'Parent': identifiers[index - 1] if index > 0 else None,
+                    'Children': [],
+                    'MainDicomTags': {name: tags[name] for name in MAIN_DICOM_TAGS[level] if name in tags},
+                    'LastUpdate': _now(),
+                    'Metadata': {}
+                }
+                if level == 'Patient':
+                    record['IsProtected'] = False
+                if level == 'Instance':
+                    record.update({
+                        'Tags': dict(tags),
+                        'Content': content,
+                        'FileUuid': str(uuid.uuid4()),
+                        'Md5': hashlib.md5(content).hexdigest()
+                    })
+                if index > 0:
+                    self.resources[LEVELS[index - 1]][identifiers[index - 1]]['Children'].append(identifier)
+
+                self.resources[level][identifier] = record
+                self._log_change(f'New{level}', level, identifier)
+
+            return result
+
+    def _log_change(self, change_type: str, level: str, identifier: str) -> None:
+        self.changes.append({
+            'ChangeType': change_type,
+            'Date': _now(),
+            'ID': identifier,
+            'Path': f'/{ROUTES_OF_LEVEL[level]}/{identifier}',
+            'ResourceType': level,
+            'Seq': len(self.changes) + 1
+        })
+
+
+def setup_data(store: FakeOrthancStore, directory: str = './tests/data/dicom_files/') -> None:
+    """Load the test DICOM files in a fake Orthanc store
+
+    Parameters
+    ----------
+    store
+        Store of the fake server.
+    directory
+        Directory of the DICOM files.
+    """
+    for file_name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, file_name), 'rb') as file_handler:
+            store.add_dicom_file(file_handler.read())
+
+
+def _match(value: str, pattern: str, name: str, case_sensitive: bool) -> bool:
+    if pattern in ('', '*'):
+        return True
+
+    if '\\' in pattern:
+        return any(_match(value, p, name, case_sensitive) for p in pattern.split('\\'))
+
+    if name.endswith('Date') and '-' in pattern:
+        start, end = pattern.split('-', 1)
+        return value != '' and (start == '' or value >= start) and (end == '' or value <= end)
+
+    if not case_sensitive:
+        value, pattern = value.lower(), pattern.lower()
+
+    return fnmatch.fnmatchcase(value, pattern)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Route:
+    def __init__(self, method: str, pattern: str, handler: Callable) -> None:
+        self.method = method
+        self.regex = re.compile(f'^{pattern}$')
+        self.handler = handler
+
+
+class FakeOrthancServer:
+    """HTTP server that behaves like Orthanc, running in a background thread
+
+    Examples
+    --------
+    >>> server = FakeOrthancServer(latency=0.01, error_rate=0.1, seed=42)
+    >>> server.start()
+    >>> orthanc = Orthanc(server.url)
+    >>> ...
+    >>> server.stop()
+    """
+
+    def __init__(
+            self, store: Optional[FakeOrthancStore] = None,
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            seed: int = 0,
+            job_duration: float = 0.0,
+            job_error_rate: float = 0.0,
+            jobs_history_size: Optional[int] = None,
+            host: str = '127.0.0.1',
+            port: int = 0) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        store
+            In-memory content of the server. A new empty store is created if None.
+        latency
+            Delay (in seconds) added to every HTTP request.
+        error_rate
+            Probability that a request fails with an HTTP 500 error.
+        seed
+            Seed of the random generator used for error injection.
+        job_duration
+            Time (in seconds) that an asynchronous job stays running before completing.
+        job_error_rate
+            Probability that an asynchronous job ends in the 'Failure' state.
+        jobs_history_size
+            Number of finished jobs kept (Orthanc's JobsHistorySize). The oldest
+            finished jobs are forgotten beyond it. Unlimited if None.
+        host
+            Host to bind.
+        port
+            Port to bind (0 lets the system choose a free port).
+        """
+        self.store = store if store is not None else FakeOrthancStore()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.job_duration = job_duration
+        self.job_error_rate = job_error_rate
+        self.jobs_history_size = jobs_history_size
+        self.requests_log: List[Tuple[str, str]] = []
+
+        self._random = random.Random(seed)
+        self._injected_errors: List[List] = []
+        self._log_lock = threading.Lock()
+        self._http_server = _ThreadingHTTPServer((host, port), self._make_handler_class())
+        self._thread: Optional[threading.Thread] = None
+        self._routes = self._make_routes()
+
+    @property
+    def url(self) -> str:
+        host, port = self._http_server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeOrthancServer':
+        """Start serving in a daemon thread"""
+        self._thread = threading.Thread(target=self._http_server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and release the port"""
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'FakeOrthancServer':
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def inject_errors(self, route_pattern: str, count: int = 1, status_code: int = 500) -> None:
+        """Make the next matching requests fail
+
+        Parameters
+        ----------
+        route_pattern
+            Regular expression matched (with `re.search`) against 'METHOD /path'.
+        count
+            Number of requests that will fail.
+        status_code
+            HTTP status code of the failures.
+        """
+        with self._log_lock:
+            self._injected_errors.append([re.compile(route_pattern), count, status_code])
+
+    def count_requests(self, route_pattern: str = '') -> int:
+        """Count logged requests matching a regular expression on 'METHOD /path?query'"""
+        regex = re.compile(route_pattern)
+        with self._log_lock:
+            return len([1 for method, path in self.requests_log if regex.search(f'{method} {path}')])
+
+    def _make_handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                server._handle(self, 'GET')
+
+            def do_POST(self) -> None:
+                server._handle(self, 'POST')
+
+            def do_PUT(self) -> None:
+                server._handle(self, 'PUT')
+
+            def do_DELETE(self) -> None:
+                server._handle(self, 'DELETE')
+
+        return Handler
+
+    def _handle(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        url = urlsplit(request.path)
+        path = unquote(url.path).rstrip('/') or '/'
+        params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+
+        with self._log_lock:
+            self.requests_log.append((method, request.path))
+            status_code = self._draw_injected_error(f'{method} {path}')
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        try:
+            if status_code is not None:
+                raise FakeOrthancError(status_code, 'Injected error')
+            response = self._dispatch(method, path, params, body)
+        except FakeOrthancError as error:
+            self._send(request, error.status_code, json.dumps({
+                'HttpStatus': error.status_code,
+                'Message': error.message,
+                'Method': method,
+                'Uri': path
+            }).encode(), 'application/json')
+            return
+
+        if isinstance(response, bytes):
+            self._send(request, 200, response, 'application/octet-stream')
+        else:
+            self._send(request, 200, json.dumps(response).encode(), 'application/json')
+
+    def _draw_injected_error(self, route: str) -> Optional[int]:
+        for injected_error in self._injected_errors:
+            regex, count, status_code = injected_error
+            if count > 0 and regex.search(route):
+                injected_error[1] -= 1
+                return status_code
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 500
+
+        return None
+
+    @staticmethod
+    def _send(request: BaseHTTPRequestHandler, status_code: int, payload: bytes, content_type: str) -> None:
+        request.send_response(status_code)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def _dispatch(self, method: str, path: str, params: Dict[str, str], body: bytes) -> Any:
+        for route in self._routes:
+            if route.method != method:
+                continue
+            match = route.regex.match(path)
+            if match is not None:
+                return route.handler(params, body, *match.groups())
+
+        raise FakeOrthancError(404, 'Unknown URI')
+
+    def _make_routes(self) -> List[_Route]:
+        levels = '(patients|studies|series|instances)'
+        identifier = '([0-9a-f-]+)'
+
+        return [
+            _Route('GET', '/system', self._get_system),
+            _Route('GET', '/statistics', self._get_global_statistics),
+            _Route('GET', '/changes', self._get_changes),
+            _Route('DELETE', '/changes', self._delete_changes),
+            _Route('POST', '/instances', self._post_instances),
+            _Route('POST', '/tools/find', self._post_find),
+            _Route('POST', '/tools/lookup', self._post_lookup),
+            _Route('POST', '/tools/create_(archive|media)', self._post_create_archive),
+            _Route('GET', '/jobs', self._get_jobs),
+            _Route('GET', f'/jobs/{identifier}', self._get_job),
+            _Route('POST', f'/jobs/{identifier}/(cancel|pause|resume|resubmit)', self._post_job_action),
+            _Route('GET', f'/jobs/{identifier}/([a-z]+)', self._get_job_output),
+            _Route('GET', '/modalities', self._get_modalities),
+            _Route('GET', '/modalities/([^/]+)', self._get_modality),
+            _Route('PUT', '/modalities/([^/]+)', self._put_modality),
+            _Route('DELETE', '/modalities/([^/]+)', self._delete_modality),
+            _Route('POST', '/modalities/([^/]+)/echo', self._post_echo),
+            _Route('POST', '/modalities/([^/]+)/query', self._post_query),
+            _Route('POST', '/modalities/([^/]+)/move', self._post_modality_move),
+            _Route('POST', '/modalities/([^/]+)/store', self._post_modality_store),
+            _Route('GET', '/queries', self._get_queries),
+            _Route('GET', f'/queries/{identifier}', self._get_query),
+            _Route('DELETE', f'/queries/{identifier}', self._delete_query),
+            _Route('GET', f'/queries/{identifier}/answers', self._get_query_answers),
+            _Route('GET', f'/queries/{identifier}/answers/([0-9]+)/content', self._get_query_answer_content),
+            _Route('POST', f'/queries/{identifier}/answers/([0-9]+)/retrieve', self._post_query_answer_retrieve),
+            _Route('POST', f'/queries/{identifier}/answers/([0-9]+)/query-(studies|series|instances)', self._post_query_children),
+            _Route('GET', f'/queries/{identifier}/(level|modality|query)', self._get_query_field),
+            _Route('POST', f'/queries/{identifier}/retrieve', self._post_query_retrieve),
+            _Route('GET', f'/{levels}', self._get_resources),
+            _Route('GET', f'/{levels}/{identifier}', self._get_resource),
+            _Route('DELETE', f'/{levels}/{identifier}', self._delete_resource),
+            _Route('GET', f'/{levels}/{identifier}/(patients|studies|series|instances)', self._get_descendant_resources),
+            _Route('GET', f'/{levels}/{identifier}/(patient|study|series)', self._get_ancestor_resource),
+            _Route('GET', f'/{levels}/{identifier}/statistics', self._get_statistics),
+            _Route('GET', f'/{levels}/{identifier}/instances-tags', self._get_instances_tags),
+            _Route('GET', f'/{levels}/{identifier}/archive', self._get_archive),
+            _Route('POST', f'/{levels}/{identifier}/archive', self._post_archive),
+            _Route('POST', f'/{levels}/{identifier}/(anonymize|modify)', self._post_modification),
+            _Route('GET', f'/{levels}/{identifier}/metadata', self._get_metadata),
+            _Route('GET', f'/{levels}/{identifier}/metadata/([^/]+)', self._get_metadata_value),
+            _Route('PUT', f'/{levels}/{identifier}/metadata/([^/]+)', self._put_metadata_value),
+            _Route('GET', f'/patients/{identifier}/protected', self._get_protected),
+            _Route('PUT', f'/patients/{identifier}/protected', self._put_protected),
+            _Route('GET', f'/instances/{identifier}/file', self._get_instance_file),
+            _Route('GET', f'/instances/{identifier}/simplified-tags', self._get_instance_simplified_tags),
+            _Route('GET', f'/instances/{identifier}/tags', self._get_instance_tags),
+            _Route('GET', f'/instances/{identifier}/attachments', self._get_attachments),
+            _Route('GET', f'/instances/{identifier}/attachments/dicom', self._get_attachment),
+            _Route('GET', f'/instances/{identifier}/attachments/dicom/(data|md5|size|is-compressed|compressed-size)', self._get_attachment_field),
+            _Route('POST', f'/instances/{identifier}/attachments/dicom/verify-md5', self._post_attachment_verify_md5),
+            _Route('POST', f'/instances/{identifier}/attachments/dicom/(compress|uncompress)', self._post_attachment_compression),
+            _Route('GET', '/peers', self._get_peers),
+            _Route('GET', '/peers/([^/]+)', self._get_peer),
+            _Route('PUT', '/peers/([^/]+)', self._put_peer),
+            _Route('DELETE', '/peers/([^/]+)', self._delete_peer),
+            _Route('POST', '/peers/([^/]+)/store', self._post_peer_store),
+        ]
+
+    # System
+    def _get_system(self, params: Dict, body: bytes) -> Dict:
+        return {
+            'ApiVersion': 4,
+            'DicomAet': self.store.aet,
+            'Name': 'FakeOrthanc',
+            'Version': '1.5.8'
+        }
+
+    def _get_global_statistics(self, params: Dict, body: bytes) -> Dict:
+        with self.store.lock:
+            disk_size = sum(get_disk_size(i) for i in self.store.resources['Instance'].values())
+            uncompressed_size = sum(len(i['Content']) for i in self.store.resources['Instance'].values())
+
+            return {
+                'CountInstances': len(self.store.resources['Instance']),
+                'CountPatients': len(self.store.resources['Patient']),
+                'CountSeries': len(self.store.resources['Series']),
+                'CountStudies': len(self.store.resources['Study']),
+                'TotalDiskSize': str(disk_size),
+                'TotalDiskSizeMB': disk_size // (1024 * 1024),
+                'TotalUncompressedSize': str(uncompressed_size),
+                'TotalUncompressedSizeMB': uncompressed_size // (1024 * 1024)
+            }
+
+    # Changes
+    def _get_changes(self, params: Dict, body: bytes) -> Dict:
+        with self.store.lock:
+            if 'last' in params:
+                changes = self.store.changes[-1:]
+            else:
+                since = int(params.get('since') or 0)
+                limit = int(params.get('limit') or 100)
+                changes = [c for c in self.store.changes if c['Seq'] > since][:limit]
+
+            last = changes[-1]['Seq'] if changes else len(self.store.changes)
+
+            return {
+                'Changes': changes,
+                'Done': last >= len(self.store.changes),
+                'Last': last
+            }
+
+    def _delete_changes(self, params: Dict, body: bytes) -> Dict:
+        with self.store.lock:
+            self.store.changes.clear()
+
+        return {}
+
+    # Resources
+    def _post_instances(self, params: Dict, body: bytes) -> Dict:
+        return self.store.add_dicom_file(body)
+
+    def _get_resources(self, params: Dict, body: bytes, route: str) -> List:
+        level = LEVEL_ROUTES[route]
+        with self.store.lock:
+            identifiers = list(self.store.resources[level])
+            since = int(params.get('since') or 0)
+            if 'limit' in params:
+                identifiers = identifiers[since:since + int(params['limit'])]
+            else:
+                identifiers = identifiers[since:]
+
+            if 'expand' in params:
+                return [self.store.get_information(level, i) for i in identifiers]
+
+            return identifiers
+
+    def _get_resource(self, params: Dict, body: bytes, route: str, identifier: str) -> Dict:
+        with self.store.lock:
+            return self.store.get_information(LEVEL_ROUTES[route], identifier)
+
+    def _delete_resource(self, params: Dict, body: bytes, route: str, identifier: str) -> Dict:
+        with self.store.lock:
+            return self.store.delete(LEVEL_ROUTES[route], identifier)
+
+    def _get_descendant_resources(self, params: Dict, body: bytes, route: str, identifier: str, child_route: str) -> List:
+        level, child_level = LEVEL_ROUTES[route], LEVEL_ROUTES[child_route]
+        if LEVELS.index(child_level) <= LEVELS.index(level):
+            raise FakeOrthancError(404, 'Unknown URI')
+
+        with self.store.lock:
+            return [
+                self.store.get_information(child_level, i)
+                for i in self.store.get_descendants(level, identifier, child_level)
+            ]
+
+    def _get_ancestor_resource(self, params: Dict, body: bytes, route: str, identifier: str, parent_route: str) -> Dict:
+        level = LEVEL_ROUTES[route]
+        parent_level = {'patient': 'Patient', 'study': 'Study', 'series': 'Series'}[parent_route]
+        if LEVELS.index(parent_level) >= LEVELS.index(level):
+            raise FakeOrthancError(404, 'Unknown URI')
+
+        with self.store.lock:
+            return self.store.get_information(parent_level, self.store.get_ancestor(level, identifier, parent_level))
+
+    def _get_statistics(self, params: Dict, body: bytes, route: str, identifier: str) -> Dict:
+        with self.store.lock:
+            return self.store.get_statistics(LEVEL_ROUTES[route], identifier)
+
+    def _get_metadata(self, params: Dict, body: bytes, route: str, identifier: str) -> List:
+        with self.store.lock:
+            return list(self.store.get(LEVEL_ROUTES[route], identifier)['Metadata'])
+
+    def _get_metadata_value(self, params: Dict, body: bytes, route: str, identifier: str, name: str) -> bytes:
+        with self.store.lock:
+            try:
+                return self.store.get(LEVEL_ROUTES[route], identifier)['Metadata'][name].encode()
+            except KeyError:
+                raise FakeOrthancError(404, 'Unknown metadata')
+
+    def _put_metadata_value(self, params: Dict, body: bytes, route: str, identifier: str, name: str) -> Dict:
+        with self.store.lock:
+            value = json.loads(body) if body else ''
+            self.store.get(LEVEL_ROUTES[route], identifier)['Metadata'][name] = str(value)
+
+        return {}
+
+    def _get_protected(self, params: Dict, body: bytes, identifier: str) -> int:
+        with self.store.lock:
+            return 1 if self.store.get('Patient', identifier)['IsProtected'] else 0
+
+    def _put_protected(self, params: Dict, body: bytes, identifier: str) -> Dict:
+        with self.store.lock:
+            self.store.get('Patient', identifier)['IsProtected'] = json.loads(body) in (1, '1')
+
+        return {}
+
+    def _get_instance_file(self, params: Dict, body: bytes, identifier: str) -> bytes:
+        with self.store.lock:
+            return self.store.get('Instance', identifier)['Content']
+
+    def _get_instance_simplified_tags(self, params: Dict, body: bytes, identifier: str) -> Dict:
+        with self.store.lock:
+            return dict(self.store.get('Instance', identifier)['Tags'])
+
+    def _get_instance_tags(self, params: Dict, body: bytes, identifier: str) -> Dict:
+        with self.store.lock:
+            tags = self.store.get('Instance', identifier)['Tags']
+
+        if 'simplify' in params:
+            return dict(tags)
+
+        return _to_full_tags(tags)
+
+    def _get_instances_tags(self, params: Dict, body: bytes, route: str, identifier: str) -> Dict:
+        with self.store.lock:
+            instances = self.store.get_instances_of(LEVEL_ROUTES[route], identifier)
+            tags = {i: self.store.resources['Instance'][i]['Tags'] for i in instances}
+
+        if 'simplify' in params:
+            return {i: dict(t) for i, t in tags.items()}
+
+        return {i: _to_full_tags(t) for i, t in tags.items()}
+
+    # Attachments
+    def _get_attachments(self, params: Dict, body: bytes, identifier: str) -> List[str]:
+        with self.store.lock:
+            self.store.get('Instance', identifier)
+
+        return ['dicom']
+
+    def _get_attachment(self, params: Dict, body: bytes, identifier: str) -> List[str]:
+        with self.store.lock:
+            self.store.get('Instance', identifier)
+
+        return ['compress', 'compressed-size', 'data', 'is-compressed', 'md5', 'size', 'uncompress', 'verify-md5']
+
+    def _get_attachment_field(self, params: Dict, body: bytes, identifier: str, field: str) -> Any:
+        with self.store.lock:
+            instance = self.store.get('Instance', identifier)
+
+        if field == 'data':
+            return instance['Content']
+        if field == 'md5':
+            return instance['Md5'].encode()  # Orthanc answers the MD5 as plain text
+        if field == 'is-compressed':
+            return int(instance.get('IsCompressed', False))
+        if field == 'compressed-size':
+            return get_disk_size(instance)
+
+        return len(instance['Content'])
+
+    def _post_attachment_compression(self, params: Dict, body: bytes, identifier: str, action: str) -> Dict:
+        with self.store.lock:
+            self.store.get('Instance', identifier)['IsCompressed'] = action == 'compress'
+
+        return {}
+
+    def _post_attachment_verify_md5(self, params: Dict, body: bytes, identifier: str) -> Dict:
+        with self.store.lock:
+            instance = self.store.get('Instance', identifier)
+
+        if instance.get('IsFileLost', False):
+            raise FakeOrthancError(404, 'Inexistent file')
+        if hashlib.md5(instance['Content']).hexdigest() != instance['Md5']:
+            raise FakeOrthancError(500, 'Corrupted file (e.g. inconsistent MD5 hash)')
+
+        return {}
+
+    # Peers
+    def _get_peer_record(self, name: str) -> Dict:
+        try:
+            return self.store.peers[name]
+        except KeyError:
+            raise FakeOrthancError(404, 'Unknown peer')
+
+    def _get_peers(self, params: Dict, body: bytes) -> Any:
+        with self.store.lock:
+            if 'expand' in params:
+                return {name: dict(peer) for name, peer in self.store.peers.items()}
+
+            return list(self.store.peers)
+
+    def _get_peer(self, params: Dict, body: bytes, name: str) -> List[str]:
+        with self.store.lock:
+            self._get_peer_record(name)
+
+        return ['store', 'system']
+
+    def _put_peer(self, params: Dict, body: bytes, name: str) -> Dict:
+        request = _load_json(body)
+        url = request[0] if isinstance(request, list) else request.get('Url', '')
+        self.store.add_peer(name, self.store.peer_stores.get(name), url)
+
+        return {}
+
+    def _delete_peer(self, params: Dict, body: bytes, name: str) -> Dict:
+        with self.store.lock:
+            self._get_peer_record(name)
+            del self.store.peers[name]
+            del self.store.peer_stores[name]
+
+        return {}
+
+    def _post_peer_store(self, params: Dict, body: bytes, name: str) -> Any:
+        request = _load_json(body)
+        resources = request if isinstance(request, list) else (request.get('Resources', []) if isinstance(request, dict) else [request])
+
+        with self.store.lock:
+            self._get_peer_record(name)
+            instances = []
+            for identifier in resources:
+                instances += self.store.get_instances_of(self._find_level(identifier), identifier)
+
+        def run() -> Tuple[Dict, Dict]:
+            count = self.store.copy_instances_to(instances, self.store.peer_stores[name])
+
+            return {
+                'Description': 'REST API',
+                'FailedInstancesCount': 0,
+                'InstancesCount': count,
+                'Peer': [self.store.peers[name]['Url']]
+            }, {}
+
+        if isinstance(request, dict) and request.get('Asynchronous', False):
+            return self._submit_job('OrthancPeerStore', run)
+
+        return run()[0]
+
+    # Tools
+    def _post_find(self, params: Dict, body: bytes) -> List:
+        request = _load_json(body)
+        level = request.get('Level')
+        if level not in LEVELS:
+            raise FakeOrthancError(400, 'Bad request')
+
+        with self.store.lock:
+            identifiers = self.store.find(level, request.get('Query', {}), request.get('CaseSensitive', True))
+            since = int(request.get('Since', 0))
+            limit = int(request.get('Limit', 0))
+            identifiers = identifiers[since:since + limit] if limit else identifiers[since:]
+
+            if request.get('Expand', False):
+                return [self.store.get_information(level, i) for i in identifiers]
+
+            return identifiers
+
+    def _post_lookup(self, params: Dict, body: bytes) -> List:
+        value = _load_json(body)
+        if not isinstance(value, str):
+            value = body.decode()
+
+        with self.store.lock:
+            return [
+                {'ID': identifier, 'Path': f'/{ROUTES_OF_LEVEL[level]}/{identifier}', 'Type': level}
+                for level in LEVELS
+                for identifier, resource in self.store.resources[level].items()
+                if resource['MainDicomTags'].get(IDENTIFYING_TAGS[level]) == value
+            ]
+
+    # Archives
+    def _get_archive(self, params: Dict, body: bytes, route: str, identifier: str) -> bytes:
+        with self.store.lock:
+            return self._make_zip(self.store.get_instances_of(LEVEL_ROUTES[route], identifier))
+
+    def _post_archive(self, params: Dict, body: bytes, route: str, identifier: str) -> Any:
+        request = _load_json(body)
+        with self.store.lock:
+            instances = self.store.get_instances_of(LEVEL_ROUTES[route], identifier)
+
+        return self._run_archive(instances, request if isinstance(request, dict) else {})
+
+    def _post_create_archive(self, params: Dict, body: bytes, kind: str) -> Any:
+        request = _load_json(body)
+        resources = request if isinstance(request, list) else request.get('Resources', [])
+        with self.store.lock:
+            instances = []
+            for identifier in resources:
+                level = self._find_level(identifier)
+                instances += self.store.get_instances_of(level, identifier)
+
+        return self._run_archive(instances, request if isinstance(request, dict) else {}, kind == 'media')
+
+    def _run_archive(self, instances: List[str], request: Dict, with_dicomdir: bool = False) -> Any:
+        if not request.get('Asynchronous', False):
+            with self.store.lock:
+                return self._make_zip(instances, with_dicomdir)
+
+        return self._submit_job('Media' if with_dicomdir else 'Archive',
+                                lambda: ({}, {'archive': self._make_zip(instances, with_dicomdir)}))
+
+    def _find_level(self, identifier: str) -> str:
+        for level in LEVELS:
+            if identifier in self.store.resources[level]:
+                return level
+
+        raise FakeOrthancError(404, 'Unknown resource')
+
+    def _make_zip(self, instance_identifiers: List[str], with_dicomdir: bool = False) -> bytes:
+        buffer = _UnseekableBuffer()  # Members are followed by data descriptors, as in the archives streamed by Orthanc
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for index, identifier in enumerate(instance_identifiers):
+                tags = self.store._get_tags_with_ancestors('Instance', identifier)
+                path = '/'.join([
+                    f"{tags.get('PatientID', '')} {tags.get('PatientName', '')}".strip(),
+                    f"{tags.get('StudyDate', '')} {tags.get('StudyDescription', '')}".strip(),
+                    f"{tags.get('Modality', '')}{tags.get('SeriesNumber', '')} {tags.get('SeriesDescription', '')}".strip(),
+                    f"{tags.get('Modality', 'IM')}{index + 1:06d}.dcm"
+                ])
+                zip_file.writestr(path, self.store.resources['Instance'][identifier]['Content'])
+            if with_dicomdir:
+                zip_file.writestr('DICOMDIR', b'DICM')  # Only a placeholder, the content is not a real DICOMDIR
+
+        return buffer.getvalue()
+
+    # Anonymization and modification
+    def _post_modification(self, params: Dict, body: bytes, route: str, identifier: str, operation: str) -> Any:
+        try:
+            request = json.loads(body) if body else {}
+        except ValueError:
+            raise FakeOrthancError(400, 'Bad request')
+        if not isinstance(request, dict):
+            raise FakeOrthancError(400, f'The body of a {operation} request must be a JSON object')
+        level = LEVEL_ROUTES[route]
+
+        with self.store.lock:
+            resource = self.store.get(level, identifier)
+
+            if level == 'Instance':
+                tags = _modify_tags(dict(resource['Tags']), request, operation == 'anonymize', {}, level, self.store)
+                return make_dicom_file({k: v for k, v in tags.items() if k in DICOM_TAGS_BY_NAME})
+
+        def run() -> Tuple[Dict, Dict]:
+            with self.store.lock:
+                return self._modify(level, identifier, request, operation == 'anonymize'), {}
+
+        if request.get('Asynchronous', False):
+            return self._submit_job('ResourceModification', run)
+
+        return run()[0]
+
+    def _modify(self, level: str, identifier: str, request: Dict, is_anonymization: bool) -> Dict:
+        new_uids: Dict[Tuple[str, str], str] = {}
+        new_identifier = None
+        patient_identifier = None
+
+        for instance_identifier in self.store.get_instances_of(level, identifier):
+            instance = self.store.resources['Instance'][instance_identifier]
+            tags = _modify_tags(dict(instance['Tags']), request, is_anonymization, new_uids, level, self.store)
+            result = self.store._store_instance(tags, instance['Content'])
+
+            new_identifier = result[f'Parent{level}'] if level != 'Instance' else result['ID']
+            patient_identifier = result['ParentPatient']
+
+        return {
+            'Description': 'REST API',
+            'FailedInstancesCount': 0,
+            'ID': new_identifier,
+            'InstancesCount': len(self.store.get_instances_of(level, identifier)),
+            'IsAnonymization': is_anonymization,
+            'ParentResources': [identifier],
+            'Path': f'/{ROUTES_OF_LEVEL[level]}/{new_identifier}',
+            'PatientID': patient_identifier,
+            'Type': level
+        }
+
+    # Jobs
+    def _submit_job(self, job_type: str, action: Callable[[], Tuple[Dict, Dict]]) -> Dict:
+        identifier = str(uuid.uuid4())
+        with self.store.lock:
+            self.store.jobs[identifier] = {
+                'ID': identifier,
+                'Type': job_type,
+                'CreationTime': _now(),
+                'Priority': 0,
+                'Action': action,
+                'Remaining': self.job_duration,
+                'StartedAt': time.monotonic(),
+                'Paused': False,
+                'Canceled': False,
+                'Failed': False,
+                'Content': {},
+                'Outputs': {}
+            }
+            self._execute_job(self.store.jobs[identifier])
+
+        return {'ID': identifier, 'Path': f'/jobs/{identifier}'}
+
+    def _execute_job(self, job: Dict) -> None:
+        job['Failed'] = self.job_error_rate > 0 and self._random.random() < self.job_error_rate
+        if not job['Failed']:
+            try:
+                job['Content'], job['Outputs'] = job['Action']()
+            except FakeOrthancError:
+                job['Failed'] = True
+
+    def _get_job_state(self, job: Dict) -> Tuple[str, float]:
+        if job['Canceled']:
+            return 'Failure', 0.0
+        if job['Paused']:
+            return 'Paused', 0.0
+
+        elapsed = time.monotonic() - job['StartedAt']
+        if elapsed < job['Remaining']:
+            return 'Running', elapsed / job['Remaining']
+
+        return ('Failure' if job['Failed'] else 'Success'), 1.0
+
+    def _get_job_information(self, job: Dict) -> Dict:
+        state, progress = self._get_job_state(job)
+        error_code, error_description = 0, 'Success'
+        if job['Canceled']:
+            error_code, error_description = CANCELED_JOB_ERROR_CODE, 'Canceled job'
+        elif state == 'Failure':
+            error_code, error_description = INTERNAL_ERROR_CODE, 'Internal error'
+
+        information = {
+            'CreationTime': job['CreationTime'],
+            'Content': job['Content'] if state == 'Success' else {},
+            'EffectiveRuntime': 0.0,
+            'ErrorCode': error_code,
+            'ErrorDescription': error_description,
+            'ID': job['ID'],
+            'Priority': job['Priority'],
+            'Progress': int(progress * 100),
+            'State': state,
+            'Timestamp': _now(),
+            'Type': job['Type']
+        }
+        if state in ('Success', 'Failure'):
+            information['CompletionTime'] = _now()
+
+        return information
+
+    def _evict_finished_jobs(self) -> None:
+        if self.jobs_history_size is None:
+            return
+
+        finished_jobs = [i for i, job in self.store.jobs.items() if self._get_job_state(job)[0] in ('Success', 'Failure')]
+        for identifier in finished_jobs[:max(len(finished_jobs) - self.jobs_history_size, 0)]:
+            del self.store.jobs[identifier]
+
+    def _get_job_record(self, identifier: str) -> Dict:
+        self._evict_finished_jobs()
+        try:
+            return self.store.jobs[identifier]
+        except KeyError:
+            raise FakeOrthancError(404, 'Unknown job')
+
+    def _get_jobs(self, params: Dict, body: bytes) -> List:
+        with self.store.lock:
+            self._evict_finished_jobs()
+            if 'expand' in params:
+                return [self._get_job_information(job) for job in self.store.jobs.values()]
+
+            return list(self.store.jobs)
+
+    def _get_job(self, params: Dict, body: bytes, identifier: str) -> Dict:
+        with self.store.lock:
+            return self._get_job_information(self._get_job_record(identifier))
+
+    def _post_job_action(self, params: Dict, body: bytes, identifier: str, action: str) -> Dict:
+        with self.store.lock:
+            job = self._get_job_record(identifier)
+            state, _ = self._get_job_state(job)
+
+            if action == 'cancel' and state in ('Pending', 'Running', 'Paused'):
+                job['Canceled'] = True
+            elif action == 'pause' and state in ('Pending', 'Running'):
+                job['Remaining'] -= time.monotonic() - job['StartedAt']
+                job['Paused'] = True
+            elif action == 'resume' and state == 'Paused':
+                job['StartedAt'] = time.monotonic()
+                job['Paused'] = False
+            elif action == 'resubmit' and state == 'Failure':
+                job.update({'Canceled': False, 'Remaining': self.job_duration, 'StartedAt': time.monotonic()})
+                self._execute_job(job)
+
+        return {}
+
+    def _get_job_output(self, params: Dict, body: bytes, identifier: str, key: str) -> bytes:
+        with self.store.lock:
+            job = self._get_job_record(identifier)
+            if self._get_job_state(job)[0] != 'Success' or key not in job['Outputs']:
+                raise FakeOrthancError(404, 'Unknown job output')
+
+            return job['Outputs'][key]
+
+    # Modalities
+    def _get_modalities(self, params: Dict, body: bytes) -> Any:
+        with self.store.lock:
+            if 'expand' in params:
+                return {name: self._public_modality(m) for name, m in self.store.modalities.items()}
+
+            return list(self.store.modalities)
+
+    def _get_modality(self, params: Dict, body: bytes, name: str) -> Dict:
+        with self.store.lock:
+            return self._public_modality(self._get_modality_record(name))
+
+    def _put_modality(self, params: Dict, body: bytes, name: str) -> Dict:
+        configuration = _load_json(body)
+        if isinstance(configuration, list):
+            aet = configuration[0]
+        else:
+            aet = configuration.get('AET', name.upper())
+        with self.store.lock:
+            self.store.add_modality(name, aet, self.store.remote_stores.get(name))
+
+        return {}
+
+    def _delete_modality(self, params: Dict, body: bytes, name: str) -> Dict:
+        with self.store.lock:
+            self._get_modality_record(name)
+            del self.store.modalities[name]
+            del self.store.remote_stores[name]
+
+        return {}
+
+    def _get_modality_record(self, name: str) -> Dict:
+        try:
+            return self.store.modalities[name]
+        except KeyError:
+            raise FakeOrthancError(404, 'Unknown modality')
+
+    @staticmethod
+    def _public_modality(modality: Dict) -> Dict:
+        return {k: v for k, v in modality.items() if k != 'Latency'}
+
+    def _wait_for_modality(self, name: str) -> Dict:
+        with self.store.lock:
+            modality = self._get_modality_record(name)
+        if modality['Latency']:
+            time.sleep(modality['Latency'])
+
+        return modality
+
+    def _post_echo(self, params: Dict, body: bytes, name: str) -> Dict:
+        self._wait_for_modality(name)
+
+        return {}
+
+    def _post_query(self, params: Dict, body: bytes, name: str) -> Dict:
+        self._wait_for_modality(name)
+        request = _load_json(body)
+        level = str(request.get('Level', 'Study')).capitalize()
+        if level not in LEVELS:
+            raise FakeOrthancError(400, 'Bad request')
+
+        return self._create_query(name, level, request.get('Query', {}))
+
+    def _create_query(self, modality: str, level: str, query: Dict[str, str]) -> Dict:
+        remote_store = self.store.remote_stores[modality]
+        with remote_store.lock:
+            answers = []
+            for identifier in remote_store.find(level, query, case_sensitive=False):
+                tags = remote_store._get_tags_with_ancestors(level, identifier)
+                answer = {name: tags.get(name, '') for name in query}
+                for ancestor_level in LEVELS[:LEVELS.index(level) + 1]:
+                    answer[IDENTIFYING_TAGS[ancestor_level]] = tags.get(IDENTIFYING_TAGS[ancestor_level], '')
+                answer['QueryRetrieveLevel'] = level.upper()
+                answer['SpecificCharacterSet'] = tags.get('SpecificCharacterSet', 'ISO_IR 100')
+                answers.append(answer)
+
+        identifier = str(uuid.uuid4())
+        with self.store.lock:
+            self.store.queries[identifier] = {
+                'Modality': modality,
+                'Level': level,
+                'Query': dict(query),
+                'Answers': answers
+            }
+
+        return {'ID': identifier, 'Path': f'/queries/{identifier}'}
+
+    def _post_modality_move(self, params: Dict, body: bytes, name: str) -> Any:
+        request = _load_json(body)
+        level = str(request.get('Level', 'Study')).capitalize()
+        answers = [{'QueryRetrieveLevel': level.upper(), **r} for r in request.get('Resources', [])]
+
+        return self._move(name, answers, request)
+
+    def _post_modality_store(self, params: Dict, body: bytes, name: str) -> Any:
+        self._wait_for_modality(name)
+        request = _load_json(body)
+        resources = request if isinstance(request, list) else (request.get('Resources', []) if isinstance(request, dict) else [request])
+
+        with self.store.lock:
+            instances = []
+            for identifier in resources:
+                instances += self.store.get_instances_of(self._find_level(identifier), identifier)
+
+        count = self.store.copy_instances_to(instances, self.store.remote_stores[name])
+
+        return {
+            'Description': 'REST API',
+            'FailedInstancesCount': 0,
+            'InstancesCount': count,
+            'LocalAet': self.store.aet,
+            'RemoteAet': self.store.modalities[name]['AET']
+        }
+
+    # Queries
+    def _get_query_record(self, identifier: str) -> Dict:
+        try:
+            return self.store.queries[identifier]
+        except KeyError:
+            raise FakeOrthancError(404, 'Unknown query')
+
+    def _get_queries(self, params: Dict, body: bytes) -> List:
+        with self.store.lock:
+            return list(self.store.queries)
+
+    def _get_query(self, params: Dict, body: bytes, identifier: str) -> List:
+        with self.store.lock:
+            self._get_query_record(identifier)
+
+        return ['answers', 'level', 'modality', 'query', 'retrieve']
+
+    def _delete_query(self, params: Dict, body: bytes, identifier: str) -> Dict:
+        with self.store.lock:
+            self._get_query_record(identifier)
+            del self.store.queries[identifier]
+
+        return {}
+
+    def _get_query_answers(self, params: Dict, body: bytes, identifier: str) -> List:
+        with self.store.lock:
+            answers = self._get_query_record(identifier)['Answers']
+
+        if 'expand' in params:
+            return [dict(a) if 'simplify' in params else _to_full_tags(a) for a in answers]
+
+        return [str(i) for i in range(len(answers))]
+
+    def _get_query_answer(self, identifier: str, index: str) -> Dict:
+        with self.store.lock:
+            answers = self._get_query_record(identifier)['Answers']
+            if int(index) >= len(answers):
+                raise FakeOrthancError(404, 'Unknown answer')
+
+            return answers[int(index)]
+
+    def _get_query_answer_content(self, params: Dict, body: bytes, identifier: str, index: str) -> Dict:
+        answer = self._get_query_answer(identifier, index)
+
+        return dict(answer) if 'simplify' in params else _to_full_tags(answer)
+
+    def _get_query_field(self, params: Dict, body: bytes, identifier: str, field: str) -> Any:
+        with self.store.lock:
+            query = self._get_query_record(identifier)
+
+        if field == 'query':
+            return dict(query['Query']) if 'simplify' in params else _to_full_tags(query['Query'])
+
+        return query['Level'] if field == 'level' else query['Modality']
+
+    def _post_query_children(self, params: Dict, body: bytes, identifier: str, index: str, child_route: str) -> Dict:
+        answer = self._get_query_answer(identifier, index)
+        with self.store.lock:
+            query = self._get_query_record(identifier)
+        self._wait_for_modality(query['Modality'])
+
+        request = _load_json(body)
+        child_query = dict(request.get('Query', {})) if isinstance(request, dict) else {}
+        for level in LEVELS[:LEVELS.index(query['Level']) + 1]:
+            child_query[IDENTIFYING_TAGS[level]] = answer[IDENTIFYING_TAGS[level]]
+
+        return self._create_query(query['Modality'], LEVEL_ROUTES[child_route], child_query)
+
+    def _post_query_answer_retrieve(self, params: Dict, body: bytes, identifier: str, index: str) -> Any:
+        answer = self._get_query_answer(identifier, index)
+        with self.store.lock:
+            modality = self._get_query_record(identifier)['Modality']
+
+        return self._move(modality, [answer], _load_json(body))
+
+    def _post_query_retrieve(self, params: Dict, body: bytes, identifier: str) -> Any:
+        with self.store.lock:
+            query = self._get_query_record(identifier)
+
+        return self._move(query['Modality'], query['Answers'], _load_json(body))
+
+    def _move(self, modality: str, answers: List[Dict], request: Any) -> Any:
+        request = request if isinstance(request, dict) else {'TargetAet': request} if request else {}
+        target_aet = request.get('TargetAet') or self.store.aet
+        self._wait_for_modality(modality)
+        remote_store = self.store.remote_stores[modality]
+
+        if target_aet == self.store.aet:
+            target_store = self.store
+        else:
+            targets = [n for n, m in self.store.modalities.items() if m['AET'] == target_aet]
+            if not targets:
+                raise FakeOrthancError(500, f'Unknown AET: {target_aet}')
+            target_store = self.store.remote_stores[targets[0]]
+
+        def run() -> Tuple[Dict, Dict]:
+            with remote_store.lock:
+                instances = []
+                for answer in answers:
+                    level = answer['QueryRetrieveLevel'].capitalize()
+                    query = {IDENTIFYING_TAGS[lv]: answer[IDENTIFYING_TAGS[lv]]
+                             for lv in LEVELS[:LEVELS.index(level) + 1] if IDENTIFYING_TAGS[lv] in answer}
+                    for resource in remote_store.find(level, query):
+                        instances += remote_store.get_instances_of(level, resource)
+            remote_store.copy_instances_to(instances, target_store)
+
+            return {
+                'Description': 'REST API',
+                'LocalAet': self.store.aet,
+                'RemoteAet': self.store.modalities[modality]['AET'],
+                'Query': [dict(a) for a in answers]
+            }, {}
+
+        if request.get('Asynchronous', False):
+            return self._submit_job('DicomMoveScu', run)
+
+        return run()[0]
+
+
+class _UnseekableBuffer:
+    """Write-only buffer, so that zipfile writes the member sizes in data descriptors"""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def getvalue(self) -> bytes:
+        return b''.join(self._chunks)
+
+
+def _modify_tags(tags: Dict[str, str], request: Dict, is_anonymization: bool,
+                 new_uids: Dict[Tuple[str, str], str], level: str, store: FakeOrthancStore) -> Dict[str, str]:
+    keep = set(request.get('Keep', []))
+
+    def replace_uid(name: str) -> None:
+        if name in keep:
+            return
+        old_uid = tags.get(name, '')
+        if (name, old_uid) not in new_uids:
+            new_uids[(name, old_uid)] = generate_uid()
+        tags[name] = new_uids[(name, old_uid)]
+
+    if is_anonymization:
+        patient_key = tags.get('PatientID', '')
+        if ('PatientName', patient_key) not in new_uids:
+            store.anonymized_patient_counter += 1
+            new_uids[('PatientName', patient_key)] = f'Anonymized{store.anonymized_patient_counter}'
+            new_uids[('PatientID', patient_key)] = str(uuid.uuid4())
+        for name in ('PatientName', 'PatientID'):
+            if name not in keep:
+                tags[name] = new_uids[(name, patient_key)]
+        for name in ('PatientBirthDate', 'ReferringPhysicianName', 'InstitutionName', 'AccessionNumber', 'StudyID'):
+            if name in tags and name not in keep:
+                tags[name] = ''
+        for name in ('StudyInstanceUID', 'SeriesInstanceUID', 'SOPInstanceUID'):
+            replace_uid(name)
+    else:
+        for name in [IDENTIFYING_TAGS[lv] for lv in LEVELS[LEVELS.index(level) + 1:]] + [IDENTIFYING_TAGS[level]]:
+            if name != 'PatientID':
+                replace_uid(name)
+
+    for name in request.get('Remove', []):
+        tags.pop(name, None)
+    tags.update({name: str(value) for name, value in request.get('Replace', {}).items()})
+
+    return tags
+
+
+def _to_full_tags(tags: Dict[str, str]) -> Dict[str, Dict]:
+    full_tags = {}
+    for name, value in tags.items():
+        if name in DICOM_TAGS_BY_NAME:
+            tag = DICOM_TAGS_BY_NAME[name][0]
+            full_tags[f'{tag >> 16:04x},{tag & 0xFFFF:04x}'] = {'Name': name, 'Type': 'String', 'Value': value}
+
+    return full_tags
+
+
+def _load_json(body: bytes) -> Any:
+    if not body:
+        return {}
+    try:
+        value = json.loads(body)
+    except ValueError:
+        raise FakeOrthancError(400, 'Bad request')
+
+    return {} if value is None else value
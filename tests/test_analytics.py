@@ -0,0 +1,94 @@
+# coding: utf-8
+# author: gabriel couture
+import os
+import tempfile
+import unittest
+
+from pyorthanc import Orthanc, StorageAnalytics
+from tests.fake_orthanc_server import FakeOrthancServer, orthanc_identifier
+
+STUDIES = [
+    # (StudyDate, ReferringPhysicianName, modalities of the series)
+    ('20190101', 'Dr House', ['CT', 'CT', 'SR']),
+    ('20190505', 'Dr Wilson', ['MR']),
+    ('20200101', 'Dr House', ['CT', 'MR']),
+]
+NUMBER_OF_INSTANCES_PER_SERIES = 2
+
+
+class TestStorageAnalytics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for study_index, (study_date, physician, modalities) in enumerate(STUDIES):
+            for series_index, modality in enumerate(modalities):
+                self._add_series(study_index, series_index, study_date, physician, modality)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, 'storage.json')
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.directory.cleanup()
+
+    def _add_series(self, study_index, series_index, study_date, physician, modality):
+        for i in range(NUMBER_OF_INSTANCES_PER_SERIES):
+            self.server.store.add_instance({
+                'PatientID': f'P{study_index}',
+                'StudyInstanceUID': f'1.{study_index}',
+                'StudyDate': study_date,
+                'ReferringPhysicianName': physician,
+                'SeriesInstanceUID': f'1.{study_index}.{series_index}',
+                'Modality': modality,
+                'SOPInstanceUID': f'1.{study_index}.{series_index}.{i}'
+            })
+
+    def test_givenAnArchive_whenGroupingByModality_thenStatisticsAreSummedByModality(self):
+        analytics = StorageAnalytics(self.orthanc)
+        analytics.update()
+
+        result = analytics.group_by('Modality')
+
+        self.assertEqual(list(result), ['CT', 'MR', 'SR'])  # By decreasing disk size
+        self.assertEqual(result['CT']['CountSeries'], 3)
+        self.assertEqual(result['MR']['CountInstances'], 2 * NUMBER_OF_INSTANCES_PER_SERIES)
+        self.assertEqual(sum(r['DiskSize'] for r in result.values()), int(self.orthanc.get_statistics()['TotalDiskSize']))
+
+    def test_givenAnArchive_whenGroupingBySeveralKeys_thenGroupsAreTuples(self):
+        analytics = StorageAnalytics(self.orthanc)
+        analytics.update()
+
+        result = analytics.group_by('StudyYear', 'ReferringPhysicianName', record_filter=lambda r: r['Modality'] != 'SR')
+
+        self.assertEqual(
+            {group: totals['CountSeries'] for group, totals in result.items()},
+            {('2019', 'Dr House'): 2, ('2019', 'Dr Wilson'): 1, ('2020', 'Dr House'): 2}
+        )
+        self.assertEqual(analytics.get_total()['CountSeries'], 6)
+
+    def test_givenAnUpdatedMirror_whenUpdatingAgain_thenOnlyChangedSeriesAreFetched(self):
+        analytics = StorageAnalytics(self.orthanc)
+        self.assertEqual(analytics.update(), 6)
+
+        self._add_series(0, 3, '20190101', 'Dr House', 'US')
+        self.server.store.add_instance({
+            'PatientID': 'P1', 'StudyInstanceUID': '1.1', 'SeriesInstanceUID': '1.1.0', 'SOPInstanceUID': '1.1.0.9'
+        })
+        self.server.store.delete('Series', orthanc_identifier('P2', '1.2', '1.2.1'))
+
+        self.assertEqual(analytics.update(), 2)
+        self.assertEqual(self.server.count_requests('GET /series/[^/]+/statistics'), 8)
+        result = analytics.group_by('Modality')
+        self.assertEqual(result['MR']['CountInstances'], NUMBER_OF_INSTANCES_PER_SERIES + 1)
+        self.assertEqual(result['US']['CountSeries'], 1)
+        self.assertEqual(analytics.get_total()['CountSeries'], 6)
+
+    def test_givenACachePath_whenCreatingNewAnalytics_thenMirrorIsReused(self):
+        StorageAnalytics(self.orthanc, cache_path=self.cache_path).update()
+
+        analytics = StorageAnalytics(self.orthanc, cache_path=self.cache_path)
+        nbr_fetched_series = analytics.update()
+
+        self.assertEqual(nbr_fetched_series, 0)
+        self.assertEqual(analytics.group_by('Modality')['CT']['CountSeries'], 3)
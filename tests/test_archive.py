@@ -0,0 +1,144 @@
+# coding: utf-8
+# author: gabriel couture
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from pyorthanc import Orthanc, Study
+from pyorthanc.archive import download_cohort_archives, extract_archive, extract_zip_stream, iterate_archive_files, \
+    iterate_zip_stream, split_in_balanced_chunks
+from tests.fake_orthanc_server import FakeOrthancServer, orthanc_identifier
+
+NUMBER_OF_INSTANCES = 5
+
+
+def _make_zip(files, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content)
+
+    return buffer.getvalue()
+
+
+def _split(data, chunk_size):
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+FILES = {'a/first.dcm': b'first content' * 100, 'a/b/second.dcm': bytes(range(256)) * 50, 'third.dcm': b''}
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for i in range(NUMBER_OF_INSTANCES):
+            self.server.store.add_instance({
+                'PatientID': 'P1', 'StudyInstanceUID': '1.2', 'SeriesInstanceUID': '1.2.3',
+                'SOPInstanceUID': f'1.2.3.{i}', 'Modality': 'CT'
+            })
+        self.study_identifier = orthanc_identifier('P1', '1.2')
+
+    def _add_cohort(self, nbr_studies):
+        for i in range(nbr_studies):
+            for j in range(i % 3 + 1):
+                self.server.store.add_instance({
+                    'PatientID': f'C{i}', 'StudyInstanceUID': f'2.{i}', 'SeriesInstanceUID': f'2.{i}.1',
+                    'SOPInstanceUID': f'2.{i}.1.{j}', 'Modality': 'MR'
+                })
+
+        return [Study(orthanc_identifier(f'C{i}', f'2.{i}'), self.orthanc) for i in range(nbr_studies)]
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_givenAStudy_whenIteratingArchiveFiles_thenResultIsTheContentOfTheArchive(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.orthanc.get_study_zip_file(self.study_identifier)))
+        expected = {name: archive.read(name) for name in archive.namelist()}
+
+        result = dict(iterate_archive_files(self.orthanc, 'Study', self.study_identifier, chunk_size=7))
+
+        self.assertEqual(len(result), NUMBER_OF_INSTANCES)
+        self.assertEqual(result, expected)
+
+    def test_givenAStudy_whenExtractingArchive_thenFilesAreWrittenInTheDirectory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = extract_archive(self.orthanc, 'Study', self.study_identifier, directory)
+
+            self.assertEqual(len(result), NUMBER_OF_INSTANCES)
+            contents = sorted(open(path, 'rb').read() for path in result)
+            expected = sorted(self.orthanc.get_instance_file(i) for i in self.orthanc.get_instances())
+            self.assertEqual(contents, expected)
+
+    def test_givenStoredAndDeflatedArchives_whenIteratingInSmallChunks_thenResultIsTheFiles(self):
+        for compression in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+            for chunk_size in [1, 3, 1000, 1000000]:
+                result = dict(iterate_zip_stream(_split(_make_zip(FILES, compression), chunk_size)))
+
+                self.assertEqual(result, FILES)
+
+    def test_givenACorruptedArchive_whenIterating_thenBadZipFileIsRaised(self):
+        data = bytearray(_make_zip({'file.dcm': b'content'}, zipfile.ZIP_STORED))
+        data[data.index(b'content')] = ord('C')
+
+        self.assertRaises(zipfile.BadZipFile, lambda: list(iterate_zip_stream([bytes(data)])))
+
+    def test_givenATruncatedArchive_whenIterating_thenBadZipFileIsRaised(self):
+        data = _make_zip(FILES)
+
+        self.assertRaises(zipfile.BadZipFile, lambda: list(iterate_zip_stream([data[:len(data) // 2]])))
+
+    def test_givenAFileOutsideOfTheDirectory_whenExtracting_thenBadZipFileIsRaised(self):
+        data = _make_zip({'../outside.dcm': b'content'})
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertRaises(zipfile.BadZipFile, extract_zip_stream, [data], os.path.join(directory, 'extracted'))
+            self.assertFalse(os.path.exists(os.path.join(directory, 'outside.dcm')))
+
+    def test_givenSizes_whenSplittingInBalancedChunks_thenChunksAreUnderTheMaximumSize(self):
+        sizes = {'a': 6, 'b': 5, 'c': 5, 'd': 3, 'e': 1, 'f': 12}
+
+        result = split_in_balanced_chunks(list(sizes), list(sizes.values()), 10)
+
+        self.assertEqual(sorted(i for chunk in result for i in chunk), sorted(sizes))
+        self.assertTrue(all(sum(sizes[i] for i in chunk) <= 10 or len(chunk) == 1 for chunk in result))
+        self.assertEqual(result, split_in_balanced_chunks(list(reversed(list(sizes))), list(reversed(list(sizes.values()))), 10))
+
+    def test_givenACohort_whenDownloadingArchives_thenArchivesContainAllTheInstances(self):
+        studies = self._add_cohort(6)
+        instance_size = len(self.orthanc.get_instance_file(self.orthanc.get_instances()[0]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            result = download_cohort_archives(self.orthanc, studies, directory, max_archive_size=4 * instance_size)
+
+            self.assertTrue(result.is_successful())
+            self.assertEqual(len(result.results), 3)
+            self.assertEqual(sorted(i for ids in result.results.values() for i in ids), sorted(s.get_identifier() for s in studies))
+            names = [name for path in result.results for name in zipfile.ZipFile(path).namelist()]
+            self.assertEqual(len(names), 12)
+            self.assertEqual([f for f in os.listdir(directory) if f.endswith('.part')], [])
+
+    def test_givenDownloadedArchives_whenDownloadingAgain_thenOnlyMissingArchivesAreCreated(self):
+        studies = self._add_cohort(6)
+        instance_size = len(self.orthanc.get_instance_file(self.orthanc.get_instances()[0]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            first_result = download_cohort_archives(self.orthanc, studies, directory, max_archive_size=4 * instance_size)
+            os.remove(sorted(first_result.results)[0])
+
+            result = download_cohort_archives(self.orthanc, studies, directory, max_archive_size=4 * instance_size)
+
+            self.assertEqual(sorted(result.results), sorted(first_result.results))
+            self.assertEqual(self.server.count_requests('POST /tools/create_archive'), 4)
+
+    def test_givenMedia_whenDownloadingArchives_thenArchivesHaveADicomdir(self):
+        studies = self._add_cohort(2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            result = download_cohort_archives(self.orthanc, studies, directory, media=True)
+
+            self.assertEqual(len(result.results), 1)
+            self.assertIn('DICOMDIR', zipfile.ZipFile(list(result.results)[0]).namelist())
@@ -0,0 +1,139 @@
+# coding: utf-8
+# author: gabriel couture
+import os
+import tempfile
+import unittest
+
+from pyorthanc import Instance, Orthanc, Patient, Series, Study
+from pyorthanc.bulk import BulkResult, OriginalNotDeletedError, anonymize_resources, modify_resources, read_mapping_table
+from tests.fake_orthanc_server import FakeOrthancServer
+
+NUMBER_OF_PATIENTS = 10
+NUMBER_OF_STUDIES_PER_PATIENT = 2
+
+
+class TestBulk(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer(job_duration=0.05).start()
+        self.orthanc = Orthanc(self.server.url)
+        for i in range(NUMBER_OF_PATIENTS):
+            for j in range(NUMBER_OF_STUDIES_PER_PATIENT):
+                self.server.store.add_instance({
+                    'PatientID': f'P{i}',
+                    'StudyInstanceUID': f'1.2.{i}.{j}',
+                    'SeriesInstanceUID': f'1.2.{i}.{j}.1',
+                    'SOPInstanceUID': f'1.2.{i}.{j}.1.1'
+                })
+        self.patients = [Patient(i, self.orthanc) for i in self.orthanc.get_patients()]
+        self.directory = tempfile.TemporaryDirectory()
+        self.mapping_table_path = os.path.join(self.directory.name, 'mapping.csv')
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.orthanc = None
+        self.directory.cleanup()
+
+    def test_givenPatients_whenAnonymizing_thenEachPatientIsMappedToAnAnonymizedPatient(self):
+        result = anonymize_resources(self.orthanc, self.patients, max_nbr_running_jobs=4)
+
+        self.assertIsInstance(result, BulkResult)
+        self.assertTrue(result.is_successful())
+        self.assertEqual(set(result.results), {p.get_identifier() for p in self.patients})
+        for anonymized_identifier in result.results.values():
+            self.assertIn(anonymized_identifier, self.orthanc.get_patients())
+        self.assertEqual(self.server.count_requests('POST /patients/.*/anonymize'), NUMBER_OF_PATIENTS)
+
+    def test_givenPatientsAndStudyLevel_whenAnonymizing_thenStudiesAreAnonymized(self):
+        result = anonymize_resources(self.orthanc, self.patients, level='Study')
+
+        self.assertEqual(set(result.results), set(self.server.store.resources['Study']) - set(result.results.values()))
+        self.assertEqual(len(result.results), NUMBER_OF_PATIENTS * NUMBER_OF_STUDIES_PER_PATIENT)
+
+    def test_givenStudiesAndPatientLevel_whenAnonymizing_thenRaiseValueError(self):
+        studies = [Study(i, self.orthanc) for i in self.orthanc.get_studies()]
+
+        self.assertRaises(ValueError, lambda: anonymize_resources(self.orthanc, studies, level='Patient'))
+
+    def test_givenMappingTable_whenAnonymizing_thenMappingIsWrittenAndAlreadyAnonymizedResourcesAreSkipped(self):
+        first_result = anonymize_resources(self.orthanc, self.patients[:4], mapping_table_path=self.mapping_table_path)
+
+        second_result = anonymize_resources(self.orthanc, self.patients, mapping_table_path=self.mapping_table_path)
+
+        self.assertEqual(len(second_result.results), NUMBER_OF_PATIENTS - 4)
+        self.assertEqual(read_mapping_table(self.mapping_table_path), {**first_result.results, **second_result.results})
+        self.assertEqual(self.server.count_requests('POST /patients/.*/anonymize'), NUMBER_OF_PATIENTS)
+
+    def test_givenDeleteOriginals_whenAnonymizing_thenOnlyAnonymizedPatientsRemain(self):
+        result = anonymize_resources(self.orthanc, self.patients, delete_originals=True)
+
+        self.assertEqual(sorted(self.orthanc.get_patients()), sorted(result.results.values()))
+
+    def test_givenFailingDeletes_whenAnonymizing_thenAnonymizedIdentifiersAreKeptInMappingTable(self):
+        self.server.inject_errors('DELETE /patients/', count=NUMBER_OF_PATIENTS, status_code=500)
+
+        result = anonymize_resources(self.orthanc, self.patients, mapping_table_path=self.mapping_table_path, delete_originals=True)
+
+        self.assertEqual(set(result.errors), {p.get_identifier() for p in self.patients})
+        self.assertTrue(all(isinstance(e, OriginalNotDeletedError) for e in result.errors.values()))
+        self.assertEqual(read_mapping_table(self.mapping_table_path), {e.original_identifier: e.anonymized_identifier for e in result.errors.values()})
+
+        anonymize_resources(self.orthanc, self.patients, mapping_table_path=self.mapping_table_path, delete_originals=True)
+        self.assertEqual(self.server.count_requests('POST /patients/.*/anonymize'), NUMBER_OF_PATIENTS)
+
+    def test_givenFailingJobs_whenAnonymizing_thenErrorsAreReportedPerResource(self):
+        self.server.job_error_rate = 1.0
+        progress = []
+
+        result = anonymize_resources(
+            self.orthanc, self.patients, mapping_table_path=self.mapping_table_path,
+            progress_callback=lambda done, total: progress.append((done, total))
+        )
+
+        self.assertFalse(result.is_successful())
+        self.assertEqual(set(result.errors), {p.get_identifier() for p in self.patients})
+        self.assertEqual(read_mapping_table(self.mapping_table_path), {})
+        self.assertEqual(sorted(progress), [(i + 1, NUMBER_OF_PATIENTS) for i in range(NUMBER_OF_PATIENTS)])
+
+    def test_givenInstances_whenAnonymizing_thenAnonymizedInstancesAreUploaded(self):
+        instances = [Instance(i, self.orthanc) for i in self.orthanc.get_instances()[:3]]
+
+        result = anonymize_resources(self.orthanc, instances)
+
+        self.assertTrue(result.is_successful())
+        for anonymized_identifier in result.results.values():
+            self.assertTrue(self.orthanc.get_instance_simplified_tags(anonymized_identifier)['PatientName'].startswith('Anonymized'))
+
+    def test_givenSeries_whenModifyingAsJobs_thenTagsAreReplacedAndRemoved(self):
+        series = [Series(i, self.orthanc) for i in self.orthanc.get_series()]
+
+        result = modify_resources(
+            self.orthanc, series, replace={'SeriesDescription': 'Fixed'}, remove=['Modality'], max_nbr_workers=4
+        )
+
+        self.assertTrue(result.is_successful())
+        self.assertEqual(len(result.results), len(series))
+        for modified_identifier in result.results.values():
+            tags = self.orthanc.get_series_information(modified_identifier)['MainDicomTags']
+            self.assertEqual(tags['SeriesDescription'], 'Fixed')
+            self.assertNotIn('Modality', tags)
+        self.assertEqual(self.server.count_requests('POST /series/.*/modify'), len(series))
+
+    def test_givenPatientsAndInstanceLevel_whenModifyingSynchronously_thenModifiedInstancesAreUploaded(self):
+        result = modify_resources(
+            self.orthanc, self.patients[:2], replace={'InstitutionName': 'Hospital'}, level='Instance', asynchronous=False
+        )
+
+        self.assertEqual(len(result.results), 2 * NUMBER_OF_STUDIES_PER_PATIENT)
+        for modified_identifier in result.results.values():
+            self.assertEqual(self.orthanc.get_instance_simplified_tags(modified_identifier)['InstitutionName'], 'Hospital')
+
+    def test_givenSomeFailingRequests_whenModifyingSynchronously_thenFailuresAreReportedPerResource(self):
+        studies = [Study(i, self.orthanc) for i in self.orthanc.get_studies()]
+        self.server.inject_errors('POST /studies/.*/modify', count=3)
+
+        result = modify_resources(self.orthanc, studies, replace={'StudyDescription': 'Fixed'}, asynchronous=False)
+
+        self.assertEqual(len(result.errors), 3)
+        self.assertEqual(len(result.results), len(studies) - 3)
+        self.assertEqual(str(result), f'BulkResult (succeeded={len(studies) - 3}, failed=3)')
@@ -0,0 +1,107 @@
+# coding: utf-8
+# author: gabriel couture
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from pyorthanc import OrthancCluster
+from tests.fake_orthanc_server import FakeOrthancServer, FakeOrthancStore
+
+NUMBER_OF_NODES = 3
+
+
+class TestOrthancCluster(unittest.TestCase):
+
+    def setUp(self) -> None:
+        store = FakeOrthancStore()  # The nodes share the same index
+        self.servers = [FakeOrthancServer(store=store, latency=0.01).start() for _ in range(NUMBER_OF_NODES)]
+        self.stopped_servers = []
+        for i in range(10):
+            store.add_instance({
+                'PatientID': f'P{i}', 'StudyInstanceUID': f'1.{i}', 'SeriesInstanceUID': f'1.{i}.1', 'SOPInstanceUID': f'1.{i}.1.1'
+            })
+        self.cluster = OrthancCluster([s.url for s in self.servers], retry_interval=60)
+
+    def tearDown(self) -> None:
+        for server in self.servers:
+            if server not in self.stopped_servers:
+                server.stop()
+
+    def _stop(self, server):
+        server.stop()
+        self.stopped_servers.append(server)
+
+    def test_givenConcurrentReads_whenReading_thenReadsAreSpreadOverTheNodes(self):
+        patients = self.cluster.get_patients()
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            result = list(executor.map(self.cluster.get_patient_information, patients * 3))
+
+        self.assertEqual([r['ID'] for r in result], patients * 3)
+        for server in self.servers:
+            self.assertGreater(server.count_requests('GET /patients/'), 0)
+
+    def test_givenAStoppedNode_whenReading_thenReadsFailOverToTheOtherNodes(self):
+        self._stop(self.servers[0])
+
+        result = [self.cluster.get_patients() for _ in range(5)]
+
+        self.assertEqual(len(result), 5)
+        statistics = self.cluster.get_nodes_statistics()
+        self.assertFalse(statistics[0]['Healthy'])
+        self.assertEqual(statistics[0]['Failures'], 1)
+        self.assertTrue(statistics[1]['Healthy'] and statistics[2]['Healthy'])
+
+    def test_givenPinnedWrites_whenWriting_thenWritesAndJobsGoToTheSameNode(self):
+        patient = self.cluster.get_patients()[0]
+
+        for _ in range(3):
+            self.cluster.set_patient_to_protected(patient)
+        job = self.cluster.anonymize_patient(patient, {'Asynchronous': True})
+        self.cluster.get_job_information(job['ID'])
+
+        self.assertEqual(self.servers[0].count_requests('^(PUT|POST) '), 4)
+        self.assertEqual(self.servers[0].count_requests('^GET /jobs/'), 1)
+        self.assertEqual(sum(s.count_requests('^(PUT|POST) ') for s in self.servers[1:]), 0)
+
+    def test_givenUnpinnedWrites_whenCreatingJobsAndQueries_thenTheyGoToThePinnedNode(self):
+        cluster = OrthancCluster([s.url for s in self.servers], pin_writes=False)
+        self.servers[0].store.add_modality('pacs')
+        patients = cluster.get_patients()
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            jobs = list(executor.map(lambda p: cluster.anonymize_patient(p, {'Asynchronous': True}), patients))
+        query = cluster.query_on_modality('pacs', {'Level': 'Study', 'Query': {}})
+        cluster.get_query_answers(query['ID'])
+
+        self.assertEqual(self.servers[0].count_requests('^POST /patients/.*/anonymize'), len(jobs))
+        self.assertEqual(self.servers[0].count_requests('^POST /modalities/pacs/query'), 1)
+        self.assertEqual(self.servers[0].count_requests('^GET /queries/'), 1)
+        self.assertEqual(sum(s.count_requests('^POST ') for s in self.servers[1:]), 0)
+
+    def test_givenAStoppedPinnedNode_whenWriting_thenTheNextNodeIsPinned(self):
+        self._stop(self.servers[0])
+
+        self.cluster.set_patient_to_protected(self.cluster.get_patients()[0])
+
+        self.assertEqual(self.servers[1].count_requests('^PUT '), 1)
+
+    def test_givenAllNodesStopped_whenReading_thenConnectionErrorIsRaised(self):
+        for server in self.servers:
+            self._stop(server)
+
+        self.assertRaises(requests.ConnectionError, self.cluster.get_patients)
+
+    def test_givenAnUnknownResource_whenReading_thenErrorIsNotFailedOver(self):
+        self.assertRaises(requests.HTTPError, self.cluster.get_patient_information, 'unknown')
+
+        self.assertEqual(sum(s.count_requests('GET /patients/unknown') for s in self.servers), 1)
+
+    def test_givenAStoppedNode_whenCheckingHealth_thenOnlyThisNodeIsUnhealthy(self):
+        self._stop(self.servers[1])
+
+        result = self.cluster.check_health()
+
+        self.assertEqual(result, {s.url: s is not self.servers[1] for s in self.servers})
+        self.assertEqual([n['Healthy'] for n in self.cluster.get_nodes_statistics()], [True, False, True])
@@ -0,0 +1,159 @@
+# coding: utf-8
+# author: gabriel couture
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from pyorthanc import CompressionScheduler, Orthanc
+from pyorthanc.compression import read_checkpoint
+from tests.fake_orthanc_server import FakeOrthancServer, make_dicom_file, orthanc_identifier
+
+NUMBER_OF_OLD_STUDIES = 3
+NUMBER_OF_INSTANCES_PER_STUDY = 4
+
+
+def _add_study(store, index, study_date=None):
+    for i in range(NUMBER_OF_INSTANCES_PER_STUDY):
+        tags = {
+            'PatientID': f'P{index}',
+            'StudyInstanceUID': f'1.{index}',
+            'SeriesInstanceUID': f'1.{index}.1',
+            'SOPInstanceUID': f'1.{index}.1.{i}'
+        }
+        if study_date is not None:
+            tags['StudyDate'] = study_date
+        store.add_instance(tags, make_dicom_file(tags, pixel_data=bytes(10_000)))
+
+    return orthanc_identifier(f'P{index}', f'1.{index}')
+
+
+class TestCompressionScheduler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        self.old_studies = [_add_study(self.server.store, i, '20100101') for i in range(NUMBER_OF_OLD_STUDIES)]
+        self.recent_study = _add_study(self.server.store, 10, datetime.date.today().strftime('%Y%m%d'))
+        self.study_without_date = _add_study(self.server.store, 11)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.directory.name, 'compression.csv')
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.directory.cleanup()
+
+    def test_givenStudies_whenSelectingCandidates_thenOnlyOldAndLargeStudiesAreSelected(self):
+        scheduler = CompressionScheduler(self.orthanc, min_age_in_days=365)
+        large_study_scheduler = CompressionScheduler(self.orthanc, min_age_in_days=365, min_size=10 ** 9)
+
+        self.assertEqual(sorted(scheduler.select_candidates()), sorted(self.old_studies))
+        self.assertEqual(large_study_scheduler.select_candidates(), [])
+
+    def test_givenOldStudies_whenRunning_thenTheirAttachmentsAreCompressedAndSavedSizeIsReported(self):
+        progress = []
+        scheduler = CompressionScheduler(self.orthanc, max_nbr_workers=3)
+
+        report = scheduler.run(progress_callback=lambda done, total: progress.append((done, total)))
+
+        self.assertTrue(report.is_successful())
+        self.assertEqual(sorted(report.results), sorted(self.old_studies))
+        statistics = self.orthanc.get_study_statistics(self.old_studies[0])
+        self.assertEqual(report.results[self.old_studies[0]], int(statistics['UncompressedSize']) - int(statistics['DiskSize']))
+        self.assertGreater(report.get_saved_size(), 0)
+        self.assertEqual(self.server.count_requests('/compress$'), NUMBER_OF_OLD_STUDIES * NUMBER_OF_INSTANCES_PER_STUDY)
+        self.assertEqual(progress[-1], (NUMBER_OF_OLD_STUDIES, NUMBER_OF_OLD_STUDIES))
+
+    def test_givenCompressedStudies_whenUncompressing_thenSavedSizeIsNegative(self):
+        CompressionScheduler(self.orthanc).run(self.old_studies[:1])
+
+        report = CompressionScheduler(self.orthanc, uncompress=True).run(self.old_studies)
+
+        statistics = self.orthanc.get_study_statistics(self.old_studies[0])
+        self.assertEqual(statistics['DiskSize'], statistics['UncompressedSize'])
+        self.assertLess(report.results[self.old_studies[0]], 0)
+        self.assertEqual(report.results[self.old_studies[1]], 0)
+        self.assertEqual(self.server.count_requests('/uncompress$'), NUMBER_OF_INSTANCES_PER_STUDY)
+
+    def test_givenManyStudies_whenRunning_thenInstancesOfTheNextStudiesAreProcessedConcurrently(self):
+        scheduler = CompressionScheduler(self.orthanc, max_nbr_workers=8)
+        process_instance = scheduler._process_instance
+        lock = threading.Lock()
+        nbr_running = [0, 0]  # Current and maximum numbers of instances being processed
+
+        def slow_process_instance(instance_identifier, stop_event):
+            with lock:
+                nbr_running[0] += 1
+                nbr_running[1] = max(nbr_running)
+            time.sleep(0.05)
+            try:
+                return process_instance(instance_identifier, stop_event)
+            finally:
+                with lock:
+                    nbr_running[0] -= 1
+
+        scheduler._process_instance = slow_process_instance
+        report = scheduler.run(self.old_studies)
+
+        self.assertEqual(list(report.results), self.old_studies)
+        self.assertGreater(nbr_running[1], NUMBER_OF_INSTANCES_PER_STUDY)
+
+    def test_givenACheckpoint_whenRunningAgain_thenCompletedStudiesAreSkipped(self):
+        self.server.inject_errors(f'GET /studies/{self.old_studies[1]}/instances', count=1, status_code=500)
+        scheduler = CompressionScheduler(self.orthanc, checkpoint_path=self.checkpoint_path)
+
+        first_report = scheduler.run()
+        second_report = scheduler.run()
+
+        self.assertEqual(list(first_report.errors), [self.old_studies[1]])
+        self.assertEqual(list(second_report.results), [self.old_studies[1]])
+        self.assertEqual(sorted(read_checkpoint(self.checkpoint_path)), sorted(self.old_studies))
+        self.assertEqual(self.server.count_requests('/compress$'), NUMBER_OF_OLD_STUDIES * NUMBER_OF_INSTANCES_PER_STUDY)
+
+    def test_givenWindows_whenCheckingMoments_thenWindowsSpanningMidnightAreHandled(self):
+        scheduler = CompressionScheduler(self.orthanc, windows=[(datetime.time(22), datetime.time(6)), (datetime.time(12), datetime.time(13))])
+
+        self.assertTrue(scheduler.is_in_window(datetime.datetime(2020, 1, 1, 23, 30)))
+        self.assertTrue(scheduler.is_in_window(datetime.datetime(2020, 1, 1, 5, 59)))
+        self.assertTrue(scheduler.is_in_window(datetime.datetime(2020, 1, 1, 12, 30)))
+        self.assertFalse(scheduler.is_in_window(datetime.datetime(2020, 1, 1, 6, 0)))
+        self.assertFalse(scheduler.is_in_window(datetime.datetime(2020, 1, 1, 13, 0)))
+
+    def test_givenNowOutsideOfTheWindows_whenRunning_thenNothingIsCompressedUntilStopped(self):
+        now = datetime.datetime.now()
+        window = ((now + datetime.timedelta(hours=1)).time(), (now + datetime.timedelta(hours=2)).time())
+        scheduler = CompressionScheduler(self.orthanc, windows=[window])
+        stop_event = threading.Event()
+        threading.Timer(0.2, stop_event.set).start()
+
+        report = scheduler.run(self.old_studies, stop_event=stop_event)
+
+        self.assertEqual(report.results, {})
+        self.assertEqual(self.server.count_requests('/compress$'), 0)
+
+    def test_givenSlowRequests_whenRunning_thenConcurrencyIsReduced(self):
+        self.server.latency = 0.02
+        scheduler = CompressionScheduler(self.orthanc, max_nbr_workers=4, max_latency=0.01)
+
+        report = scheduler.run(self.old_studies[:1])
+
+        self.assertTrue(report.is_successful())
+        self.assertEqual(scheduler.concurrency, 1)
+
+    def test_givenFastChecksAndSlowCompressions_whenRunning_thenConcurrencyIsKept(self):
+        self.server.latency = 0.02  # Each compression takes 4 requests, so about 0.08 seconds
+        scheduler = CompressionScheduler(self.orthanc, max_nbr_workers=4, max_latency=0.05)
+
+        report = scheduler.run(self.old_studies[:1])
+
+        self.assertTrue(report.is_successful())
+        self.assertEqual(scheduler.concurrency, 4)
+
+    def test_givenAMinimumSize_whenSelectingCandidates_thenStatisticsAreOnlyReadForOldStudies(self):
+        scheduler = CompressionScheduler(self.orthanc, min_age_in_days=365, min_size=1)
+
+        self.assertEqual(sorted(scheduler.select_candidates()), sorted(self.old_studies))
+        self.assertEqual(self.server.count_requests('GET /studies/[^/]+/statistics'), NUMBER_OF_OLD_STUDIES)
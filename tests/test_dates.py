@@ -0,0 +1,96 @@
+# coding: utf-8
+# author: gabriel couture
+import datetime
+import unittest
+
+from pyorthanc import Orthanc, Study, build_patient_forest, get_datetimes, sort_by_datetime
+from pyorthanc.dates import parse_dicom_datetime, to_iso_datetime
+from tests.fake_orthanc_server import FakeOrthancServer, orthanc_identifier
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+STUDIES = [
+    # (PatientID, StudyDate, StudyTime)
+    ('P0', '20200131', '134501.25'),
+    ('P0', '20190101', ''),
+    ('P1', '', '120000'),
+    ('P1', '20210615', '0930'),
+]
+
+
+class TestDates(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for index, (patient_id, study_date, study_time) in enumerate(STUDIES):
+            self.server.store.add_instance({
+                'PatientID': patient_id,
+                'StudyInstanceUID': f'1.{index}',
+                'StudyDate': study_date,
+                'StudyTime': study_time,
+                'SeriesInstanceUID': f'1.{index}.0',
+                'SOPInstanceUID': f'1.{index}.0.0'
+            })
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_givenDicomDatesAndTimes_whenConvertingToIso_thenValuesAreNormalized(self):
+        self.assertEqual(to_iso_datetime('20200131', '134501.25'), '2020-01-31T13:45:01.250000')
+        self.assertEqual(to_iso_datetime('20200131', '13'), '2020-01-31T13:00:00.000000')
+        self.assertEqual(to_iso_datetime('20200131'), '2020-01-31T00:00:00.000000')
+        self.assertEqual(to_iso_datetime('2020.01.31', '13:45:60'), '2020-01-31T13:45:59.000000')
+        self.assertEqual(to_iso_datetime('20200131', '99'), '2020-01-31T00:00:00.000000')
+        self.assertIsNone(to_iso_datetime('20201331', '1200'))
+        self.assertIsNone(to_iso_datetime('', '1200'))
+        self.assertIsNone(parse_dicom_datetime('20200230'))
+        self.assertEqual(parse_dicom_datetime('20200131', '134501.25'), datetime.datetime(2020, 1, 31, 13, 45, 1, 250000))
+
+    def test_givenAStudy_whenGettingDateTwice_thenDateIsParsedOnce(self):
+        study = Study(orthanc_identifier('P0', '1.0'), self.orthanc)
+
+        self.assertEqual(study.get_date(), datetime.datetime(2020, 1, 31, 13, 45, 1, 250000))
+        self.assertEqual(study.get_date(), datetime.datetime(2020, 1, 31, 13, 45, 1, 250000))
+        self.assertEqual(self.server.count_requests('GET /studies/[^/]+$'), 1)
+
+    def test_givenAForest_whenGettingDatetimesWithoutNumpy_thenAListOfDatetimesIsReturned(self):
+        forest = build_patient_forest(self.orthanc)
+
+        studies, dates = get_datetimes(forest, 'StudyDate', 'StudyTime', level='Study', use_numpy=False)
+
+        self.assertEqual(
+            dict(zip([s.identifier for s in studies], dates)),
+            {
+                orthanc_identifier('P0', '1.0'): datetime.datetime(2020, 1, 31, 13, 45, 1, 250000),
+                orthanc_identifier('P0', '1.1'): datetime.datetime(2019, 1, 1),
+                orthanc_identifier('P1', '1.2'): None,
+                orthanc_identifier('P1', '1.3'): datetime.datetime(2021, 6, 15, 9, 30),
+            }
+        )
+
+    @unittest.skipUnless(numpy, 'numpy is not installed')
+    def test_givenAForest_whenGettingDatetimesWithNumpy_thenADatetime64ArrayIsReturned(self):
+        forest = build_patient_forest(self.orthanc)
+
+        studies, dates = get_datetimes(forest, 'StudyDate', 'StudyTime', level='Study')
+
+        self.assertEqual(dates.dtype, numpy.dtype('datetime64[us]'))
+        self.assertEqual(int(numpy.isnat(dates).sum()), 1)
+        self.assertEqual(
+            sorted(s.identifier for s, d in zip(studies, dates >= numpy.datetime64('2020-01-01')) if d),
+            sorted([orthanc_identifier('P0', '1.0'), orthanc_identifier('P1', '1.3')])
+        )
+
+    def test_givenAForest_whenSortingByDatetime_thenUndatedResourcesComeLast(self):
+        forest = build_patient_forest(self.orthanc)
+
+        result = sort_by_datetime(forest, 'StudyDate', 'StudyTime', level='Study', reverse=True)
+
+        self.assertEqual(
+            [s.identifier for s in result],
+            [orthanc_identifier('P1', '1.3'), orthanc_identifier('P0', '1.0'), orthanc_identifier('P0', '1.1'), orthanc_identifier('P1', '1.2')]
+        )
@@ -0,0 +1,69 @@
+# coding: utf-8
+# author: gabriel couture
+import hashlib
+import os
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.decode import HAS_SHARED_MEMORY, decode_instances
+from tests.fake_orthanc_server import FakeOrthancServer
+
+NUMBER_OF_INSTANCES = 12
+
+
+def _compute_md5(content):
+    return hashlib.md5(content).hexdigest()
+
+
+def _reverse(content):
+    return bytes(content)[::-1]
+
+
+def _list_shared_memory_blocks():
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+
+class TestDecode(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for i in range(NUMBER_OF_INSTANCES):
+            self.server.store.add_instance({
+                'PatientID': 'P1', 'StudyInstanceUID': '1.2', 'SeriesInstanceUID': '1.2.3', 'SOPInstanceUID': f'1.2.3.{i}'
+            })
+        self.identifiers = self.orthanc.get_instances()
+        self.contents = {i: self.server.store.resources['Instance'][i]['Content'] for i in self.identifiers}
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_givenADecoder_whenDecodingWithoutSharedMemory_thenResultsAreInOrder(self):
+        result = list(decode_instances(self.orthanc, self.identifiers, _compute_md5, max_nbr_processes=2, use_shared_memory=False))
+
+        self.assertEqual(result, [(i, hashlib.md5(self.contents[i]).hexdigest()) for i in self.identifiers])
+
+    @unittest.skipUnless(HAS_SHARED_MEMORY, 'Shared memory needs Python 3.8')
+    def test_givenADecoder_whenDecodingWithSharedMemory_thenResultsAreInOrder(self):
+        shared_memory_blocks = _list_shared_memory_blocks()
+
+        result = list(decode_instances(self.orthanc, self.identifiers, _reverse, max_nbr_processes=2))
+
+        self.assertEqual(result, [(i, self.contents[i][::-1]) for i in self.identifiers])
+        self.assertEqual(_list_shared_memory_blocks(), shared_memory_blocks)
+
+    @unittest.skipUnless(HAS_SHARED_MEMORY, 'Shared memory needs Python 3.8')
+    def test_givenADecoder_whenDecodingAsCompleted_thenAllResultsAreYielded(self):
+        result = list(decode_instances(self.orthanc, self.identifiers, _compute_md5, max_nbr_processes=3, ordered=False))
+
+        self.assertEqual(sorted(result), sorted((i, hashlib.md5(self.contents[i]).hexdigest()) for i in self.identifiers))
+
+    @unittest.skipUnless(HAS_SHARED_MEMORY, 'Shared memory needs Python 3.8')
+    def test_givenAnInterruptedIteration_whenClosing_thenSharedMemoryIsReleased(self):
+        shared_memory_blocks = _list_shared_memory_blocks()
+        iterator = decode_instances(self.orthanc, self.identifiers, _reverse, max_nbr_processes=2)
+
+        next(iterator)
+        iterator.close()
+
+        self.assertEqual(_list_shared_memory_blocks(), shared_memory_blocks)
@@ -0,0 +1,104 @@
+# coding: utf-8
+# author: gabriel couture
+import os
+import tempfile
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.diff import DiffReport, diff_orthanc_and_directory, diff_orthanc_servers
+from tests.fake_orthanc_server import FakeOrthancServer, make_dicom_file, orthanc_identifier
+
+
+def _make_instance(patient, study, series, instance):
+    return {
+        'PatientID': f'P{patient}',
+        'StudyInstanceUID': f'1.{patient}.{study}',
+        'SeriesInstanceUID': f'1.{patient}.{study}.{series}',
+        'SOPInstanceUID': f'1.{patient}.{study}.{series}.{instance}'
+    }
+
+
+INSTANCES = [_make_instance(p, st, se, i) for p in range(3) for st in range(2) for se in range(2) for i in range(2)]
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.reference_server = FakeOrthancServer().start()
+        self.other_server = FakeOrthancServer().start()
+        self.reference = Orthanc(self.reference_server.url)
+        self.other = Orthanc(self.other_server.url)
+        for tags in INSTANCES:
+            self.reference_server.store.add_instance(tags)
+            self.other_server.store.add_instance(tags)
+
+    def tearDown(self) -> None:
+        self.reference_server.stop()
+        self.other_server.stop()
+
+    def test_givenIdenticalServers_whenComparing_thenOnlyPatientsAreCompared(self):
+        report = diff_orthanc_servers(self.reference, self.other)
+
+        self.assertIsInstance(report, DiffReport)
+        self.assertTrue(report.is_identical())
+        self.assertEqual(self.reference_server.count_requests('GET /patients/[^/]*/statistics'), 3)
+        self.assertEqual(self.reference_server.count_requests('GET /studies'), 0)
+
+    def test_givenDifferentServers_whenComparing_thenReportHasMissingExtraAndChangedResources(self):
+        self.other_server.store.delete('Instance', orthanc_identifier('P0', '1.0.0', '1.0.0.0', '1.0.0.0.0'))
+        self.other_server.store.delete('Study', orthanc_identifier('P1', '1.1.1'))
+        self.other_server.store.add_instance(_make_instance(9, 0, 0, 0))
+
+        report = diff_orthanc_servers(self.reference, self.other)
+
+        self.assertEqual(report.missing, [
+            ('Study', orthanc_identifier('P1', '1.1.1')),
+            ('Instance', orthanc_identifier('P0', '1.0.0', '1.0.0.0', '1.0.0.0.0'))
+        ])
+        self.assertEqual(report.extra, [('Patient', orthanc_identifier('P9'))])
+        self.assertEqual(sorted(report.changed), sorted([
+            ('Patient', orthanc_identifier('P0')),
+            ('Patient', orthanc_identifier('P1')),
+            ('Study', orthanc_identifier('P0', '1.0.0')),
+            ('Series', orthanc_identifier('P0', '1.0.0', '1.0.0.0'))
+        ]))
+        self.assertEqual(self.reference_server.count_requests('GET /studies/[^/]*/statistics'), 3)
+
+    def test_givenDifferentFilesAndCompareMd5_whenComparing_thenChangedInstancesAreReported(self):
+        identifier = orthanc_identifier('P0', '1.0.0', '1.0.0.0', '1.0.0.0.0')
+        self.other_server.store.delete('Instance', orthanc_identifier('P0', '1.0.0', '1.0.0.0', '1.0.0.0.1'))
+        self.other_server.store.resources['Instance'][identifier]['Md5'] = 'another md5'
+
+        report = diff_orthanc_servers(self.reference, self.other, compare_md5=True)
+
+        self.assertIn(('Instance', identifier), report.changed)
+
+    def test_givenServersDifferingOnlyByInstanceContent_whenComparingMd5_thenChangedInstanceIsReported(self):
+        identifier = orthanc_identifier('P2', '1.2.1', '1.2.1.1', '1.2.1.1.0')
+        self.other_server.store.delete('Instance', identifier)
+        self.other_server.store.add_instance(INSTANCES[-2], make_dicom_file(INSTANCES[-2], b'different pixels'))
+        self.reference_server.store.delete('Instance', identifier)
+        self.reference_server.store.add_instance(INSTANCES[-2], make_dicom_file(INSTANCES[-2], b'original pixels!'))
+
+        self.assertTrue(diff_orthanc_servers(self.reference, self.other).is_identical())
+        report = diff_orthanc_servers(self.reference, self.other, compare_md5=True)
+
+        self.assertEqual(report.missing, [])
+        self.assertEqual(report.extra, [])
+        self.assertEqual(report.changed, [('Instance', identifier)])
+        self.assertEqual(self.reference_server.count_requests('GET /instances/[^/]*/attachments/dicom/md5'), len(INSTANCES))
+
+    def test_givenADirectory_whenComparing_thenInstancesAndFilesAreMatchedByMd5(self):
+        instance_identifiers = self.reference.get_instances()
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, 'sub'))
+            for index, identifier in enumerate(instance_identifiers[1:]):
+                with open(os.path.join(directory, 'sub', f'{index}.dcm'), 'wb') as file_handler:
+                    file_handler.write(self.reference.get_instance_file(identifier))
+            with open(os.path.join(directory, 'extra.dcm'), 'wb') as file_handler:
+                file_handler.write(b'not in orthanc')
+
+            report = diff_orthanc_and_directory(self.reference, directory)
+
+            self.assertEqual(report.missing, [('Instance', instance_identifiers[0])])
+            self.assertEqual(report.extra, [('File', os.path.join(directory, 'extra.dcm'))])
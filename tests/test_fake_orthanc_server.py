@@ -0,0 +1,157 @@
+# coding: utf-8
+# author: gabriel couture
+import os
+import time
+import unittest
+
+from requests import HTTPError
+
+from pyorthanc import Orthanc
+from tests.data import a_patient, a_series
+from tests.fake_orthanc_server import FakeOrthancServer, FakeOrthancStore, make_dicom_file, parse_dicom_file
+
+A_SYNTHETIC_INSTANCE = {
+    'PatientID': 'P1',
+    'PatientName': 'Doe^John',
+    'StudyInstanceUID': '1.2.3',
+    'StudyDate': '20200101',
+    'SeriesInstanceUID': '1.2.3.4',
+    'Modality': 'CT',
+    'SOPInstanceUID': '1.2.3.4.5'
+}
+
+
+class TestFakeOrthancServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.orthanc = None
+
+    def given_patient_in_fake_orthanc_server(self):
+        for file_name in sorted(os.listdir('./tests/data/dicom_files/')):
+            with open(f'./tests/data/dicom_files/{file_name}', 'rb') as file_handler:
+                self.orthanc.post_instances(file_handler.read())
+
+    def test_givenDicomFiles_whenPostingInstances_thenIdentifiersAreTheOnesOfOrthanc(self):
+        self.given_patient_in_fake_orthanc_server()
+
+        self.assertEqual(self.orthanc.get_patients(), [a_patient.IDENTIFIER])
+        self.assertEqual(
+            {k: v for k, v in self.orthanc.get_series_information(a_series.IDENTIFIER).items() if k != 'LastUpdate'},
+            {k: v for k, v in a_series.INFORMATION.items() if k != 'LastUpdate'}
+        )
+
+    def test_givenBadDicomData_whenPostingInstances_thenRaiseHTTPError(self):
+        self.assertRaises(HTTPError, lambda: self.orthanc.post_instances(b'not a dicom file'))
+
+    def test_givenAnInstance_whenGettingFile_thenResultIsTheUploadedFile(self):
+        content = make_dicom_file(A_SYNTHETIC_INSTANCE, pixel_data=b'\x01' * 100)
+        identifier = self.orthanc.post_instances(content)['ID']
+
+        result = self.orthanc.get_instance_file(identifier)
+
+        self.assertEqual(result, content)
+        self.assertEqual(parse_dicom_file(result), A_SYNTHETIC_INSTANCE)
+
+    def test_givenInstances_whenFinding_thenResultIsMatchingResources(self):
+        self.server.store.add_instance(A_SYNTHETIC_INSTANCE)
+        self.server.store.add_instance({**A_SYNTHETIC_INSTANCE, 'SeriesInstanceUID': '1.2.3.5', 'Modality': 'MR'})
+
+        result = self.orthanc.c_find({'Level': 'Series', 'Query': {'Modality': 'M*', 'PatientID': 'P1'}, 'Expand': True})
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]['MainDicomTags']['Modality'], 'MR')
+
+    def test_givenInstances_whenListingWithSinceAndLimit_thenResultIsAPage(self):
+        for i in range(5):
+            self.server.store.add_instance({**A_SYNTHETIC_INSTANCE, 'SOPInstanceUID': f'1.2.3.4.{i}'})
+
+        result = self.orthanc.get_request(f'{self.server.url}/instances', {'since': 1, 'limit': 2})
+
+        self.assertEqual(result, list(self.server.store.resources['Instance'])[1:3])
+
+    def test_givenNewInstance_whenGettingChanges_thenChangesContainNewResources(self):
+        self.server.store.add_instance(A_SYNTHETIC_INSTANCE)
+
+        result = self.orthanc.get_changes()
+
+        self.assertEqual(
+            [c['ChangeType'] for c in result['Changes']],
+            ['NewPatient', 'NewStudy', 'NewSeries', 'NewInstance']
+        )
+        self.assertTrue(result['Done'])
+
+    def test_givenAsynchronousAnonymization_whenJobIsDone_thenContentHasNewPatient(self):
+        self.server.job_duration = 0.2
+        patient_identifier = self.server.store.add_instance(A_SYNTHETIC_INSTANCE)['ParentPatient']
+
+        job = self.orthanc.anonymize_patient(patient_identifier, {'Asynchronous': True})
+
+        self.assertEqual(self.orthanc.get_job_information(job['ID'])['State'], 'Running')
+        time.sleep(0.25)
+        information = self.orthanc.get_job_information(job['ID'])
+        self.assertEqual(information['State'], 'Success')
+        self.assertIn(information['Content']['ID'], self.orthanc.get_patients())
+
+    def test_givenARunningJob_whenCanceling_thenJobFails(self):
+        self.server.job_duration = 10
+        patient_identifier = self.server.store.add_instance(A_SYNTHETIC_INSTANCE)['ParentPatient']
+        job = self.orthanc.anonymize_patient(patient_identifier, {'Asynchronous': True})
+
+        self.orthanc.cancel_job(job['ID'])
+
+        self.assertEqual(self.orthanc.get_job_information(job['ID'])['State'], 'Failure')
+
+    def test_givenLinkedModality_whenQueryingAndMoving_thenInstancesAreRetrieved(self):
+        remote_store = FakeOrthancStore('REMOTE')
+        remote_store.add_instance(A_SYNTHETIC_INSTANCE)
+        self.server.store.add_modality('remote', remote_store=remote_store)
+
+        query = self.orthanc.query_on_modality('remote', {'Level': 'Study', 'Query': {'PatientID': 'P*'}})
+        self.orthanc.move_query_results_to_given_modality(query['ID'], {'TargetAet': 'ORTHANC'})
+
+        self.assertTrue(self.orthanc.echo_to_modality('remote'))
+        self.assertEqual(
+            self.orthanc.get_content_of_specified_query_answer_in_simplified_version(query['ID'], 0)['StudyInstanceUID'],
+            '1.2.3'
+        )
+        self.assertEqual(len(self.orthanc.get_instances()), 1)
+
+    def test_givenInjectedErrors_whenRequesting_thenOnlyTheInjectedNumberOfRequestsFail(self):
+        self.server.inject_errors('GET /patients$', count=2)
+
+        self.assertRaises(HTTPError, self.orthanc.get_patients)
+        self.assertRaises(HTTPError, self.orthanc.get_patients)
+        self.assertEqual(self.orthanc.get_patients(), [])
+        self.assertEqual(self.server.count_requests('GET /patients'), 3)
+
+    def test_givenLatency_whenRequesting_thenRequestIsDelayed(self):
+        self.server.latency = 0.1
+
+        start = time.monotonic()
+        self.orthanc.get_patients()
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_givenACorruptedInstance_whenVerifyingMd5_thenRaiseHTTPError(self):
+        identifier = self.server.store.add_instance(A_SYNTHETIC_INSTANCE)['ID']
+        md5 = self.orthanc.get_attachment_md5('instances', identifier, 'dicom')
+
+        self.server.store.corrupt_instance(identifier)
+
+        self.assertEqual(self.orthanc.get_attachment_md5('instances', identifier, 'dicom'), md5)
+        self.assertRaises(HTTPError, lambda: self.orthanc.post_attachment_verify_md5('instances', identifier, 'dicom'))
+
+    def test_givenAPeer_whenStoringOnPeer_thenInstancesAreCopiedToThePeer(self):
+        peer_store = FakeOrthancStore()
+        self.server.store.add_peer('peer', remote_store=peer_store)
+        identifier = self.server.store.add_instance(A_SYNTHETIC_INSTANCE)['ParentStudy']
+
+        self.orthanc.store_peer('peer', [identifier])
+
+        self.assertEqual(self.orthanc.get_peers(), ['peer'])
+        self.assertEqual(list(peer_store.resources['Study']), [identifier])
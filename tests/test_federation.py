@@ -0,0 +1,101 @@
+# coding: utf-8
+# author: gabriel couture
+import unittest
+
+from pyorthanc import FederatedOrthanc, Orthanc
+from tests.fake_orthanc_server import FakeOrthancServer, FakeOrthancStore, orthanc_identifier
+
+SHARED_PATIENT_TAGS = {'PatientID': 'SHARED', 'StudyInstanceUID': '9.1', 'SeriesInstanceUID': '9.1.1', 'SOPInstanceUID': '9.1.1.1'}
+
+
+class TestFederatedOrthanc(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.servers = {}
+        for prefix, site in enumerate(('site-a', 'site-b'), start=1):
+            store = FakeOrthancStore()
+            for i in range(2):
+                store.add_instance({
+                    'PatientID': f'{site}-P{i}',
+                    'StudyInstanceUID': f'{prefix}.{i}',
+                    'SeriesInstanceUID': f'{prefix}.{i}.1',
+                    'SOPInstanceUID': f'{prefix}.{i}.1.1'
+                })
+            store.add_instance(SHARED_PATIENT_TAGS)
+            self.servers[site] = FakeOrthancServer(store=store).start()
+
+        self.federation = FederatedOrthanc({name: Orthanc(server.url) for name, server in self.servers.items()})
+
+    def tearDown(self) -> None:
+        for server in self.servers.values():
+            server.stop()
+
+    def test_givenServers_whenCFind_thenResultsAreMergedByIdentifier(self):
+        result = self.federation.c_find({'Level': 'Patient', 'Query': {}})
+
+        self.assertEqual(len(result), 5)
+        self.assertEqual(len(set(result)), 5)
+        self.assertIn(orthanc_identifier('SHARED'), result)
+
+    def test_givenServers_whenCFindWithExpand_thenResultsHaveTheirServers(self):
+        result = self.federation.c_find({'Level': 'Patient', 'Query': {}, 'Expand': True})
+
+        servers = {r['MainDicomTags']['PatientID']: r['Servers'] for r in result}
+        self.assertEqual(servers['SHARED'], ['site-a', 'site-b'])
+        self.assertEqual(servers['site-a-P0'], ['site-a'])
+        self.assertEqual(servers['site-b-P1'], ['site-b'])
+
+    def test_givenServers_whenLookup_thenResultsAreMerged(self):
+        result = self.federation.lookup('9.1')
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]['Type'], 'Study')
+        self.assertEqual(result[0]['Servers'], ['site-a', 'site-b'])
+
+    def test_givenServers_whenBuildingPatientForest_thenTreesOfTheSamePatientAreMerged(self):
+        self.servers['site-b'].store.add_instance({**SHARED_PATIENT_TAGS, 'StudyInstanceUID': '9.2', 'SeriesInstanceUID': '9.2.1', 'SOPInstanceUID': '9.2.1.1'})
+
+        forest = self.federation.build_patient_forest()
+
+        self.assertEqual(len(forest), 5)
+        shared_patient = forest.get(orthanc_identifier('SHARED'))
+        self.assertEqual(sorted(s.identifier for s in shared_patient.get_studies()), sorted([orthanc_identifier('SHARED', '9.1'), orthanc_identifier('SHARED', '9.2')]))
+        self.assertEqual(self.federation.get_server_name(forest.get(orthanc_identifier('SHARED', '9.2'))), 'site-b')
+        self.assertEqual(self.federation.get_server_name(next(p for p in forest if p.get_id() == 'site-b-P0')), 'site-b')
+
+    def test_givenAForest_whenGettingAnInstanceFile_thenNoLocationRequestIsSent(self):
+        self.federation.build_patient_forest()
+        instance_identifier = orthanc_identifier('site-b-P1', '2.1', '2.1.1', '2.1.1.1')
+
+        self.federation.get_instance_file(instance_identifier)
+
+        self.assertEqual(self.federation.locate(orthanc_identifier('SHARED', '9.1', '9.1.1', '9.1.1.1')), ['site-a', 'site-b'])
+        self.assertEqual(self.servers['site-a'].count_requests(f'GET /instances/{instance_identifier}'), 0)
+        self.assertEqual(self.servers['site-b'].count_requests(f'GET /instances/{instance_identifier}$'), 0)
+
+    def test_givenAnInstanceOfOneServer_whenGettingItsFile_thenRequestIsRoutedToItsServer(self):
+        instance_identifier = orthanc_identifier('site-b-P1', '2.1', '2.1.1', '2.1.1.1')
+
+        first_content = self.federation.get_instance_file(instance_identifier)
+        second_content = self.federation.get_instance_file(instance_identifier)
+
+        self.assertEqual(first_content, second_content)
+        self.assertEqual(self.federation.locate(instance_identifier), ['site-b'])
+        self.assertEqual(self.servers['site-a'].count_requests(f'GET /instances/{instance_identifier}/file'), 0)
+        self.assertEqual(self.servers['site-b'].count_requests(f'GET /instances/{instance_identifier}/file'), 2)
+        self.assertEqual(self.servers['site-b'].count_requests(f'GET /instances/{instance_identifier}$'), 1)  # Located once
+
+    def test_givenASearchedStudy_whenGettingItsInformation_thenNoLocationRequestIsSent(self):
+        study = self.federation.c_find({'Level': 'Study', 'Query': {'StudyInstanceUID': '1.0'}})[0]
+
+        result = self.federation.get_study_information(study)
+
+        self.assertEqual(result['MainDicomTags']['StudyInstanceUID'], '1.0')
+        self.assertEqual(self.servers['site-b'].count_requests('GET /studies/'), 0)
+
+    def test_givenAnUnknownResource_whenCallingAMethod_thenKeyErrorIsRaised(self):
+        with self.assertRaises(KeyError):
+            self.federation.get_instance_file('unknown')
+
+        with self.assertRaises(AttributeError):
+            self.federation.get_patients()
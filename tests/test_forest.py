@@ -0,0 +1,114 @@
+# coding: utf-8
+# author: gabriel couture
+import datetime
+import unittest
+
+from pyorthanc import Orthanc, PatientForest, build_patient_forest
+from tests.fake_orthanc_server import FakeOrthancServer, orthanc_identifier
+
+STUDIES = [
+    # (PatientID, StudyDate, modalities of the series)
+    ('P0', '20190101', ['CT', 'SR']),
+    ('P0', '20200601', ['MR']),
+    ('P1', '20201231', ['CT']),
+]
+NUMBER_OF_INSTANCES_PER_SERIES = 2
+
+
+class TestPatientForest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for index, (patient_id, study_date, modalities) in enumerate(STUDIES):
+            for series_index, modality in enumerate(modalities):
+                for i in range(NUMBER_OF_INSTANCES_PER_SERIES):
+                    self._add_instance(index, series_index, i)
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def _add_instance(self, index, series_index, instance_index):
+        patient_id, study_date, modalities = STUDIES[index]
+        self.server.store.add_instance({
+            'PatientID': patient_id,
+            'StudyInstanceUID': f'1.{index}',
+            'StudyDate': study_date,
+            'SeriesInstanceUID': f'1.{index}.{series_index}',
+            'Modality': modalities[series_index],
+            'SOPInstanceUID': f'1.{index}.{series_index}.{instance_index}'
+        })
+
+    def test_givenAForest_whenLookingUpResources_thenNoRequestIsSent(self):
+        forest = build_patient_forest(self.orthanc)
+        nbr_requests = self.server.count_requests('')
+
+        study = forest.find('Study', '1.1')[0]
+        instance = forest.get(orthanc_identifier('P0', '1.0', '1.0.1', '1.0.1.0'))
+
+        self.assertIsInstance(forest, PatientForest)
+        self.assertEqual(study.identifier, orthanc_identifier('P0', '1.1'))
+        self.assertEqual([p.identifier for p in forest.find('Patient', 'P0')], [orthanc_identifier('P0')])
+        self.assertEqual(forest.find('Instance', '1.0.1.0'), [instance])
+        self.assertEqual(forest.find('Series', 'unknown'), [])
+        self.assertEqual(instance.get_parent_series_identifier(), orthanc_identifier('P0', '1.0', '1.0.1'))
+        self.assertEqual(instance.parent.parent.get_parent_patient_identifier(), orthanc_identifier('P0'))
+        self.assertIs(instance.parent.parent.parent, forest.get(orthanc_identifier('P0')))
+        self.assertEqual(self.server.count_requests(''), nbr_requests)
+
+    def test_givenAnUntrimmedForestWithAFilteredPatient_whenBuilding_thenNoPatientInformationIsRequested(self):
+        forest = build_patient_forest(
+            self.orthanc, patient_filter=lambda p: p.identifier != orthanc_identifier('P1'), do_trim_forest_after_construction=False
+        )
+
+        self.assertEqual(self.server.count_requests('GET /patients/[^/]+$'), 0)
+        self.assertIsNotNone(forest.get(orthanc_identifier('P1')))
+        self.assertEqual(forest.find('Patient', 'P1'), [])
+        self.assertEqual(len(forest.find('Patient', 'P0')), 1)
+
+    def test_givenAForest_whenGettingByModality_thenSeriesAndInstancesOfTheModalityAreReturned(self):
+        forest = build_patient_forest(self.orthanc)
+
+        series = forest.get_series_by_modality('CT')
+        instances = forest.get_instances_by_modality('CT')
+
+        self.assertEqual(
+            sorted(s.identifier for s in series),
+            sorted([orthanc_identifier('P0', '1.0', '1.0.0'), orthanc_identifier('P1', '1.2', '1.2.0')])
+        )
+        self.assertEqual(len(instances), 2 * NUMBER_OF_INSTANCES_PER_SERIES)
+        self.assertEqual(forest.get_instances_by_modality('US'), [])
+
+    def test_givenAForest_whenGettingStudiesByDate_thenStudiesOfTheDaysAreReturned(self):
+        forest = build_patient_forest(self.orthanc)
+
+        self.assertEqual([s.identifier for s in forest.get_studies_by_date('20200601')], [orthanc_identifier('P0', '1.1')])
+        self.assertEqual(forest.get_studies_by_date(datetime.date(2019, 1, 1))[0].identifier, orthanc_identifier('P0', '1.0'))
+        self.assertEqual(
+            [s.identifier for s in forest.get_studies_between('20200101', datetime.date(2020, 12, 31))],
+            [orthanc_identifier('P0', '1.1'), orthanc_identifier('P1', '1.2')]
+        )
+        with self.assertRaises(ValueError):
+            forest.get_studies_by_date('2020')
+
+    def test_givenAForest_whenTrimming_thenEmptyResourcesAreRemovedFromIndexes(self):
+        forest = build_patient_forest(self.orthanc)
+        study = forest.get(orthanc_identifier('P1', '1.2'))
+        study.series[0].instances = []
+
+        forest.trim()
+
+        self.assertEqual([p.identifier for p in forest], [orthanc_identifier('P0')])
+        self.assertIsNone(forest.get(orthanc_identifier('P1', '1.2')))
+        self.assertEqual(forest.find('Patient', 'P1'), [])
+        self.assertEqual(len(forest.get_series_by_modality('CT')), 1)
+
+    def test_givenAForest_whenRefreshingAStudy_thenNewResourcesAreIndexed(self):
+        forest = build_patient_forest(self.orthanc)
+        self._add_instance(2, 0, NUMBER_OF_INSTANCES_PER_SERIES)
+
+        forest.refresh(forest.get(orthanc_identifier('P1', '1.2')))
+
+        self.assertEqual(len(forest.get_instances_by_modality('CT')), 2 * NUMBER_OF_INSTANCES_PER_SERIES + 1)
+        instance = forest.find('Instance', f'1.2.0.{NUMBER_OF_INSTANCES_PER_SERIES}')[0]
+        self.assertEqual(instance.parent.get_parent_study_identifier(), orthanc_identifier('P1', '1.2'))
@@ -0,0 +1,79 @@
+# coding: utf-8
+# author: gabriel couture
+import ast
+import os
+import subprocess
+import sys
+import unittest
+
+IMPORT_TIME_BUDGET_IN_MICROSECONDS = 20_000
+HEAVY_MODULES = ['requests', 'urllib3', 'concurrent.futures']
+
+
+def _run_python(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *options, '-c', code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True
+    )
+
+
+class TestImportTime(unittest.TestCase):
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Lazy loading needs module __getattr__ (Python 3.7)')
+    def test_whenImportingPyorthanc_thenNeitherHeavyNorFeatureModulesAreImported(self):
+        result = _run_python(
+            'import sys, pyorthanc\n'
+            f'print(",".join(m for m in sys.modules if m in {HEAVY_MODULES!r} or m.startswith("pyorthanc.")))'
+        )
+
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_whenImportingUtil_thenBulkOperationsAndThreadPoolsAreNotImported(self):
+        result = _run_python(
+            'import sys, pyorthanc.util\n'
+            'print(",".join(m for m in ["concurrent.futures", "pyorthanc.bulk", "pyorthanc.job", "csv"] if m in sys.modules))'
+        )
+
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_whenAccessingPublicNames_thenTheyAreLoadedFromTheirModule(self):
+        import pyorthanc
+
+        for name in pyorthanc.__all__:
+            self.assertEqual(getattr(pyorthanc, name).__module__, pyorthanc._LAZY_ATTRIBUTES[name])
+
+    def test_givenTheTypeCheckingImports_whenComparingWithLazyAttributes_thenTheyMatch(self):
+        import pyorthanc
+
+        with open(pyorthanc.__file__) as file_handler:
+            module = ast.parse(file_handler.read())
+        type_checking_block = next(
+            n for n in module.body if isinstance(n, ast.If) and isinstance(n.test, ast.Name) and n.test.id == 'TYPE_CHECKING'
+        )
+        imported_names = {a.name: n.module for n in type_checking_block.body for a in n.names}
+
+        self.assertEqual(imported_names, pyorthanc._LAZY_ATTRIBUTES)
+
+    def test_whenAccessingAnUnknownName_thenRaiseAttributeError(self):
+        import pyorthanc
+
+        self.assertRaises(AttributeError, lambda: pyorthanc.NotAPublicName)
+
+    @unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs Python 3.7')
+    @unittest.skipUnless(os.environ.get('PYORTHANC_CHECK_IMPORT_TIME'), 'Wall-clock budget, set PYORTHANC_CHECK_IMPORT_TIME=1 to check it')
+    def test_whenImportingPyorthanc_thenImportTimeIsUnderBudget(self):
+        _run_python('import pyorthanc')  # Warm up the bytecode cache
+
+        result = _run_python('import pyorthanc', '-X', 'importtime')
+
+        cumulative_times = [
+            int(line.split('|')[1])
+            for line in result.stderr.splitlines()
+            if line.startswith('import time:') and line.split('|')[2].strip() == 'pyorthanc'
+        ]
+        self.assertEqual(len(cumulative_times), 1)
+        self.assertLess(cumulative_times[0], IMPORT_TIME_BUDGET_IN_MICROSECONDS)
@@ -0,0 +1,86 @@
+# coding: utf-8
+# author: gabriel couture
+import os
+import tempfile
+import time
+import unittest
+
+from pyorthanc import Orthanc, verify_attachments
+from pyorthanc.integrity import read_checkpoint
+from pyorthanc.patient import Patient
+from tests.fake_orthanc_server import FakeOrthancServer
+
+NUMBER_OF_INSTANCES = 12
+
+
+class TestIntegrity(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        self.instances = [
+            self.server.store.add_instance({
+                'PatientID': f'P{i % 3}',
+                'StudyInstanceUID': f'1.2.{i % 3}',
+                'SeriesInstanceUID': f'1.2.{i % 3}.1',
+                'SOPInstanceUID': f'1.2.{i % 3}.1.{i}'
+            })['ID']
+            for i in range(NUMBER_OF_INSTANCES)
+        ]
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.directory.name, 'audit.csv')
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.directory.cleanup()
+
+    def test_givenAnIntactArchive_whenVerifying_thenAllInstancesAreIntact(self):
+        progress = []
+
+        report = verify_attachments(self.orthanc, progress_callback=lambda done, total: progress.append((done, total)))
+
+        self.assertTrue(report.is_intact())
+        self.assertEqual(set(report.results), set(self.instances))
+        self.assertEqual(report.results[self.instances[0]], {'dicom': 'Intact'})
+        self.assertEqual(progress[-1], (NUMBER_OF_INSTANCES, NUMBER_OF_INSTANCES))
+
+    def test_givenCorruptedAndMissingFiles_whenVerifying_thenReportHasThem(self):
+        self.server.store.corrupt_instance(self.instances[1])
+        self.server.store.lose_instance_file(self.instances[2])
+
+        report = verify_attachments(self.orthanc, max_nbr_workers=3)
+
+        self.assertFalse(report.is_intact())
+        self.assertTrue(report.is_successful())
+        self.assertEqual(report.get_corrupted(), {self.instances[1]: ['dicom']})
+        self.assertEqual(report.get_missing(), {self.instances[2]: ['dicom']})
+
+    def test_givenResources_whenVerifying_thenOnlyTheirInstancesAreVerified(self):
+        patient = Patient(self.orthanc.get_patients()[0], self.orthanc)
+        patient_instances = {i['ID'] for i in self.orthanc.get_patient_instances(patient.get_identifier())}
+        other_instance = next(i for i in self.instances if i not in patient_instances)
+
+        report = verify_attachments(self.orthanc, [patient, other_instance, *patient_instances], attachments=None)
+
+        self.assertEqual(set(report.results), patient_instances | {other_instance})
+        self.assertEqual(self.server.count_requests('GET /instances/[^/]+/attachments$'), len(patient_instances) + 1)
+
+    def test_givenAnInterruptedScan_whenRestarting_thenVerifiedInstancesAreSkipped(self):
+        self.server.store.corrupt_instance(self.instances[0])
+        self.server.inject_errors(f'POST /instances/{self.instances[5]}/', count=1, status_code=503)
+
+        first_report = verify_attachments(self.orthanc, checkpoint_path=self.checkpoint_path)
+        second_report = verify_attachments(self.orthanc, checkpoint_path=self.checkpoint_path)
+
+        self.assertEqual(list(first_report.errors), [self.instances[5]])
+        self.assertEqual(len(read_checkpoint(self.checkpoint_path)), NUMBER_OF_INSTANCES)
+        self.assertEqual(self.server.count_requests('/verify-md5'), NUMBER_OF_INSTANCES + 1)
+        self.assertTrue(second_report.is_successful())
+        self.assertEqual(second_report.get_corrupted(), {self.instances[0]: ['dicom']})
+
+    def test_givenARateLimit_whenVerifying_thenRequestsAreSpaced(self):
+        start = time.monotonic()
+
+        verify_attachments(self.orthanc, max_nbr_workers=4, max_nbr_requests_per_second=100)
+
+        self.assertGreaterEqual(time.monotonic() - start, (NUMBER_OF_INSTANCES - 1) / 100)
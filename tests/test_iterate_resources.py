@@ -0,0 +1,49 @@
+# coding: utf-8
+# author: gabriel couture
+import unittest
+
+from pyorthanc import Orthanc
+from tests.fake_orthanc_server import FakeOrthancServer
+
+NUMBER_OF_INSTANCES = 25
+
+
+class TestIterateResources(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for i in range(NUMBER_OF_INSTANCES):
+            self.server.store.add_instance({
+                'PatientID': f'P{i % 5}', 'StudyInstanceUID': f'1.{i % 5}', 'SeriesInstanceUID': f'1.{i % 5}.{i % 10}',
+                'SOPInstanceUID': f'1.{i % 5}.{i % 10}.{i}'
+            })
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_givenAPageSize_whenIteratingInstances_thenResultIsAllInstancesReadByPages(self):
+        result = list(self.orthanc.iterate_instances(page_size=10))
+
+        self.assertEqual(result, self.orthanc.get_instances())
+        self.assertEqual(self.server.count_requests(r'GET /instances\?since=\d+&limit=10'), 3)
+
+    def test_givenAPageSizeDividingTheNumberOfResources_whenIterating_thenAnEmptyPageEndsTheIteration(self):
+        result = list(self.orthanc.iterate_patients(page_size=5))
+
+        self.assertEqual(result, self.orthanc.get_patients())
+        self.assertEqual(self.server.count_requests(r'GET /patients\?'), 2)
+
+    def test_givenExpand_whenIterating_thenResultIsTheResourcesInformation(self):
+        studies = list(self.orthanc.iterate_studies(page_size=2, expand=True))
+        series = list(self.orthanc.iterate_series(page_size=3, expand=True))
+
+        self.assertEqual([s['ID'] for s in studies], self.orthanc.get_studies())
+        self.assertEqual([s['ID'] for s in series], self.orthanc.get_series())
+        self.assertIn('MainDicomTags', studies[0])
+
+    def test_givenAConsumerStoppingEarly_whenIterating_thenOnlyTheFirstPageIsRead(self):
+        result = next(self.orthanc.iterate_instances(page_size=10))
+
+        self.assertEqual(result, self.orthanc.get_instances()[0])
+        self.assertEqual(self.server.count_requests(r'GET /instances\?'), 1)
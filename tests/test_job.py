@@ -0,0 +1,116 @@
+# coding: utf-8
+# author: gabriel couture
+import concurrent.futures
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.job import Job, JobFailedError, JobWatcher, as_completed, submit_job
+from tests.fake_orthanc_server import FakeOrthancServer
+
+NUMBER_OF_STUDIES = 30
+
+
+class TestJob(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer(job_duration=0.1).start()
+        self.orthanc = Orthanc(self.server.url)
+        self.study_identifiers = [
+            self.server.store.add_instance({
+                'PatientID': f'P{i}',
+                'StudyInstanceUID': f'1.2.{i}',
+                'SeriesInstanceUID': f'1.2.{i}.1',
+                'SOPInstanceUID': f'1.2.{i}.1.1'
+            })['ParentStudy']
+            for i in range(NUMBER_OF_STUDIES)
+        ]
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.orthanc = None
+
+    def test_givenAnOperation_whenSubmittingJob_thenRequestIsAsynchronousAndResultIsJobContent(self):
+        job = submit_job(self.orthanc.anonymize_study, self.study_identifiers[0])
+
+        self.assertIsInstance(job, Job)
+        self.assertFalse(job.done())
+        result = job.result(timeout=5)
+        self.assertTrue(job.done())
+        self.assertIn(result['ID'], self.orthanc.get_studies())
+
+    def test_givenARunningJob_whenWaitingLessThanItsDuration_thenRaiseTimeoutError(self):
+        self.server.job_duration = 10
+        job = submit_job(self.orthanc.anonymize_study, self.study_identifiers[0])
+
+        self.assertRaises(concurrent.futures.TimeoutError, lambda: job.result(timeout=0.1))
+
+    def test_givenARunningJob_whenCanceling_thenResultRaiseCancelledError(self):
+        self.server.job_duration = 10
+        job = submit_job(self.orthanc.anonymize_study, self.study_identifiers[0])
+
+        self.assertTrue(job.cancel())
+
+        self.assertTrue(job.cancelled())
+        self.assertRaises(concurrent.futures.CancelledError, lambda: job.result(timeout=5))
+
+    def test_givenAFailingJob_whenGettingResult_thenRaiseJobFailedError(self):
+        self.server.job_error_rate = 1.0
+        job = submit_job(self.orthanc.anonymize_study, self.study_identifiers[0])
+
+        self.assertRaises(JobFailedError, lambda: job.result(timeout=5))
+        self.assertIsInstance(job.exception(), JobFailedError)
+
+    def test_givenADoneCallback_whenJobCompletes_thenCallbackIsCalledOnce(self):
+        called_with = []
+        job = submit_job(self.orthanc.anonymize_study, self.study_identifiers[0])
+        job.add_done_callback(called_with.append)
+
+        job.result(timeout=5)
+        job.result(timeout=5)
+
+        self.assertEqual(called_with, [job])
+
+    def test_givenAnArchiveJob_whenGettingOutput_thenResultIsZipBytes(self):
+        job = submit_job(self.orthanc.create_archive, data={'Resources': self.study_identifiers[:2]})
+
+        result = job.get_output('archive')
+
+        self.assertEqual(result[:2], b'PK')
+
+    def test_givenManyJobsAndAWatcher_whenWaitingForAll_thenJobsArePolledInBatch(self):
+        watcher = JobWatcher(self.orthanc)
+        jobs = [submit_job(self.orthanc.anonymize_study, i, watcher=watcher) for i in self.study_identifiers]
+
+        completed_jobs = list(as_completed(jobs, timeout=5))
+
+        self.assertCountEqual(completed_jobs, jobs)
+        self.assertTrue(all(job.done() for job in jobs))
+        self.assertEqual(self.server.count_requests(r'GET /jobs/'), 0)
+        self.assertLess(self.server.count_requests(r'GET /jobs\?expand'), len(jobs))
+        self.assertEqual(watcher.get_number_of_watched_jobs(), 0)
+
+    def test_givenJobsEvictedFromHistory_whenWatching_thenEvictedJobsFailAndOthersComplete(self):
+        self.server.jobs_history_size = 2
+        watcher = JobWatcher(self.orthanc)
+        jobs = [submit_job(self.orthanc.anonymize_study, i, watcher=watcher) for i in self.study_identifiers[:5]]
+
+        completed_jobs = list(as_completed(jobs, timeout=5))
+
+        self.assertCountEqual(completed_jobs, jobs)
+        errors = [job.exception(timeout=0) for job in jobs]
+        self.assertTrue(all(e is None or (isinstance(e, JobFailedError) and 'evicted' in str(e)) for e in errors))
+        self.assertGreater(sum(e is not None for e in errors), 0)
+        self.assertGreaterEqual(sum(e is None for e in errors), 2)  # The jobs still in the history
+
+    def test_givenADoneJobAndAnElapsedTimeout_whenIteratingAsCompleted_thenJobIsYielded(self):
+        job = submit_job(self.orthanc.anonymize_study, self.study_identifiers[0])
+        job.result(timeout=5)
+
+        self.assertEqual(list(as_completed([job], timeout=0)), [job])
+
+    def test_givenUnwatchedJobs_whenWaitingForAll_thenAllJobsAreYielded(self):
+        jobs = [submit_job(self.orthanc.anonymize_study, i) for i in self.study_identifiers[:3]]
+
+        completed_jobs = list(as_completed(jobs, timeout=5))
+
+        self.assertCountEqual(completed_jobs, jobs)
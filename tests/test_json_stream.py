@@ -0,0 +1,80 @@
+# coding: utf-8
+# author: gabriel couture
+import json
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.json_stream import iterate_json_items
+from tests.fake_orthanc_server import FakeOrthancServer, orthanc_identifier
+
+DOCUMENTS = [
+    [],
+    {},
+    [1, -2.5e3, 'a "quoted" string', None, True, False, [[]], {'key': {'nested': [1, 2, 3]}}],
+    {'first': 1234567, 'second': 'été ✓', 'third': [{'a': None}], 'fourth': ''},
+]
+
+
+def _split(data, chunk_size):
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+class TestJsonStream(unittest.TestCase):
+
+    def test_givenDocumentsInChunks_whenIterating_thenResultIsTheItemsOfTheDocuments(self):
+        for document in DOCUMENTS:
+            for indent in [None, 2]:
+                data = json.dumps(document, indent=indent, ensure_ascii=False).encode()
+                expected = list(document.items()) if isinstance(document, dict) else document
+
+                for chunk_size in [1, 2, 5, 1000]:
+                    result = list(iterate_json_items(_split(data, chunk_size)))
+
+                    self.assertEqual(result, expected)
+
+    def test_givenAStream_whenIterating_thenItemsAreYieldedBeforeTheEndOfTheStream(self):
+        read_chunks = []
+
+        def chunks():
+            for chunk in [b'[{"a": 1}, ', b'{"b": 2}, ', b'{"c": 3}]']:
+                read_chunks.append(chunk)
+                yield chunk
+
+        iterator = iterate_json_items(chunks())
+
+        self.assertEqual(next(iterator), {'a': 1})
+        self.assertEqual(len(read_chunks), 1)
+        self.assertEqual(next(iterator), {'b': 2})
+        self.assertEqual(len(read_chunks), 2)
+
+    def test_givenInvalidDocuments_whenIterating_thenValueErrorIsRaised(self):
+        for data in [b'1', b'"text"', b'[1, 2', b'[1 2]', b'{"a" 1}', b'{1: 2}', b'[1] [2]', b'', b'[1,]']:
+            self.assertRaises(ValueError, lambda: list(iterate_json_items(_split(data, 2))))
+
+
+class TestIterateInstancesTags(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for i in range(20):
+            self.server.store.add_instance({
+                'PatientID': 'P1', 'StudyInstanceUID': '1.2', 'SeriesInstanceUID': f'1.2.{i % 2}', 'SOPInstanceUID': f'1.2.{i % 2}.{i}',
+                'StudyDescription': 'A study'
+            })
+        self.study_identifier = orthanc_identifier('P1', '1.2')
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_givenAStudy_whenIteratingInstancesTags_thenResultIsTheInstancesTags(self):
+        result = dict(self.orthanc.iterate_study_instances_tags(self.study_identifier))
+
+        self.assertEqual(result, self.orthanc.get_study_instances_tags(self.study_identifier))
+        self.assertEqual(len(result), 20)
+
+    def test_givenSimplify_whenIteratingPatientInstancesTags_thenTagsAreSimplified(self):
+        result = dict(self.orthanc.iterate_patient_instances_tags(orthanc_identifier('P1'), simplify=True))
+
+        self.assertEqual(len(result), 20)
+        self.assertTrue(all(tags['StudyDescription'] == 'A study' for tags in result.values()))
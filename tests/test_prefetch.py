@@ -0,0 +1,81 @@
+# coding: utf-8
+# author: gabriel couture
+import asyncio
+import time
+import unittest
+
+import requests
+
+from pyorthanc import Instance, Orthanc
+from pyorthanc.prefetch import InstancePrefetcher
+from tests.fake_orthanc_server import FakeOrthancServer
+
+NUMBER_OF_INSTANCES = 10
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer(latency=0.02).start()
+        self.orthanc = Orthanc(self.server.url)
+        for i in range(NUMBER_OF_INSTANCES):
+            self.server.store.add_instance({
+                'PatientID': 'P1', 'StudyInstanceUID': '1.2', 'SeriesInstanceUID': '1.2.3', 'SOPInstanceUID': f'1.2.3.{i}'
+            })
+        self.identifiers = self.orthanc.get_instances()
+        self.expected = {i: self.server.store.resources['Instance'][i]['Content'] for i in self.identifiers}
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def _iterate_and_count(self, pulled):
+        for identifier in self.identifiers:
+            pulled.append(identifier)
+            yield identifier
+
+    def test_givenIdentifiers_whenIterating_thenFilesAreYieldedInOrder(self):
+        result = list(InstancePrefetcher(self.orthanc, self.identifiers, max_nbr_downloads=4))
+
+        self.assertEqual(result, [(i, self.expected[i]) for i in self.identifiers])
+
+    def test_givenInstances_whenIteratingAsCompleted_thenAllFilesAreYielded(self):
+        instances = [Instance(i, self.orthanc) for i in self.identifiers]
+
+        result = list(InstancePrefetcher(self.orthanc, instances, max_nbr_downloads=4, ordered=False))
+
+        self.assertEqual(sorted(i.get_identifier() for i, _ in result), sorted(self.identifiers))
+        self.assertTrue(all(content == self.expected[i.get_identifier()] for i, content in result))
+
+    def test_givenASlowConsumer_whenIterating_thenDownloadsStopAtTheMaximumBufferedSize(self):
+        for max_buffered_size, expected_nbr_pulled in [(1, (4, 5)), (10 ** 9, (NUMBER_OF_INSTANCES,))]:
+            pulled = []
+            iterator = iter(InstancePrefetcher(
+                self.orthanc, self._iterate_and_count(pulled), max_nbr_downloads=4, max_buffered_size=max_buffered_size
+            ))
+
+            next(iterator)
+            time.sleep(0.3)
+
+            self.assertIn(len(pulled), expected_nbr_pulled)
+            iterator.close()
+
+    def test_givenAFailingDownload_whenIterating_thenErrorIsRaisedAtItsPosition(self):
+        identifiers = self.identifiers[:3] + ['unknown'] + self.identifiers[3:]
+        iterator = iter(InstancePrefetcher(self.orthanc, identifiers))
+
+        result = [next(iterator) for _ in range(3)]
+
+        self.assertEqual([i for i, _ in result], self.identifiers[:3])
+        self.assertRaises(requests.HTTPError, next, iterator)
+
+    def test_givenAnEventLoop_whenIteratingAsynchronously_thenFilesAreYieldedInOrder(self):
+        async def collect():
+            return [item async for item in InstancePrefetcher(self.orthanc, self.identifiers)]
+
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(collect())
+        finally:
+            loop.close()
+
+        self.assertEqual(result, [(i, self.expected[i]) for i in self.identifiers])
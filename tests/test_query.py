@@ -0,0 +1,77 @@
+# coding: utf-8
+# author: gabriel couture
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.query import Query
+from tests.fake_orthanc_server import FakeOrthancServer, FakeOrthancStore
+
+NUMBER_OF_STUDIES = 3
+NUMBER_OF_SERIES_PER_STUDY = 2
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        remote_store = FakeOrthancStore('PACS')
+        for i in range(NUMBER_OF_STUDIES):
+            for j in range(NUMBER_OF_SERIES_PER_STUDY):
+                remote_store.add_instance({
+                    'PatientID': 'P1',
+                    'StudyInstanceUID': f'1.2.{i}',
+                    'StudyDescription': f'Study {i}' if i > 0 else '',
+                    'SeriesInstanceUID': f'1.2.{i}.{j}',
+                    'Modality': 'CT',
+                    'SOPInstanceUID': f'1.2.{i}.{j}.1'
+                })
+        self.server.store.add_modality('pacs', remote_store=remote_store)
+        self.query = Query(
+            self.orthanc.query_on_modality('pacs', {'Level': 'Study', 'Query': {'PatientID': 'P1', 'StudyDescription': ''}})['ID'],
+            self.orthanc
+        )
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.orthanc = None
+
+    def test_givenAQuery_whenGettingAnswers_thenContentsAreReadInOneRequest(self):
+        result = self.query.get_answers()
+
+        self.assertEqual([a['StudyInstanceUID'] for a in result], [f'1.2.{i}' for i in range(NUMBER_OF_STUDIES)])
+        self.assertEqual(self.server.count_requests('GET /queries/.*/answers'), 1)
+
+    def test_givenAQuery_whenGettingAnswersTable_thenResultIsColumnsOfValues(self):
+        result = self.query.get_answers_table()
+
+        self.assertEqual(result['StudyInstanceUID'], [f'1.2.{i}' for i in range(NUMBER_OF_STUDIES)])
+        self.assertEqual(result['StudyDescription'], ['', 'Study 1', 'Study 2'])
+        self.assertEqual(result['PatientID'], ['P1'] * NUMBER_OF_STUDIES)
+
+    def test_givenAQuery_whenFindingChildSeries_thenResultIsOneQueryPerAnswer(self):
+        result = self.query.find_child_series({'Query': {'Modality': ''}})
+
+        self.assertEqual(len(result), NUMBER_OF_STUDIES)
+        for i, child_query in enumerate(result):
+            self.assertIsInstance(child_query, Query)
+            self.assertEqual(child_query.get_level(), 'Series')
+            self.assertEqual(
+                sorted(a['SeriesInstanceUID'] for a in child_query.get_answers()),
+                [f'1.2.{i}.{j}' for j in range(NUMBER_OF_SERIES_PER_STUDY)]
+            )
+
+    def test_givenAQuery_whenFindingChildInstances_thenAllInstancesAreFound(self):
+        result = self.query.find_child_instances()
+
+        self.assertEqual(sum(len(q.get_answers()) for q in result), NUMBER_OF_STUDIES * NUMBER_OF_SERIES_PER_STUDY)
+
+    def test_givenAQuery_whenRetrieving_thenStudiesAreMovedToOrthanc(self):
+        self.query.retrieve({'TargetAet': 'ORTHANC'})
+
+        self.assertEqual(len(self.orthanc.get_studies()), NUMBER_OF_STUDIES)
+
+    def test_givenAQuery_whenDeleting_thenQueryIsRemoved(self):
+        self.query.delete()
+
+        self.assertEqual(self.orthanc.get_queries(), [])
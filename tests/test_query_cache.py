@@ -0,0 +1,87 @@
+# coding: utf-8
+# author: gabriel couture
+import time
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.query_cache import QueryCache, make_query_key
+from tests.fake_orthanc_server import FakeOrthancServer, FakeOrthancStore
+
+A_STUDY_QUERY = {'Level': 'Study', 'Query': {'PatientID': 'P1', 'StudyDate': ''}}
+NUMBER_OF_STUDIES = 5
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        remote_store = FakeOrthancStore('PACS')
+        for i in range(NUMBER_OF_STUDIES):
+            remote_store.add_instance({
+                'PatientID': 'P1',
+                'StudyInstanceUID': f'1.2.{i}',
+                'StudyDate': '20200101',
+                'SeriesInstanceUID': f'1.2.{i}.1',
+                'SOPInstanceUID': f'1.2.{i}.1.1'
+            })
+        self.server.store.add_modality('pacs', remote_store=remote_store)
+        self.cache = QueryCache(self.orthanc, ttl=0.5)
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.orthanc = None
+
+    def test_givenAQuery_whenQuerying_thenAnswersAreFetchedInOneRequestAndQueryIsDeleted(self):
+        result = self.cache.query('pacs', A_STUDY_QUERY)
+
+        self.assertEqual(sorted(a['StudyInstanceUID'] for a in result), [f'1.2.{i}' for i in range(NUMBER_OF_STUDIES)])
+        self.assertEqual(result[0]['StudyDate'], '20200101')
+        self.assertEqual(self.server.count_requests('GET /queries/.*/answers'), 1)
+        self.assertEqual(self.orthanc.get_queries(), [])
+
+    def test_givenAnEquivalentQuery_whenQueryingAgain_thenAnswersComeFromTheCache(self):
+        self.cache.query('pacs', A_STUDY_QUERY)
+
+        result = self.cache.query('pacs', {'Level': 'STUDY', 'Query': {'StudyDate': '*', 'PatientID': 'P1 '}})
+
+        self.assertEqual(len(result), NUMBER_OF_STUDIES)
+        self.assertEqual(self.server.count_requests('POST /modalities/pacs/query'), 1)
+        self.assertEqual(self.cache.get_statistics(), {'Size': 1, 'Hits': 1, 'Misses': 1})
+
+    def test_givenAnExpiredQuery_whenQueryingAgain_thenModalityIsQueried(self):
+        self.cache.query('pacs', A_STUDY_QUERY)
+        time.sleep(0.6)
+
+        self.cache.query('pacs', A_STUDY_QUERY)
+
+        self.assertEqual(self.server.count_requests('POST /modalities/pacs/query'), 2)
+
+    def test_givenCachedAnswers_whenModifyingResult_thenCacheIsNotModified(self):
+        self.cache.query('pacs', A_STUDY_QUERY)[0]['PatientID'] = 'modified'
+
+        self.assertEqual(self.cache.query('pacs', A_STUDY_QUERY)[0]['PatientID'], 'P1')
+
+    def test_givenCachedAnswers_whenInvalidating_thenModalityIsQueried(self):
+        self.cache.query('pacs', A_STUDY_QUERY)
+
+        self.cache.invalidate('pacs')
+        self.cache.query('pacs', A_STUDY_QUERY)
+
+        self.assertEqual(self.server.count_requests('POST /modalities/pacs/query'), 2)
+
+    def test_givenMaxSize_whenQueryingMoreQueries_thenLeastRecentlyUsedQueriesAreEvicted(self):
+        self.cache.max_size = 2
+        queries = [{'Level': 'Study', 'Query': {'PatientID': f'P{i}'}} for i in range(3)]
+
+        for query in queries:
+            self.cache.query('pacs', query)
+
+        self.assertEqual(self.cache.get_statistics()['Size'], 2)
+        self.cache.query('pacs', queries[0])
+        self.assertEqual(self.server.count_requests('POST /modalities/pacs/query'), 4)
+
+    def test_givenQueriesWithDifferentParameters_whenMakingKeys_thenKeysAreDifferent(self):
+        self.assertNotEqual(make_query_key('pacs', A_STUDY_QUERY), make_query_key('other', A_STUDY_QUERY))
+        self.assertNotEqual(make_query_key('pacs', A_STUDY_QUERY), make_query_key('pacs', {**A_STUDY_QUERY, 'Level': 'Series'}))
+        self.assertNotEqual(make_query_key('pacs', A_STUDY_QUERY), make_query_key('pacs', {**A_STUDY_QUERY, 'Normalize': False}))
@@ -0,0 +1,91 @@
+# coding: utf-8
+# author: gabriel couture
+import concurrent.futures
+import time
+import unittest
+
+from requests import HTTPError
+
+from pyorthanc import Orthanc
+from pyorthanc.remote import MultipleModalitiesQueryResult, query_remote_modalities
+from tests.fake_orthanc_server import FakeOrthancServer, FakeOrthancStore
+
+A_STUDY_QUERY = {'Level': 'Study', 'Query': {'PatientID': 'P1', 'StudyDescription': '', 'StudyDate': ''}}
+
+
+def _make_pacs(studies):
+    store = FakeOrthancStore('PACS')
+    for study_instance_uid, tags in studies.items():
+        store.add_instance({
+            'PatientID': 'P1',
+            'StudyInstanceUID': study_instance_uid,
+            'SeriesInstanceUID': f'{study_instance_uid}.1',
+            'SOPInstanceUID': f'{study_instance_uid}.1.1',
+            **tags
+        })
+
+    return store
+
+
+class TestQueryRemoteModalities(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        self.server.store.add_modality('pacs1', remote_store=_make_pacs({'1.1': {'StudyDescription': 'Chest'}}), latency=0.2)
+        self.server.store.add_modality('pacs2', remote_store=_make_pacs({
+            '1.1': {'StudyDate': '20200101'},
+            '1.2': {'StudyDescription': 'Head'}
+        }), latency=0.2)
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.orthanc = None
+
+    def test_givenModalities_whenQuerying_thenAnswersAreMergedByStudyInstanceUID(self):
+        result = query_remote_modalities(self.orthanc, ['pacs1', 'pacs2'], A_STUDY_QUERY)
+
+        self.assertIsInstance(result, MultipleModalitiesQueryResult)
+        self.assertTrue(result.is_complete())
+        self.assertEqual(sorted(result.answers), ['1.1', '1.2'])
+        self.assertEqual(result.answers['1.1']['StudyDescription'], 'Chest')
+        self.assertEqual(result.answers['1.1']['StudyDate'], '20200101')
+        self.assertEqual(result.locations['1.1'], ['pacs1', 'pacs2'])
+        self.assertEqual(result.locations['1.2'], ['pacs2'])
+        self.assertEqual(self.server.store.queries, {})
+
+    def test_givenModalities_whenQuerying_thenModalitiesAreQueriedConcurrently(self):
+        start = time.monotonic()
+
+        query_remote_modalities(self.orthanc, ['pacs1', 'pacs2'], A_STUDY_QUERY)
+
+        self.assertLess(time.monotonic() - start, 0.35)
+
+    def test_givenASlowModality_whenQueryingWithATimeout_thenPartialResultsAreReturned(self):
+        self.server.store.add_modality('slow', remote_store=_make_pacs({'1.3': {}}), latency=2)
+
+        result = query_remote_modalities(self.orthanc, ['pacs1', 'slow'], A_STUDY_QUERY, timeout={'slow': 0.5})
+
+        self.assertFalse(result.is_complete())
+        self.assertIsInstance(result.errors['slow'], concurrent.futures.TimeoutError)
+        self.assertEqual(list(result.answers), ['1.1'])
+
+    def test_givenAnswersWithoutTheIdentifyingTag_whenQuerying_thenAnswersAreNotMerged(self):
+        for name, patient_name in [('pacs3', 'Doe^John'), ('pacs4', 'Doe^Jane')]:
+            store = FakeOrthancStore('PACS')
+            store.add_instance({'PatientID': '', 'PatientName': patient_name, 'StudyInstanceUID': '2.1', 'SeriesInstanceUID': '2.1.1', 'SOPInstanceUID': '2.1.1.1'})
+            self.server.store.add_modality(name, remote_store=store)
+
+        result = query_remote_modalities(self.orthanc, ['pacs3', 'pacs4'], {'Level': 'Patient', 'Query': {'PatientName': ''}})
+
+        self.assertEqual(
+            {k: a['PatientName'] for k, a in result.answers.items()},
+            {'pacs3/0': 'Doe^John', 'pacs4/0': 'Doe^Jane'}
+        )
+        self.assertEqual(result.locations['pacs4/0'], ['pacs4'])
+
+    def test_givenAnUnknownModality_whenQuerying_thenErrorIsReportedForThisModality(self):
+        result = query_remote_modalities(self.orthanc, ['pacs1', 'unknown'], A_STUDY_QUERY)
+
+        self.assertIsInstance(result.errors['unknown'], HTTPError)
+        self.assertEqual(list(result.answers), ['1.1'])
@@ -0,0 +1,155 @@
+# coding: utf-8
+# author: gabriel couture
+import threading
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.replication import Replicator
+from tests.fake_orthanc_server import FakeOrthancServer
+
+NUMBER_OF_INSTANCES = 12
+
+
+def _make_instance(i):
+    return {
+        'PatientID': f'P{i % 3}',
+        'StudyInstanceUID': f'1.2.{i % 3}',
+        'SeriesInstanceUID': f'1.2.{i % 3}.1',
+        'SOPInstanceUID': f'1.2.{i % 3}.1.{i}'
+    }
+
+
+class TestReplication(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.source_server = FakeOrthancServer().start()
+        self.target_server = FakeOrthancServer().start()
+        self.source_server.store.add_peer('replica', remote_store=self.target_server.store, url=self.target_server.url)
+        self.source = Orthanc(self.source_server.url)
+        self.target = Orthanc(self.target_server.url)
+
+        for i in range(NUMBER_OF_INSTANCES):
+            self.source_server.store.add_instance(_make_instance(i))
+        for i in range(0, NUMBER_OF_INSTANCES, 2):
+            self.target_server.store.add_instance(_make_instance(i))
+
+    def tearDown(self) -> None:
+        self.source_server.stop()
+        self.target_server.stop()
+
+    def test_givenTwoServers_whenGettingMissingInstances_thenResultIsOnlyInstancesMissingFromTarget(self):
+        replicator = Replicator(self.source, self.target)
+
+        result = replicator.get_missing_instances()
+
+        self.assertEqual(len(result), NUMBER_OF_INSTANCES // 2)
+        self.assertEqual(set(result) & set(self.target.get_instances()), set())
+
+    def test_givenAPeer_whenReplicating_thenMissingInstancesAreStoredInChunks(self):
+        replicator = Replicator(self.source, self.target, peer='replica', nbr_instances_per_request=4)
+
+        result = replicator.replicate()
+
+        self.assertTrue(result.is_successful())
+        self.assertEqual(len(result.results), NUMBER_OF_INSTANCES // 2)
+        self.assertEqual(sorted(self.target.get_instances()), sorted(self.source.get_instances()))
+        self.assertEqual(self.source_server.count_requests('POST /peers/replica/store'), 2)
+
+    def test_givenNoPeer_whenReplicating_thenMissingInstancesAreDownloadedAndUploaded(self):
+        replicator = Replicator(self.source, self.target)
+
+        result = replicator.replicate()
+
+        self.assertTrue(result.is_successful())
+        self.assertEqual(sorted(self.target.get_instances()), sorted(self.source.get_instances()))
+        self.assertEqual(self.target_server.count_requests('POST /instances'), NUMBER_OF_INSTANCES // 2)
+
+    def test_givenACorruptedInstance_whenComparingMd5_thenResultIsTheCorruptedInstance(self):
+        replicator = Replicator(self.source, self.target)
+        corrupted_identifier = self.target.get_instances()[0]
+        self.target_server.store.resources['Instance'][corrupted_identifier]['Md5'] = 'another md5'
+
+        result = replicator.get_instances_with_different_md5()
+
+        self.assertEqual(result, [corrupted_identifier])
+
+    def test_givenACorruptedInstance_whenReplicatingWithMd5_thenTheInstanceIsReplaced(self):
+        replicator = Replicator(self.source, self.target, peer='replica')
+        corrupted_identifier = self.target.get_instances()[0]
+        self.target_server.store.resources['Instance'][corrupted_identifier]['Md5'] = 'another md5'
+
+        result = replicator.replicate(compare_md5=True)
+
+        self.assertTrue(result.is_successful())
+        self.assertEqual(len(result.results), NUMBER_OF_INSTANCES // 2 + 1)
+        self.assertIn(corrupted_identifier, result.results)
+        self.assertEqual(replicator.get_instances_with_different_md5(), [])
+        self.assertEqual(sorted(self.target.get_instances()), sorted(self.source.get_instances()))
+
+    def test_givenNewInstances_whenFollowingChanges_thenNewInstancesAreReplicated(self):
+        stop_event = threading.Event()
+        replicator = Replicator(self.source, self.target, peer='replica')
+        last_change = self.source.get_changes({'last': ''})['Last']
+        changes = replicator.follow_changes(since=last_change, poll_interval=0.01, stop_event=stop_event)
+        self.source_server.store.add_instance(_make_instance(NUMBER_OF_INSTANCES))
+
+        result = next(changes)
+        stop_event.set()
+
+        self.assertEqual(list(result.results), [self.source.get_instances()[-1]])
+        self.assertIn(self.source.get_instances()[-1], self.target.get_instances())
+        self.assertEqual(list(changes), [])
+        self.assertEqual(replicator.last_change, len(self.source_server.store.changes))
+
+    def test_givenAFailedTransfer_whenFollowingChanges_thenFailedInstancesAreSentAgain(self):
+        stop_event = threading.Event()
+        replicator = Replicator(self.source, self.target, peer='replica')
+        last_change = self.source.get_changes({'last': ''})['Last']
+        changes = replicator.follow_changes(since=last_change, poll_interval=0.01, stop_event=stop_event, retry_delay=0.01)
+        self.source_server.store.add_instance(_make_instance(NUMBER_OF_INSTANCES))
+        self.source_server.inject_errors('POST /peers/replica/store', count=1, status_code=500)
+
+        first_result = next(changes)
+        second_result = next(changes)
+        stop_event.set()
+
+        new_instance = self.source.get_instances()[-1]
+        self.assertEqual(list(first_result.errors), [new_instance])
+        self.assertEqual(list(second_result.results), [new_instance])
+        self.assertIn(new_instance, self.target.get_instances())
+        self.assertEqual(replicator.failed_instances, {})
+
+    def test_givenAlwaysFailingTransfers_whenFollowingChanges_thenInstancesAreGivenUpAfterMaxRetries(self):
+        stop_event = threading.Event()
+        replicator = Replicator(self.source, self.target, peer='replica')
+        last_change = self.source.get_changes({'last': ''})['Last']
+        changes = replicator.follow_changes(since=last_change, poll_interval=0.01, stop_event=stop_event, max_nbr_retries=2, retry_delay=0.01)
+        self.source_server.store.add_instance(_make_instance(NUMBER_OF_INSTANCES))
+        self.source_server.inject_errors('POST /peers/replica/store', count=3, status_code=500)
+
+        results = [next(changes) for _ in range(3)]
+        new_instance = self.source.get_instances()[-1]
+        self.assertEqual(replicator.failed_instances, {})
+        self.source_server.store.add_instance(_make_instance(NUMBER_OF_INSTANCES + 1))
+        last_result = next(changes)
+        stop_event.set()
+
+        self.assertTrue(all(list(r.errors) == [new_instance] for r in results))
+        self.assertNotIn(new_instance, last_result.errors)
+        self.assertNotIn(new_instance, last_result.results)
+
+    def test_givenADeletedInstance_whenFollowingChanges_thenOnlyTheDeletedInstanceFailsAndIsNotRetried(self):
+        stop_event = threading.Event()
+        replicator = Replicator(self.source, self.target, peer='replica')
+        last_change = self.source.get_changes({'last': ''})['Last']
+        changes = replicator.follow_changes(since=last_change, poll_interval=0.01, stop_event=stop_event, retry_delay=0)
+        deleted_instance = self.source_server.store.add_instance(_make_instance(NUMBER_OF_INSTANCES))['ID']
+        kept_instance = self.source_server.store.add_instance(_make_instance(NUMBER_OF_INSTANCES + 1))['ID']
+        self.source_server.store.delete('Instance', deleted_instance)
+
+        result = next(changes)
+        stop_event.set()
+
+        self.assertEqual(list(result.errors), [deleted_instance])
+        self.assertEqual(list(result.results), [kept_instance])
+        self.assertEqual(replicator.failed_instances, {})
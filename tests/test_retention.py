@@ -0,0 +1,119 @@
+# coding: utf-8
+# author: gabriel couture
+import datetime
+import time
+import unittest
+
+from pyorthanc import Orthanc, RetentionEngine, RetentionRule, build_patient_forest
+from pyorthanc.retention import get_protected_patients
+from tests.fake_orthanc_server import FakeOrthancServer, orthanc_identifier
+
+NOW = datetime.datetime(2024, 1, 1)
+STUDIES = [
+    # (PatientID, StudyDate, modalities of the series)
+    ('P0', '20100101', ['CT', 'SR']),
+    ('P1', '20100101', ['MR']),
+    ('P2', '20230601', ['CT', 'SR']),
+    ('P3', '20100101', ['CT']),  # Protected patient
+]
+NUMBER_OF_INSTANCES_PER_SERIES = 2
+
+
+def _study_identifier(index):
+    return orthanc_identifier(STUDIES[index][0], f'1.{index}')
+
+
+def _series_identifier(index, series_index):
+    return orthanc_identifier(STUDIES[index][0], f'1.{index}', f'1.{index}.{series_index}')
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer().start()
+        self.orthanc = Orthanc(self.server.url)
+        for index, (patient_id, study_date, modalities) in enumerate(STUDIES):
+            for series_index, modality in enumerate(modalities):
+                for i in range(NUMBER_OF_INSTANCES_PER_SERIES):
+                    self.server.store.add_instance({
+                        'PatientID': patient_id,
+                        'StudyInstanceUID': f'1.{index}',
+                        'StudyDate': study_date,
+                        'SeriesInstanceUID': f'1.{index}.{series_index}',
+                        'Modality': modality,
+                        'SOPInstanceUID': f'1.{index}.{series_index}.{i}'
+                    })
+        self.orthanc.set_patient_to_protected(orthanc_identifier('P3'))
+
+    def tearDown(self) -> None:
+        self.server.stop()
+
+    def test_givenRules_whenPlanning_thenMatchingResourcesOfUnprotectedPatientsAreSelected(self):
+        engine = RetentionEngine(self.orthanc, [
+            RetentionRule('Old CT', min_age_in_days=5 * 365, modalities=['CT']),
+            RetentionRule('SR', level='Series', modalities=['SR']),
+        ])
+
+        plan = engine.plan(now=NOW)
+
+        self.assertEqual(
+            {(item['Type'], item['ID'], item['Rule']) for item in plan.items},
+            {('Study', _study_identifier(0), 'Old CT'), ('Series', _series_identifier(2, 1), 'SR')}
+        )
+        self.assertEqual(plan.get_nbr_instances(), 3 * NUMBER_OF_INSTANCES_PER_SERIES)
+        self.assertEqual(plan.get_nbr_resources_by_rule(), {'Old CT': 1, 'SR': 1})
+        self.assertEqual(self.server.count_requests('GET /patients/[^/]+/protected'), 3)
+
+    def test_givenARuleIncludingProtectedPatients_whenPlanning_thenProtectedPatientsAreSelected(self):
+        engine = RetentionEngine(self.orthanc, [RetentionRule('Old', min_age_in_days=5 * 365, include_protected=True)])
+
+        plan = engine.plan(now=NOW)
+
+        self.assertEqual({item['ID'] for item in plan.items}, {_study_identifier(0), _study_identifier(1), _study_identifier(3)})
+        self.assertEqual(self.server.count_requests('/protected'), 1)  # Only the PUT of the setUp
+
+    def test_givenAForest_whenPlanning_thenOnlyItsResourcesAreSelected(self):
+        forest = [p for p in build_patient_forest(self.orthanc) if p.get_id() in ('P1', 'P2')]
+        engine = RetentionEngine(self.orthanc, [RetentionRule('All')])
+
+        plan = engine.plan(forest, now=NOW)
+
+        self.assertEqual({item['ID'] for item in plan.items}, {_study_identifier(1), _study_identifier(2)})
+
+    def test_givenAPlan_whenExecutingInDryRun_thenNothingIsDeleted(self):
+        engine = RetentionEngine(self.orthanc, [RetentionRule('Old', min_age_in_days=5 * 365)])
+        plan = engine.plan(now=NOW)
+
+        result = engine.execute(plan)
+
+        self.assertEqual(sorted(result.results), sorted([_study_identifier(0), _study_identifier(1)]))
+        self.assertEqual(self.server.count_requests('DELETE'), 0)
+        self.assertEqual(len(self.orthanc.get_studies()), len(STUDIES))
+
+    def test_givenAPlan_whenExecuting_thenResourcesAreDeletedExceptNewlyProtectedPatients(self):
+        engine = RetentionEngine(self.orthanc, [RetentionRule('Old', min_age_in_days=5 * 365), RetentionRule('SR', level='Series', modalities=['SR'])])
+        plan = engine.plan(now=NOW)
+        self.orthanc.set_patient_to_protected(orthanc_identifier('P1'))
+
+        result = engine.execute(plan, dry_run=False)
+
+        self.assertTrue(result.is_successful())
+        self.assertEqual(sorted(result.results), sorted([_study_identifier(0), _series_identifier(2, 1)]))
+        self.assertEqual(sorted(self.orthanc.get_studies()), sorted([_study_identifier(1), _study_identifier(2), _study_identifier(3)]))
+        self.assertEqual(self.orthanc.get_study_information(_study_identifier(2))['Series'], [_series_identifier(2, 0)])
+
+    def test_givenAThroughputLimit_whenExecuting_thenDeletesAreSpaced(self):
+        engine = RetentionEngine(self.orthanc, [RetentionRule('All', include_protected=True)], max_nbr_instances_per_second=100)
+        plan = engine.plan(now=NOW)
+        start = time.monotonic()
+
+        engine.execute(plan, dry_run=False)
+
+        previous_instances = plan.get_nbr_instances() - plan.items[-1]['CountInstances']
+        self.assertGreaterEqual(time.monotonic() - start, previous_instances / 100)
+        self.assertEqual(self.orthanc.get_studies(), [])
+
+    def test_givenPatients_whenGettingProtectedPatients_thenOnlyProtectedPatientsAreReturned(self):
+        result = get_protected_patients(self.orthanc, self.orthanc.get_patients())
+
+        self.assertEqual(result, {orthanc_identifier('P3')})
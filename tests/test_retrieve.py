@@ -0,0 +1,73 @@
+# coding: utf-8
+# author: gabriel couture
+import time
+import unittest
+
+from pyorthanc import Orthanc
+from pyorthanc.job import JobFailedError
+from pyorthanc.retrieve import RetrieveEvent, retrieve_answers
+from tests.fake_orthanc_server import FakeOrthancServer, FakeOrthancStore
+
+NUMBER_OF_STUDIES = 4
+JOB_DURATION = 0.2
+
+
+class TestRetrieve(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = FakeOrthancServer(job_duration=JOB_DURATION).start()
+        self.orthanc = Orthanc(self.server.url)
+        remote_store = FakeOrthancStore('PACS')
+        for i in range(NUMBER_OF_STUDIES):
+            remote_store.add_instance({
+                'PatientID': 'P1',
+                'StudyInstanceUID': f'1.2.{i}',
+                'SeriesInstanceUID': f'1.2.{i}.1',
+                'SOPInstanceUID': f'1.2.{i}.1.1'
+            })
+        self.server.store.add_modality('pacs', remote_store=remote_store)
+        self.answers = [
+            ('pacs', {'QueryRetrieveLevel': 'STUDY', 'PatientID': 'P1', 'StudyInstanceUID': f'1.2.{i}'})
+            for i in range(NUMBER_OF_STUDIES)
+        ]
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.orthanc = None
+
+    def test_givenAnswers_whenRetrieving_thenEventsAreStreamedAndStudiesAreRetrieved(self):
+        events = list(retrieve_answers(self.orthanc, self.answers, max_nbr_running_moves_per_modality=NUMBER_OF_STUDIES))
+
+        self.assertEqual(len(events), NUMBER_OF_STUDIES)
+        for event in events:
+            self.assertIsInstance(event, RetrieveEvent)
+            self.assertTrue(event.is_successful())
+            self.assertEqual(event.nbr_attempts, 1)
+        self.assertEqual(len(self.orthanc.get_studies()), NUMBER_OF_STUDIES)
+        self.assertEqual(self.server.count_requests('POST /modalities/pacs/move'), NUMBER_OF_STUDIES)
+
+    def test_givenAConcurrencyCap_whenRetrieving_thenAtMostCapMovesRunAtTheSameTime(self):
+        start = time.monotonic()
+
+        list(retrieve_answers(self.orthanc, self.answers, max_nbr_running_moves_per_modality=2))
+
+        self.assertGreaterEqual(time.monotonic() - start, 2 * JOB_DURATION)
+
+    def test_givenAFailingMoveRequest_whenRetrieving_thenMoveIsRetried(self):
+        self.server.inject_errors('POST /modalities/pacs/move', count=1)
+
+        events = list(retrieve_answers(self.orthanc, self.answers[:1], retry_delay=0.01))
+
+        self.assertTrue(events[0].is_successful())
+        self.assertEqual(events[0].nbr_attempts, 2)
+
+    def test_givenFailingJobs_whenRetrieving_thenEventHasTheErrorOfTheLastAttempt(self):
+        self.server.job_error_rate = 1.0
+
+        events = list(retrieve_answers(self.orthanc, self.answers[:2], max_nbr_retries=1, retry_delay=0.01))
+
+        self.assertEqual(len(events), 2)
+        for event in events:
+            self.assertIsInstance(event.error, JobFailedError)
+            self.assertEqual(event.nbr_attempts, 2)
+        self.assertEqual(self.server.count_requests('POST /modalities/pacs/move'), 4)